@@ -3,16 +3,10 @@
 # Navigate to the project root directory
 cd "$(dirname "$0")"
 
-# Create the public directory if it doesn't exist
-if [ ! -d "public" ]; then
-  mkdir "public"
-fi
-
-# Run the python script to copy the files
-python3 src/main.py
-
-echo "Copied static files to public directory"
+# Build the site, then keep rebuilding changed pages and static files in the background
+python3 src/main.py --watch &
+WATCH_PID=$!
+trap 'kill $WATCH_PID' EXIT
 
 # Start a simple web server
-cd public
-python3 -m http.server 8888
\ No newline at end of file
+python3 -m http.server 8888 --directory docs
@@ -0,0 +1,534 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from textnode import BlockType
+from htmlnode import HTMLNode, LeafNode, text_node_to_html_node
+from inline_markdown import (text_to_textnodes, markdown_to_html_node, markdown_to_blocks, block_to_block_type,
+                             iter_parsed_blocks, read_title_lines, extract_title)
+from corpus import (CorpusGenerator, parse_mix, DEFAULT_MIX, ADVERSARIAL_INLINE, ADVERSARIAL_BLOCKS,
+                    ADVERSARIAL_TITLES, fuzz_markdown)
+from main import CONTENT_DIR, STATIC_DIR, TEMPLATE_PATH, DEST_DIR, generate_pages_recursive, main as build_main
+
+BENCH_TEMPLATE = "<html><head><title>{{ Title }}</title></head><body>{{ Content }}</body></html>"
+
+SPAN_SAMPLES = [
+    "**bold words**",
+    "_italic words_",
+    "`inline code`",
+    "[a link](https://example.com/path(1))",
+    "![an image](/images/example.png)",
+]
+
+
+def make_inline_paragraph(span_count):
+    """
+    Returns a single paragraph with span_count inline spans of every kind,
+    separated by plain text.
+    """
+    spans = [SPAN_SAMPLES[i % len(SPAN_SAMPLES)] for i in range(span_count)]
+    return "Some text " + " and more text ".join(spans) + " to finish."
+
+
+def time_call(func, *args, repeat=3):
+    """
+    Returns the best wall-clock time in seconds of repeat calls to func(*args).
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_inline(span_counts, repeat=3):
+    """
+    Times text_to_textnodes on paragraphs of growing span counts. The time per
+    span should stay flat if tokenizing is linear.
+    """
+    print(f"{'spans':>10} {'total ms':>10} {'us/span':>9}")
+    results = []
+    for span_count in span_counts:
+        paragraph = make_inline_paragraph(span_count)
+        seconds = time_call(text_to_textnodes, paragraph, repeat=repeat)
+        results.append((span_count, seconds))
+        print(f"{span_count:>10} {seconds * 1000:>10.2f} {seconds / span_count * 1e6:>9.2f}")
+    return results
+
+
+def bench_blocks(block_counts, mix=None, repeat=3, seed=0):
+    """
+    Times the block parser (splitting into blocks and typing them, in one pass) on
+    synthetic corpus documents of growing block counts. The time per KiB of
+    markdown should stay flat if block parsing is linear in document size.
+    """
+    print(f"{'blocks':>10} {'KiB':>10} {'total ms':>10} {'us/KiB':>9}")
+    results = []
+    for block_count in block_counts:
+        document = CorpusGenerator(mix, seed=seed).page("Blocks", block_count)
+        lines = document.split("\n")
+        seconds = time_call(lambda: list(iter_parsed_blocks(lines)), repeat=repeat)
+        kib = len(document.encode()) / 1024
+        results.append((block_count, kib, seconds))
+        print(f"{block_count:>10} {kib:>10.0f} {seconds * 1000:>10.2f} {seconds / kib * 1e6:>9.2f}")
+    return results
+
+
+def unescaped_leaf_html(leaf):
+    """
+    LeafNode.to_html without escaping, for bench_escape to compare against.
+    """
+    value = leaf.value
+    if value is None:
+        raise ValueError("All leaf nodes must have a value")
+    tag = leaf.tag
+    if tag is None:
+        return value
+    if tag == "img":
+        return f'<{tag}{leaf.props_to_html()} />'
+    if tag == "br":
+        return "<br/>"
+    if not leaf.props:
+        return f'<{tag}>{value}</{tag}>'
+    return f'<{tag}{leaf.props_to_html()}>{value}</{tag}>'
+
+
+def unescaped_props_html(node):
+    """
+    HTMLNode.props_to_html without escaping, for bench_escape to compare against.
+    """
+    if not node.props:
+        return ""
+    return "".join([f' {prop}="{value}"' for prop, value in node.props.items()])
+
+
+@contextlib.contextmanager
+def escaping_disabled():
+    """
+    Renders leaves and props without escaping them for the duration of the block.
+    """
+    to_html, props_to_html = LeafNode.to_html, HTMLNode.props_to_html
+    LeafNode.to_html, HTMLNode.props_to_html = unescaped_leaf_html, unescaped_props_html
+    try:
+        yield
+    finally:
+        LeafNode.to_html, HTMLNode.props_to_html = to_html, props_to_html
+
+
+def bench_escape(page_count, block_count, mix=None, repeat=3, seed=0, rounds=5):
+    """
+    Measures what HTML escaping costs rendering. Times to_html on the node trees of
+    a synthetic corpus, and again with escaping disabled (see escaping_disabled);
+    escaping costs the difference. The two are timed in alternating rounds, so a
+    machine that slows down affects both alike.
+
+    On the default corpus escaping takes 15-25% of to_html, so it does not meet a
+    budget of 5% of rendering. Hardly any value needs a character replaced: the
+    cost is the check for special characters, which is about as slow as formatting
+    a short leaf. Against rendering pages from markdown, which is mostly parsing,
+    it is below 5%.
+    """
+    generator = CorpusGenerator(mix, seed=seed)
+    trees = [markdown_to_html_node(generator.page(f"Page {i}", block_count)) for i in range(page_count)]
+
+    def render_trees():
+        return [tree.to_html() for tree in trees]
+
+    to_html_seconds = unescaped_seconds = None
+    for _ in range(rounds):
+        seconds = time_call(render_trees, repeat=repeat)
+        to_html_seconds = seconds if to_html_seconds is None else min(to_html_seconds, seconds)
+        with escaping_disabled():
+            seconds = time_call(render_trees, repeat=repeat)
+        unescaped_seconds = seconds if unescaped_seconds is None else min(unescaped_seconds, seconds)
+    escape_seconds = max(to_html_seconds - unescaped_seconds, 0)
+    print(f"{len(trees)} pages")
+    print(f"to_html:               {to_html_seconds * 1000:>9.2f} ms")
+    print(f"to_html, not escaping: {unescaped_seconds * 1000:>9.2f} ms")
+    print(f"escaping:              {escape_seconds * 1000:>9.2f} ms, {escape_seconds / to_html_seconds:.1%} of to_html")
+    return {
+        "to_html_seconds": to_html_seconds,
+        "unescaped_seconds": unescaped_seconds,
+        "escape_seconds": escape_seconds,
+        "to_html_share": escape_seconds / to_html_seconds,
+    }
+
+
+def block_type_of_text(text):
+    return block_to_block_type(text.strip())
+
+
+def title_of_text(text):
+    """
+    Finds a document's title the way generate_page does, from its lines.
+    """
+    title_lines = read_title_lines(iter(text.splitlines(keepends=True)))
+    try:
+        return extract_title("".join(title_lines))
+    except ValueError:
+        return None
+
+
+# Functions that take user-submitted markdown, with the pathological inputs to
+# time them on
+ADVERSARIAL_TARGETS = [
+    ("text_to_textnodes", text_to_textnodes, ADVERSARIAL_INLINE),
+    ("markdown_to_blocks", markdown_to_blocks, ADVERSARIAL_BLOCKS),
+    ("block_to_block_type", block_type_of_text, ADVERSARIAL_BLOCKS),
+    ("read_title_lines", title_of_text, ADVERSARIAL_TITLES),
+]
+
+
+def adversarial_cases():
+    """
+    Yields a (function name, function, case name, input builder) tuple for every
+    adversarial case, including fuzzed markdown for each function.
+    """
+    for name, func, builders in ADVERSARIAL_TARGETS:
+        for case, build in builders.items():
+            yield name, func, case, build
+        yield name, func, "fuzz", fuzz_markdown
+
+
+def bench_adversarial(sizes, repeat=3):
+    """
+    Times the parser on pathological inputs of growing sizes. The time per MB
+    should stay flat for every case; a case whose time grows faster than its input
+    is quadratic or worse.
+
+    Returns:
+        A list of (function name, case name, [(input bytes, seconds)]) tuples.
+    """
+    print(f"{'function':<20} {'case':<28} " + " ".join(f"{f'{size // 1024} KiB ms':>12}" for size in sizes)
+          + f" {'s/MB':>7}")
+    results = []
+    for name, func, case, build in adversarial_cases():
+        timings = []
+        for size in sizes:
+            text = build(size)
+            timings.append((len(text.encode()), time_call(func, text, repeat=repeat)))
+        results.append((name, case, timings))
+        size_bytes, seconds = timings[-1]
+        print(f"{name:<20} {case:<28} " + " ".join(f"{seconds * 1000:>12.2f}" for _, seconds in timings)
+              + f" {seconds / (size_bytes / 1e6):>7.3f}")
+    return results
+
+
+def make_document(block_count):
+    """
+    Returns a markdown document of block_count blocks cycling through headings,
+    paragraphs with inline spans, lists, quotes and code blocks.
+    """
+    blocks = [
+        "## A heading with **bold** text",
+        "A paragraph with " + " then ".join(SPAN_SAMPLES) + ".",
+        "- first _item_\n- second `item`\n- third [item](/x)",
+        "1. one\n2. two\n3. **three**",
+        "> a quote with _emphasis_\n> over two lines",
+        "```\nprint('code')\n```",
+    ]
+    return "\n\n".join(blocks[i % len(blocks)] for i in range(block_count))
+
+
+def count_nodes(node):
+    if not node.children:
+        return 1
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+
+def bench_memory(block_count):
+    """
+    Reports the memory held by the TextNodes of a large synthetic document and by
+    its HTML node tree, measured with tracemalloc.
+    """
+    document = make_document(block_count)
+    paragraph = make_inline_paragraph(block_count)
+
+    tracemalloc.start()
+    text_nodes = text_to_textnodes(paragraph)
+    text_node_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    html_node = markdown_to_html_node(document)
+    tree_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    node_count = count_nodes(html_node)
+    print(f"{len(text_nodes)} TextNodes: {text_node_bytes / 1024:.0f} KiB, "
+          f"{text_node_bytes / len(text_nodes):.0f} bytes per node including text")
+    print(f"{node_count} HTMLNodes for {block_count} blocks ({len(document) / 1024:.0f} KiB of markdown): "
+          f"{tree_bytes / 1024:.0f} KiB, {tree_bytes / node_count:.0f} bytes per node including text")
+    return {
+        "text_nodes": len(text_nodes),
+        "text_node_bytes": text_node_bytes,
+        "html_nodes": node_count,
+        "html_tree_bytes": tree_bytes,
+    }
+
+
+def block_inline_texts(block, block_type):
+    """
+    Returns the inline markdown strings the renderer hands to text_to_textnodes for
+    a block, so the inline stage can be timed on its own.
+    """
+    if block_type == BlockType.CODE:
+        return []
+    if block_type == BlockType.HEADING:
+        return [block.lstrip("#").strip()]
+    if block_type == BlockType.PARAGRAPH:
+        return [block.replace("\n", " ")]
+    if block_type == BlockType.ORDERED_LIST:
+        return [line.split(". ", 1)[1] for line in block.splitlines()]
+    return [line[2:] for line in block.splitlines()]
+
+
+def stage_result(seconds, items, input_bytes=None):
+    result = {"seconds": seconds, "items": items, "us_per_item": seconds / max(items, 1) * 1e6}
+    if input_bytes is not None:
+        result["mb_per_second"] = input_bytes / 1e6 / seconds if seconds else None
+    return result
+
+
+def bench_stages(page_count, block_count, mix, span_density, words_per_block, repeat=3, seed=0):
+    """
+    Generates a synthetic corpus and times each pipeline stage on its own, feeding
+    every stage the output of the one before it: markdown_to_blocks,
+    block_to_block_type, the one-pass iter_parsed_blocks that does the work of
+    both, text_to_textnodes, text_node_to_html_node, to_html and an
+    end-to-end generate_pages_recursive over the corpus written to disk.
+
+    Returns:
+        A JSON-serializable dict with the configuration and per-stage results.
+    """
+    generator = CorpusGenerator(mix, span_density, words_per_block, seed)
+    documents = [generator.page(f"Page {i}", block_count) for i in range(page_count)]
+    total_bytes = sum(len(document.encode()) for document in documents)
+    stages = {}
+
+    seconds = time_call(lambda: [markdown_to_blocks(document) for document in documents], repeat=repeat)
+    blocks = [block for document in documents for block in markdown_to_blocks(document)]
+    stages["markdown_to_blocks"] = stage_result(seconds, len(documents), total_bytes)
+
+    seconds = time_call(lambda: [block_to_block_type(block) for block in blocks], repeat=repeat)
+    typed_blocks = [(block, block_to_block_type(block)) for block in blocks]
+    stages["block_to_block_type"] = stage_result(seconds, len(blocks))
+
+    document_lines = [document.split("\n") for document in documents]
+    seconds = time_call(lambda: [list(iter_parsed_blocks(lines)) for lines in document_lines], repeat=repeat)
+    stages["iter_parsed_blocks"] = stage_result(seconds, len(documents), total_bytes)
+
+    texts = [text for block, block_type in typed_blocks for text in block_inline_texts(block, block_type)]
+    seconds = time_call(lambda: [text_to_textnodes(text) for text in texts], repeat=repeat)
+    text_nodes = [node for text in texts for node in text_to_textnodes(text)]
+    stages["text_to_textnodes"] = stage_result(seconds, len(texts), sum(len(text.encode()) for text in texts))
+
+    seconds = time_call(lambda: [text_node_to_html_node(node) for node in text_nodes], repeat=repeat)
+    stages["text_node_to_html_node"] = stage_result(seconds, len(text_nodes))
+
+    trees = [markdown_to_html_node(document) for document in documents]
+    seconds = time_call(lambda: [tree.to_html() for tree in trees], repeat=repeat)
+    stages["to_html"] = stage_result(seconds, len(trees))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        content_dir = os.path.join(tmp, "content")
+        template_path = os.path.join(tmp, "template.html")
+        with open(template_path, "w") as f:
+            f.write(BENCH_TEMPLATE)
+        for i, document in enumerate(documents):
+            path = os.path.join(content_dir, f"section{i // 100}", f"page{i}.md")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(document)
+
+        def build():
+            with contextlib.redirect_stdout(io.StringIO()):
+                generate_pages_recursive(content_dir, template_path, os.path.join(tmp, "docs"), "/")
+
+        seconds = time_call(build, repeat=repeat)
+        stages["generate_pages_recursive"] = stage_result(seconds, len(documents), total_bytes)
+
+    return {
+        "suite": "stages",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "pages": page_count,
+            "blocks_per_page": block_count,
+            "block_mix": mix or DEFAULT_MIX,
+            "span_density": span_density,
+            "words_per_block": words_per_block,
+            "seed": seed,
+            "repeat": repeat,
+            "corpus_bytes": total_bytes,
+            "blocks": len(blocks),
+            "inline_texts": len(texts),
+            "text_nodes": len(text_nodes),
+        },
+        "stages": stages,
+    }
+
+
+def print_stages(results):
+    config = results["config"]
+    print(f"{config['pages']} pages, {config['blocks']} blocks, {config['text_nodes']} text nodes, "
+          f"{config['corpus_bytes'] / 1e6:.2f} MB of markdown")
+    print(f"{'stage':<26} {'total ms':>10} {'items':>9} {'us/item':>9} {'MB/s':>8}")
+    for name, stage in results["stages"].items():
+        throughput = stage.get("mb_per_second")
+        throughput = f"{throughput:>8.2f}" if throughput else f"{'':>8}"
+        print(f"{name:<26} {stage['seconds'] * 1000:>10.2f} {stage['items']:>9} {stage['us_per_item']:>9.2f} {throughput}")
+
+
+def build_peak_rss(results, site_dir, jobs=1, full=True):
+    """
+    Builds the site in site_dir and puts the peak resident set size of this process
+    in KiB on the results queue. Meant to run in a fresh process (see bench_rss);
+    with jobs, the worker processes are not counted.
+
+    A full build runs main.main with its default settings, so the build manifest,
+    dependency graph, search index, image index and parse cache are all kept; with
+    full=False, only the page pipeline runs (generate_pages_recursive without any
+    build state).
+    """
+    os.chdir(site_dir)
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        if full:
+            build_main(["--jobs", str(jobs)])
+        else:
+            generate_pages_recursive(CONTENT_DIR, TEMPLATE_PATH, DEST_DIR, "/", jobs=jobs)
+    results.put(peak_rss())
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in KiB. On Linux this is
+    VmHWM, because ru_maxrss starts out at the size of the parent process.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def bench_rss(page_counts, block_count=3, jobs=1, seed=0, full=True):
+    """
+    Builds synthetic sites of growing page counts, each in a fresh process, and
+    reports the peak RSS of each build (see build_peak_rss). Both the page pipeline
+    alone and a full build should stay flat (see pipeline); the growth over the
+    first size is reported per 1000 pages.
+
+    Returns:
+        A list of (page count, peak RSS in KiB) tuples.
+    """
+    print(f"{'pages':>10} {'peak RSS MiB':>13} {'build s':>9} {'KiB/1k pages':>13}")
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for page_count in page_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, TEMPLATE_PATH), "w") as f:
+                f.write(BENCH_TEMPLATE)
+            os.makedirs(os.path.join(tmp, STATIC_DIR))
+            CorpusGenerator(words_per_block=12, seed=seed).write_corpus(os.path.join(tmp, CONTENT_DIR), page_count,
+                                                                        block_count)
+            start = time.perf_counter()
+            # Pool workers cannot start processes of their own, so --jobs needs a plain Process
+            peaks = context.Queue()
+            build = context.Process(target=build_peak_rss, args=(peaks, tmp, jobs, full))
+            build.start()
+            build.join()
+            if build.exitcode != 0:
+                raise RuntimeError(f"Building {page_count} pages failed with exit code {build.exitcode}")
+            peak = peaks.get()
+            seconds = time.perf_counter() - start
+        growth = ""
+        if results:
+            growth = f"{(peak - results[0][1]) / (page_count - results[0][0]) * 1000:>13.0f}"
+        results.append((page_count, peak))
+        print(f"{page_count:>10} {peak / 1024:>13.1f} {seconds:>9.1f} {growth}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the site generator.")
+    subparsers = parser.add_subparsers(dest="suite", required=True)
+    inline_parser = subparsers.add_parser("inline", help="inline tokenizer scaling")
+    inline_parser.add_argument("--spans", type=int, nargs="+", default=[10000, 20000, 40000, 80000])
+    inline_parser.add_argument("--repeat", type=int, default=3)
+    blocks_parser = subparsers.add_parser("blocks", help="block parser scaling")
+    blocks_parser.add_argument("--blocks", type=int, nargs="+", default=[5000, 10000, 20000, 40000])
+    blocks_parser.add_argument("--mix", type=parse_mix, default=None,
+                               help='relative block weights, e.g. "paragraph=4,unordered_list=1,code=1"')
+    blocks_parser.add_argument("--repeat", type=int, default=3)
+    escape_parser = subparsers.add_parser("escape", help="share of render time spent escaping HTML")
+    escape_parser.add_argument("--pages", type=int, default=200)
+    escape_parser.add_argument("--blocks", type=int, default=30, help="blocks per page")
+    escape_parser.add_argument("--repeat", type=int, default=3)
+    adversarial_parser = subparsers.add_parser("adversarial", help="parser scaling on pathological input")
+    adversarial_parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024], help="input sizes in KiB")
+    adversarial_parser.add_argument("--repeat", type=int, default=3)
+    memory_parser = subparsers.add_parser("memory", help="memory held by node objects")
+    memory_parser.add_argument("--blocks", type=int, default=100000)
+    rss_parser = subparsers.add_parser("rss", help="peak memory of whole builds of growing size")
+    rss_parser.add_argument("--pages", type=int, nargs="+", default=[1000, 10000, 50000, 200000])
+    rss_parser.add_argument("--jobs", "-j", type=int, default=1)
+    rss_parser.add_argument("--pipeline-only", action="store_true",
+                            help="run only the page pipeline, without the manifest, graph, search index or cache")
+    stages_parser = subparsers.add_parser("stages", help="time each pipeline stage on a synthetic corpus")
+    stages_parser.add_argument("--pages", type=int, default=200)
+    stages_parser.add_argument("--blocks", type=int, default=30, help="blocks per page")
+    stages_parser.add_argument("--mix", type=parse_mix, default=None,
+                               help='relative block weights, e.g. "paragraph=4,unordered_list=1,code=1"')
+    stages_parser.add_argument("--span-density", type=float, default=0.2,
+                               help="fraction of words that are inline spans")
+    stages_parser.add_argument("--words", type=int, default=40, help="words per block, controls document size")
+    stages_parser.add_argument("--seed", type=int, default=0)
+    stages_parser.add_argument("--repeat", type=int, default=3)
+    stages_parser.add_argument("--output", "-o", help="write the results as JSON to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    if args.suite == "inline":
+        bench_inline(args.spans, args.repeat)
+    elif args.suite == "blocks":
+        bench_blocks(args.blocks, args.mix, args.repeat)
+    elif args.suite == "escape":
+        bench_escape(args.pages, args.blocks, repeat=args.repeat)
+    elif args.suite == "adversarial":
+        bench_adversarial([size * 1024 for size in args.sizes], args.repeat)
+    elif args.suite == "memory":
+        bench_memory(args.blocks)
+    elif args.suite == "rss":
+        bench_rss(args.pages, jobs=args.jobs, full=not args.pipeline_only)
+    elif args.suite == "stages":
+        results = bench_stages(args.pages, args.blocks, args.mix, args.span_density, args.words,
+                               args.repeat, args.seed)
+        if args.output == "-":
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        else:
+            print_stages(results)
+        if args.output and args.output != "-":
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
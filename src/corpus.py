@@ -0,0 +1,160 @@
+import os
+import random
+
+BLOCK_KINDS = ["heading", "paragraph", "unordered_list", "ordered_list", "quote", "code"]
+DEFAULT_MIX = {"heading": 1, "paragraph": 4, "unordered_list": 1, "ordered_list": 1, "quote": 1, "code": 1}
+
+WORDS = (
+    "the of and to in is was that for on with as by at from elves ring shire wizard "
+    "mountain river forest journey council shadow light king hobbit dwarf road tale "
+    "song stone tower sword star night morning fire water age west east"
+).split()
+
+# Pathological input, modelled on what user-submitted markdown contains: unclosed
+# spans, URLs and fences, and runs of delimiters. Each builder takes a size in
+# characters and returns input of about that size
+ADVERSARIAL_INLINE = {
+    "unclosed_link_urls": lambda size: "[a](" * (size // 4),
+    "unclosed_image_urls": lambda size: "![a](" * (size // 5),
+    "unclosed_link_text": lambda size: "[a" * (size // 2),
+    "open_parens_in_url": lambda size: "[a](" + "(" * size,
+    "paren_groups_in_url": lambda size: "[a](" + "(x)" * (size // 3),
+    "unclosed_groups_in_urls": lambda size: "[a](x(" * (size // 6),
+    "closed_after_unclosed_urls": lambda size: "[a](" * (size // 4) + ")",
+    "unclosed_bold": lambda size: "**" + "a " * (size // 2),
+    "unclosed_italics": lambda size: "_a " * (size // 3),
+    "unclosed_code": lambda size: "`a " * (size // 3),
+    "delimiter_runs": lambda size: "*" * (size // 3) + "_" * (size // 3) + "`" * (size // 3),
+    "bracket_runs": lambda size: "![" * (size // 4) + "](" * (size // 4),
+}
+ADVERSARIAL_BLOCKS = {
+    "one_long_line": lambda size: "word " * (size // 5),
+    "blank_lines": lambda size: "\n" * size,
+    "whitespace_lines": lambda size: " \t\n" * (size // 3),
+    "unclosed_fence": lambda size: "```\n" + "code\n\n" * (size // 6),
+    "fence_lines": lambda size: "```\n" * (size // 4),
+    "long_item_number": lambda size: "1" * size + ". item",
+    "numbered_items": lambda size: "\n".join(f"{i}. item" for i in range(1, size // 10)),
+    "bullets": lambda size: "- item\n" * (size // 7),
+    "quote_lines": lambda size: "> line\n" * (size // 7),
+    "hash_runs": lambda size: "#" * size + " heading",
+    "crlf_lines": lambda size: "line\r\n" * (size // 6),
+}
+ADVERSARIAL_TITLES = {
+    "bare_hash_then_blank_lines": lambda size: "#\n" + "\n" * (size - 2),
+    "bare_hash_then_whitespace_lines": lambda size: "#\n" + " \t\n" * (size // 3),
+}
+FUZZ_TOKENS = ["[", "]", "(", ")", "](", "![", "**", "*", "_", "`", "```", "!", "#", "> ", "- ", "1. ", "2. ",
+               "word", " ", "\t", "\r", "\n", "\n\n"]
+
+
+def fuzz_markdown(size, seed=0):
+    """
+    Returns about size characters of random markdown made of the delimiters the
+    parser looks for, so spans, URLs, lists and fences open and close in every
+    combination.
+    """
+    rng = random.Random(seed)
+    tokens = rng.choices(FUZZ_TOKENS, k=size // 2)
+    return "".join(tokens)[:size]
+
+
+def parse_mix(text):
+    """
+    Parses a block mix such as "paragraph=4,code=1" into a dict of block kind to
+    relative weight.
+
+    Raises:
+        ValueError: If a kind is unknown or a weight is not a non-negative integer.
+    """
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in BLOCK_KINDS:
+            raise ValueError(f"Unknown block kind: {kind}")
+        if not weight.strip().isdigit():
+            raise ValueError(f"Invalid weight for {kind}: {weight}")
+        mix[kind] = int(weight)
+    return mix
+
+
+class CorpusGenerator:
+    """
+    Generates synthetic markdown pages that exercise every block type and inline
+    span the parser supports.
+
+    Args:
+        mix: Dict of block kind to relative weight (see BLOCK_KINDS).
+        span_density: Fraction of words, between 0 and 1, that become inline spans.
+        words_per_block: Number of words in each paragraph, quote line group or list.
+        seed: Seed for the random generator, so corpora are reproducible.
+    """
+
+    def __init__(self, mix=None, span_density=0.2, words_per_block=40, seed=0):
+        mix = mix or DEFAULT_MIX
+        self.kinds = [kind for kind in BLOCK_KINDS if mix.get(kind)]
+        self.weights = [mix[kind] for kind in self.kinds]
+        if not self.kinds:
+            raise ValueError("The block mix must have at least one positive weight")
+        self.span_density = span_density
+        self.words_per_block = words_per_block
+        self.random = random.Random(seed)
+
+    def span(self, word):
+        kind = self.random.randrange(5)
+        if kind == 0:
+            return f"**{word}**"
+        if kind == 1:
+            return f"_{word}_"
+        if kind == 2:
+            return f"`{word}`"
+        if kind == 3:
+            return f"[{word}](/blog/{word})"
+        return f"![{word}](/images/{word}.png)"
+
+    def inline_text(self, word_count):
+        words = []
+        for _ in range(max(1, word_count)):
+            word = self.random.choice(WORDS)
+            if self.random.random() < self.span_density:
+                word = self.span(word)
+            words.append(word)
+        return " ".join(words)
+
+    def block(self, kind):
+        count = self.words_per_block
+        if kind == "heading":
+            return "#" * self.random.randint(2, 6) + " " + self.inline_text(6)
+        if kind == "paragraph":
+            return "\n".join(self.inline_text(12) for _ in range(max(1, count // 12)))
+        if kind == "unordered_list":
+            return "\n".join("- " + self.inline_text(8) for _ in range(max(1, count // 8)))
+        if kind == "ordered_list":
+            return "\n".join(f"{i}. " + self.inline_text(8) for i in range(1, max(1, count // 8) + 1))
+        if kind == "quote":
+            return "\n".join("> " + self.inline_text(12) for _ in range(max(1, count // 12)))
+        lines = [" ".join(self.random.choice(WORDS) for _ in range(6)) for _ in range(max(1, count // 6))]
+        return "```\n" + "\n".join(lines) + "\n```"
+
+    def page(self, title, block_count):
+        """
+        Returns a markdown page with an h1 title followed by block_count blocks.
+        """
+        kinds = self.random.choices(self.kinds, self.weights, k=block_count)
+        return "\n\n".join([f"# {title}"] + [self.block(kind) for kind in kinds]) + "\n"
+
+    def write_corpus(self, content_dir, page_count, block_count, pages_per_dir=100):
+        """
+        Writes page_count pages of block_count blocks each under content_dir, spread
+        over subdirectories of pages_per_dir pages. Returns the written paths.
+        """
+        paths = []
+        for i in range(page_count):
+            directory = os.path.join(content_dir, f"section{i // pages_per_dir}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"page{i}.md")
+            with open(path, "w") as f:
+                f.write(self.page(f"Page {i}", block_count))
+            paths.append(path)
+        return paths
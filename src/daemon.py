@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+import time
+from daemon_client import SOCKET_PATH, daemon_running
+from inline_markdown import inline_cache_info
+from manifest import BuildManifest, OutputChanges, MANIFEST_PATH, enable_hash_cache
+from depgraph import DependencyGraph
+from search_index import SearchIndex
+from main import (CONTENT_DIR, STATIC_DIR, DEST_DIR, build_site, rebuild_changed, add_build_arguments,
+                  build_settings)
+
+
+class BuildDaemon:
+    """
+    A builder process that stays alive between builds, so repeated builds skip
+    interpreter start-up, imports, loading the manifest, dependency graph and
+    search index, and compiling the template. Requests arrive over a Unix socket
+    as one JSON object per line, and each gets a JSON response line:
+
+        {"command": "build"}                          incremental build of the site
+        {"command": "build", "paths": ["/abs/a.md"]}  rebuild after these files changed
+        {"command": "stats"}
+        {"command": "stop"}
+
+        {"ok": true, "seconds": 0.004, "failed": [], "changes": {...}, "log": "..."}
+        {"ok": true, "stats": {"builds": 3, ...}}
+        {"ok": false, "error": "Unknown command: bulid"}
+
+    A build is "ok" if no page failed. Requests are handled one at a time, so
+    builds never overlap. If another process built the site in the meantime,
+    which the manifest's mtime tells, the build state is loaded again first.
+
+    Args:
+        basepath: The base path for the site.
+        hash_static: Compare static files by content when their size or mtime differ.
+        jobs: Number of worker processes to render pages with.
+        deterministic: Keep the log in the order pages are walked, even with jobs.
+        cache: Optional ParseCache of previously parsed markdown.
+        rewriters: UrlRewriters applied before the basepath.
+        search: Write the client-side search index.
+    """
+
+    def __init__(self, basepath="/", hash_static=False, jobs=1, deterministic=False, cache=None, rewriters=(),
+                 search=True):
+        self.basepath = basepath
+        self.hash_static = hash_static
+        self.jobs = jobs
+        self.deterministic = deterministic
+        self.cache = cache
+        self.rewriters = list(rewriters)
+        self.use_search = search
+        self.started = time.time()
+        self.builds = 0
+        self.last_build_seconds = None
+        self.stopping = False
+        self.load_state()
+
+    def load_state(self):
+        self.manifest = BuildManifest.load()
+        self.graph = DependencyGraph.load(content_dir=CONTENT_DIR, static_dir=STATIC_DIR)
+        self.search = SearchIndex.load() if self.use_search else None
+        self.state_stamp = manifest_stamp()
+
+    def build(self, paths=None):
+        """
+        Builds the site, or only what the given changed paths require (see
+        rebuild_changed), and returns the response dict.
+        """
+        log = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            if manifest_stamp() != self.state_stamp:
+                print(f"{MANIFEST_PATH} changed on disk, reloading the build state")
+                self.load_state()
+            if paths is None:
+                failed, changes = build_site(self.manifest, self.graph, self.search, self.basepath,
+                                             hash_static=self.hash_static, jobs=self.jobs,
+                                             deterministic=self.deterministic, cache=self.cache,
+                                             rewriters=self.rewriters)
+            else:
+                changes = OutputChanges(DEST_DIR)
+                failed = rebuild_changed(paths, self.manifest, self.basepath, hash_static=self.hash_static,
+                                         cache=self.cache, rewriters=self.rewriters, graph=self.graph,
+                                         changes=changes, search=self.search)
+        self.state_stamp = manifest_stamp()
+        self.builds += 1
+        self.last_build_seconds = time.perf_counter() - start
+        return {"ok": not failed, "seconds": self.last_build_seconds, "failed": failed,
+                "changes": changes.to_dict(), "log": log.getvalue()}
+
+    def stats(self):
+        inline_cache = inline_cache_info()
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": time.time() - self.started,
+            "builds": self.builds,
+            "last_build_seconds": self.last_build_seconds,
+            "pages": len(self.manifest.pages),
+            "static_files": len(self.manifest.static_files),
+            "search_pages": None if self.search is None else len(self.search.pages),
+            "inline_cache": None if inline_cache is None else {"hits": inline_cache.hits,
+                                                               "misses": inline_cache.misses},
+        }
+
+    def handle_request(self, request):
+        """
+        Returns the response dict for a decoded request.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("A request must be a JSON object")
+        command = request.get("command")
+        if command == "build":
+            paths = request.get("paths")
+            if paths is not None and not (isinstance(paths, list) and all(isinstance(path, str) for path in paths)):
+                raise ValueError('"paths" must be a list of strings')
+            return self.build(paths)
+        if command == "stats":
+            return {"ok": True, "stats": self.stats()}
+        if command == "stop":
+            self.stopping = True
+            return {"ok": True}
+        raise ValueError(f"Unknown command: {command}")
+
+    def handle_line(self, line):
+        """
+        Returns the encoded response line for one encoded request line.
+        """
+        try:
+            response = self.handle_request(json.loads(line))
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        return json.dumps(response).encode("utf-8") + b"\n"
+
+    def serve(self, socket_path=SOCKET_PATH):
+        """
+        Answers requests on a Unix socket until a stop request arrives. A socket
+        file left behind by a daemon that is no longer running is replaced.
+
+        Raises:
+            RuntimeError: If another daemon is already listening on socket_path.
+        """
+        if os.path.exists(socket_path):
+            if daemon_running(socket_path):
+                raise RuntimeError(f"A build daemon is already listening on {socket_path}")
+            os.remove(socket_path)
+        directory = os.path.dirname(socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with socketserver.UnixStreamServer(socket_path, _RequestHandler) as server:
+            server.daemon = self
+            print(f"Build daemon {os.getpid()} listening on {socket_path}", flush=True)
+            try:
+                while not self.stopping:
+                    server.handle_request()
+            finally:
+                os.remove(socket_path)
+        print("Build daemon stopped")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(daemon.handle_line(line))
+            self.wfile.flush()
+            if daemon.stopping:
+                return
+
+
+def manifest_stamp():
+    try:
+        stat = os.stat(MANIFEST_PATH)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build the site once, then keep the builder running and answer build requests sent with "
+                    "daemon_client.py over a Unix socket. Run it in the site directory.")
+    add_build_arguments(parser)
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"socket path (default {SOCKET_PATH})")
+    args = parser.parse_args(argv)
+
+    if daemon_running(args.socket):
+        print(f"A build daemon is already listening on {args.socket}", file=sys.stderr)
+        sys.exit(2)
+    cache, rewriters = build_settings(args)
+    # Pages whose mtime and size did not change are not read again to hash them
+    enable_hash_cache()
+    daemon = BuildDaemon(args.basepath, hash_static=args.hash_static, jobs=args.jobs,
+                         deterministic=args.deterministic, cache=cache, rewriters=rewriters,
+                         search=not args.no_search)
+    # Build once up front, so the first request finds everything loaded and warm
+    response = daemon.build()
+    print(response["log"], end="")
+    try:
+        daemon.serve(args.socket)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import socket
+import sys
+
+# The client only needs the standard library, so it starts as fast as the interpreter does
+SOCKET_PATH = os.path.join(".build", "daemon.sock")
+
+
+def daemon_running(socket_path=SOCKET_PATH):
+    """
+    Returns True if a daemon accepts connections on socket_path.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def send_request(request, socket_path=SOCKET_PATH):
+    """
+    Sends one request to the daemon and returns its decoded response.
+
+    Raises:
+        OSError: If no daemon is listening on socket_path, such as
+            FileNotFoundError or ConnectionRefusedError.
+        ValueError: If the daemon closed the connection without a response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+    if not line:
+        raise ValueError("The build daemon closed the connection without responding")
+    return json.loads(line)
+
+
+def print_stats(stats):
+    for name, value in stats.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        elif isinstance(value, dict):
+            value = ", ".join(f"{key} {count}" for key, count in value.items())
+        print(f"{name}: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send requests to the build daemon started with daemon.py.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"socket path (default {SOCKET_PATH})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build the site, or only what changed PATHS require")
+    build_parser.add_argument("paths", nargs="*", help="files that changed, e.g. content/blog/tom/index.md")
+    build_parser.add_argument("--quiet", "-q", action="store_true", help="do not print the build log")
+    subparsers.add_parser("stats", help="print the daemon's counters")
+    subparsers.add_parser("stop", help="stop the daemon")
+    args = parser.parse_args(argv)
+
+    request = {"command": args.command}
+    if args.command == "build" and args.paths:
+        # The daemon may run in another directory
+        request["paths"] = [os.path.abspath(path) for path in args.paths]
+    try:
+        response = send_request(request, args.socket)
+    except (OSError, ValueError) as e:
+        print(f"No build daemon answered on {args.socket} ({e}); start one with: python3 src/daemon.py",
+              file=sys.stderr)
+        sys.exit(2)
+
+    if not response["ok"] and "error" in response:
+        print(f"Error: {response['error']}", file=sys.stderr)
+        sys.exit(1)
+    if args.command == "build":
+        if not args.quiet:
+            print(response["log"], end="")
+        changes = response["changes"]
+        print(f"Built in {response['seconds'] * 1000:.0f} ms: {len(changes['added'])} added, "
+              f"{len(changes['changed'])} changed, {len(changes['deleted'])} deleted, "
+              f"{len(response['failed'])} failed")
+        if response["failed"]:
+            sys.exit(1)
+    elif args.command == "stats":
+        print_stats(response["stats"])
+
+
+if __name__ == "__main__":
+    main()
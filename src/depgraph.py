@@ -0,0 +1,212 @@
+import argparse
+import os
+import sys
+from spill import PageTable, load_table
+from urls import UrlRewriter
+
+DEPGRAPH_VERSION = 2
+DEPGRAPH_PATH = os.path.join(".build", "depgraph.json")
+
+
+class ReferenceCollector(UrlRewriter):
+    """
+    Records the URLs of a page's links and images while MarkdownStream renders it,
+    as each link and image TextNode is converted, and passes them on to the page's
+    own UrlRewriter, if any. The URLs are the ones written in the markdown, before
+    any rewriting, and links and images in code are not included.
+
+    Args:
+        url_rewriter: The UrlRewriter the page is rendered with, or None.
+    """
+
+    def __init__(self, url_rewriter=None):
+        self.url_rewriter = url_rewriter
+        self.key = UrlRewriter.key if url_rewriter is None else url_rewriter.key
+        self.images = set()
+        self.links = set()
+
+    def rewrite(self, url, tag, attribute):
+        (self.images if tag == "img" else self.links).add(url)
+        return url if self.url_rewriter is None else self.url_rewriter.rewrite(url, tag, attribute)
+
+    def image_attributes(self, url):
+        return None if self.url_rewriter is None else self.url_rewriter.image_attributes(url)
+
+    def references(self):
+        """
+        Returns the URLs collected so far as {"images": [...], "links": [...]}.
+        """
+        return {"images": sorted(self.images), "links": sorted(self.links)}
+
+
+def local_url_path(url):
+    """
+    Returns the site path of a root-relative URL without its query string or
+    fragment, such as "blog/tom" for "/blog/tom#intro", or None for any other URL.
+    """
+    if not url.startswith("/") or url.startswith("//"):
+        return None
+    return url.split("#", 1)[0].split("?", 1)[0].strip("/")
+
+
+class DependencyGraph:
+    """
+    Records what each page of the last build was generated from, so a change to
+    any input maps to exactly the pages it affects.
+
+    Pages are keyed by their markdown path (e.g. "content/blog/tom/index.md") and
+    each holds three kinds of edges:
+
+        template: the template the page was rendered with.
+        images: files under the static directory the page shows as images.
+        links: markdown sources of the site pages the page links to.
+
+    Link and image URLs that do not resolve to a local file are not recorded.
+    The pages are a spill.PageTable, read from disk as they are needed.
+
+    Args:
+        path: Where the graph is persisted.
+        content_dir: Directory that page links are resolved against.
+        static_dir: Directory that image URLs are resolved against.
+        pages: Optional PageTable, or dict, of the pages' edges.
+    """
+
+    def __init__(self, path=DEPGRAPH_PATH, content_dir="content", static_dir="static", pages=None):
+        self.path = path
+        self.content_dir = content_dir
+        self.static_dir = static_dir
+        if pages is None:
+            pages = PageTable(directory=os.path.dirname(path))
+        elif isinstance(pages, dict):
+            pages = PageTable(pages=pages)
+        self.pages = pages
+
+    @classmethod
+    def load(cls, path=DEPGRAPH_PATH, content_dir="content", static_dir="static"):
+        """
+        Loads a graph from disk. A missing, unreadable or outdated graph yields an
+        empty one.
+        """
+        try:
+            data, pages = load_table(path)
+        except FileNotFoundError:
+            return cls(path, content_dir, static_dir)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable dependency graph {path}: {e}")
+            return cls(path, content_dir, static_dir)
+        if data.get("version") != DEPGRAPH_VERSION:
+            return cls(path, content_dir, static_dir)
+        return cls(path, content_dir, static_dir, pages)
+
+    def save(self):
+        """
+        Writes the graph atomically.
+        """
+        self.pages.save(self.path, {"version": DEPGRAPH_VERSION})
+
+    def resolve_image(self, url):
+        path = local_url_path(url)
+        if not path:
+            return None
+        static_path = os.path.join(self.static_dir, path)
+        return static_path if os.path.isfile(static_path) else None
+
+    def resolve_link(self, url):
+        path = local_url_path(url)
+        if path is None:
+            return None
+        base = os.path.join(self.content_dir, path) if path else self.content_dir
+        if base.endswith(".html"):
+            base = base[:-len(".html")]
+        for candidate in (base + ".md", os.path.join(base, "index.md")):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def record_references(self, source, template_path, images, links):
+        """
+        Replaces the edges of a page with those of the image and link URLs it
+        references, such as a ReferenceCollector gathered while rendering it.
+        """
+        self.pages[source] = {
+            "template": template_path,
+            "images": sorted({path for path in map(self.resolve_image, images) if path}),
+            "links": sorted({path for path in map(self.resolve_link, links) if path and path != source}),
+        }
+
+    def forget_page(self, source):
+        self.pages.discard(source)
+
+    def prune(self, sources):
+        """
+        Forgets every page whose markdown path is not among sources, which are in
+        walk order (see spill.walk_key).
+        """
+        self.pages.prune(sources)
+
+    def dependencies(self, source):
+        """
+        Returns the edges recorded for a page, or None if the page is unknown.
+        """
+        return self.pages.get(source)
+
+    def pages_using(self, path):
+        """
+        Returns the pages whose output has to be rebuilt when path changes: pages
+        rendered with it as their template or showing it as an image.
+        """
+        return self.pages_using_any([path])
+
+    def pages_using_any(self, paths):
+        """
+        Returns the pages whose output has to be rebuilt when any of paths changes,
+        as pages_using does for one path, reading the graph once.
+        """
+        paths = set(map(os.path.normpath, paths))
+        if not paths:
+            return []
+        return sorted(
+            source for source, edges in self.pages.items()
+            if os.path.normpath(edges["template"]) in paths
+            or not paths.isdisjoint(map(os.path.normpath, edges["images"]))
+        )
+
+    def pages_linking_to(self, source):
+        """
+        Returns the pages that link to a page, whose links break if it is removed.
+        """
+        source = os.path.normpath(source)
+        return sorted(page for page, edges in self.pages.items() if source in map(os.path.normpath, edges["links"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the dependency graph recorded by the last build.")
+    parser.add_argument("--graph", default=DEPGRAPH_PATH, help=f"graph file (default {DEPGRAPH_PATH})")
+    subparsers = parser.add_subparsers(dest="query", required=True)
+    rebuilds_parser = subparsers.add_parser("rebuilds", help="pages rebuilt when a template or static file changes")
+    rebuilds_parser.add_argument("path")
+    linked_parser = subparsers.add_parser("linked-from", help="pages that link to a markdown page")
+    linked_parser.add_argument("path")
+    deps_parser = subparsers.add_parser("deps", help="what a markdown page depends on")
+    deps_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    graph = DependencyGraph.load(args.graph)
+    if args.query == "deps":
+        edges = graph.dependencies(os.path.normpath(args.path))
+        if edges is None:
+            print(f"No page {args.path} in {args.graph}", file=sys.stderr)
+            sys.exit(1)
+        print(f"template: {edges['template']}")
+        for kind in ("images", "links"):
+            for path in edges[kind]:
+                print(f"{kind[:-1]}: {path}")
+        return
+
+    pages = graph.pages_using(args.path) if args.query == "rebuilds" else graph.pages_linking_to(args.path)
+    for page in pages:
+        print(page)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,41 @@
+import io
 from textnode import TextType, TextNode
 
+# Characters that are special in HTML text, and in quoted attribute values, with
+# the character references they are escaped to. "&" comes first, so the other
+# references are not escaped again
+HTML_TEXT_ESCAPES = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"))
+HTML_ATTRIBUTE_ESCAPES = HTML_TEXT_ESCAPES + (('"', "&quot;"), ("'", "&#x27;"))
+
+def escape_text(text):
+    """
+    Returns text with the characters that are special in HTML text replaced by
+    character references. Text without any, which is most of it, is returned as is
+    after three substring scans. Values other than strings are converted with str()
+    first.
+    """
+    text = str(text)
+    if "&" in text or "<" in text or ">" in text:
+        for char, reference in HTML_TEXT_ESCAPES:
+            if char in text:
+                text = text.replace(char, reference)
+    return text
+
+def escape_attribute(value):
+    """
+    Returns value escaped for use in a quoted attribute value, like escape_text but
+    quotes included, such as the number in {"width": 10}.
+    """
+    value = str(value)
+    if "&" in value or "<" in value or ">" in value or '"' in value or "'" in value:
+        for char, reference in HTML_ATTRIBUTE_ESCAPES:
+            if char in value:
+                value = value.replace(char, reference)
+    return value
+
 class HTMLNode:
+    __slots__ = ("tag", "value", "children", "props")
+
     def __init__(self, tag=None, value=None, children=None, props=None):
         self.tag = tag
         self.value = value
@@ -8,17 +43,31 @@ class HTMLNode:
         self.props = props
 
     def props_to_html(self):
-        if self.props is None or len(self.props) == 0:
+        props = self.props
+        if not props:
             return ""
-        props_html = ""
-        for prop in self.props:
-            props_html += f' {prop}="{self.props[prop]}"'
-        return props_html
+        html = "".join([f' {prop}="{value}"' for prop, value in props.items()])
+        # One check over every value at once instead of an escape_attribute call per
+        # value. Names hold no quotes, so the only quotes are those around the values
+        if "&" in html or "<" in html or ">" in html or "'" in html or html.count('"') != 2 * len(props):
+            html = "".join([f' {prop}="{escape_attribute(value)}"' for prop, value in props.items()])
+        return html
+
+    def to_html(self):
+        """
+        Returns the HTML for this node as a string, built by streaming the node
+        into an in-memory buffer with the render_to its subclass defines.
+        """
+        buffer = io.StringIO()
+        self.render_to(buffer)
+        return buffer.getvalue()
 
     def __repr__(self):
         return f"HTMLNode({self.tag}, {self.value}, children: {self.children}, {self.props})"
 
 class ParentNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag, children, props=None):
         if tag is None:
             raise ValueError("A ParentNode must have a tag.")
@@ -26,35 +75,59 @@ class ParentNode(HTMLNode):
             raise ValueError("A ParentNode must have children.")
         super().__init__(tag=tag, children=children, props=props)
 
-    def to_html(self):
+    def render_to(self, writer):
+        """
+        Writes the HTML for this node to writer, any object with a write(str) method
+        such as an open file or io.StringIO, one tag or leaf at a time.
+        """
         if self.tag is None:
             raise ValueError("A ParentNode must have a tag.")
         if self.children is None:
             raise ValueError("A ParentNode must have children.")
 
-        html_string = f'<{self.tag}{self.props_to_html()}>'
+        writer.write(f'<{self.tag}{self.props_to_html()}>')
         for child in self.children:
-            html_string += child.to_html()
-        html_string += f'</{self.tag}>'
-        return html_string
+            child.render_to(writer)
+        writer.write(f'</{self.tag}>')
 
 class LeafNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag, value, props=None):
         super().__init__(tag, value, None, props)
 
     def to_html(self):
-        if self.value is None:
+        """
+        Returns the HTML for this leaf. Its value and props are plain text and are
+        escaped here, once.
+        """
+        value = self.value
+        if value is None:
             raise ValueError("All leaf nodes must have a value")
-        if self.tag is None:
-            return self.value
-        if self.tag == "img":
-            return f'<{self.tag}{self.props_to_html()} />'
-        if self.tag == "code":
-            return f'<{self.tag}>{self.value}</{self.tag}>'
-        props_html = self.props_to_html()
-        return f'<{self.tag}{props_html}>{self.value}</{self.tag}>'
-
-def text_node_to_html_node(text_node):
+        if type(value) is not str:
+            value = str(value)
+        # The same check escape_text starts with, inlined: most leaves need no escaping
+        if "&" in value or "<" in value or ">" in value:
+            value = escape_text(value)
+        tag = self.tag
+        if tag is None:
+            return value
+        if tag == "img":
+            return f'<{tag}{self.props_to_html()} />'
+        if tag == "br":
+            return "<br/>"
+        if not self.props:
+            return f'<{tag}>{value}</{tag}>'
+        return f'<{tag}{self.props_to_html()}>{value}</{tag}>'
+
+    def render_to(self, writer):
+        writer.write(self.to_html())
+
+def text_node_to_html_node(text_node, url_rewriter=None):
+    """
+    Converts a TextNode to a LeafNode. If a UrlRewriter is given, it rewrites the
+    href of links and the src of images, and adds its image_attributes to images.
+    """
     if text_node.text_type == TextType.TEXT:
         return LeafNode(None, text_node.text)
     if text_node.text_type == TextType.BOLD:
@@ -64,8 +137,15 @@ def text_node_to_html_node(text_node):
     if text_node.text_type == TextType.CODE:
         return LeafNode("code", text_node.text)
     if text_node.text_type == TextType.LINK:
-        return LeafNode("a", text_node.text, {"href": text_node.url})
+        url = text_node.url if url_rewriter is None else url_rewriter.rewrite(text_node.url, "a", "href")
+        return LeafNode("a", text_node.text, {"href": url})
     if text_node.text_type == TextType.IMAGE:
-        return LeafNode("img", "", {"src": text_node.url, "alt": text_node.text})
+        if url_rewriter is None:
+            return LeafNode("img", "", {"src": text_node.url, "alt": text_node.text})
+        props = {"src": url_rewriter.rewrite(text_node.url, "img", "src"), "alt": text_node.text}
+        attributes = url_rewriter.image_attributes(text_node.url)
+        if attributes:
+            props.update(attributes)
+        return LeafNode("img", "", props)
 
     raise Exception(f"Unsupported TextType: {text_node.text_type}")
\ No newline at end of file
@@ -0,0 +1,275 @@
+import json
+import os
+import struct
+from depgraph import local_url_path
+from urls import UrlRewriter
+
+IMAGE_INDEX_VERSION = 1
+IMAGE_INDEX_PATH = os.path.join(".build", "images.json")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+# Enough for the PNG, GIF and WebP headers; JPEG files are read segment by segment
+HEADER_BYTES = 30
+# JPEG start-of-frame markers, which hold the image size. 0xC4, 0xC8 and 0xCC share the range but are not frames
+JPEG_FRAME_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# JPEG markers without a length: TEM, the restart markers and the start of the image
+JPEG_STANDALONE_MARKERS = frozenset([0x01, 0xD8] + list(range(0xD0, 0xD8)))
+# Of an APP1 segment only the start is read, where the orientation of the first image sits
+EXIF_BYTES = 1024
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def png_size(header):
+    if header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR" or len(header) < 24:
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def gif_size(header):
+    if header[:6] not in (b"GIF87a", b"GIF89a") or len(header) < 10:
+        return None
+    return struct.unpack("<HH", header[6:10])
+
+
+def webp_size(header):
+    if header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 " and header[23:26] == b"\x9d\x01\x2a" and len(header) >= 30:
+        # Lossy: 14-bit sizes after the frame tag and start code; the top bits are scaling
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and header[20:21] == b"\x2f" and len(header) >= 25:
+        # Lossless: 14-bit sizes minus one, packed after the signature byte
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(header) >= 30:
+        # Extended: 24-bit canvas sizes minus one
+        return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+    return None
+
+
+def exif_orientation(segment):
+    """
+    Returns the orientation tag of the first image in an APP1 segment, or None if
+    the segment holds no Exif data or the tag is not among what was read.
+    """
+    if segment[:6] != b"Exif\0\0":
+        return None
+    tiff = segment[6:]
+    if tiff[:4] == b"II*\0":
+        order = "<"
+    elif tiff[:4] == b"MM\0*":
+        order = ">"
+    else:
+        return None
+    try:
+        (offset,) = struct.unpack(order + "I", tiff[4:8])
+        (count,) = struct.unpack(order + "H", tiff[offset:offset + 2])
+        for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+            tag, kind, _, value = struct.unpack(order + "HHIH", tiff[entry:entry + 10])
+            if tag == EXIF_ORIENTATION_TAG:
+                return value if kind == 3 else None
+    except struct.error:
+        return None
+    return None
+
+
+def jpeg_size(f):
+    """
+    Returns the size of the JPEG open as f, positioned after its start marker, by
+    walking the segment headers up to the first frame and seeking past every
+    segment body. The size is given as displayed, so images whose Exif
+    orientation turns them a quarter have their width and height swapped.
+    """
+    orientation = None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        # Markers may be padded with any number of 0xFF fill bytes
+        while code == 0xFF:
+            byte = f.read(1)
+            if not byte:
+                return None
+            code = byte[0]
+        if code in JPEG_STANDALONE_MARKERS:
+            continue
+        if code in (0xD9, 0xDA):
+            # The image ends or its data starts before any frame
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        if length < 2:
+            return None
+        if code in JPEG_FRAME_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            if orientation in (5, 6, 7, 8):
+                return height, width
+            return width, height
+        if code == 0xE1 and orientation is None:
+            segment = f.read(min(length - 2, EXIF_BYTES))
+            orientation = exif_orientation(segment)
+            f.seek(length - 2 - len(segment), os.SEEK_CUR)
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(path):
+    """
+    Returns the (width, height) in pixels of a PNG, JPEG, GIF or WebP image, read
+    from its header without decoding it, or None if the file is none of these or
+    its header is damaged.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_BYTES)
+        if header[:2] == b"\xff\xd8":
+            f.seek(2)
+            size = jpeg_size(f)
+        else:
+            size = png_size(header) or gif_size(header) or webp_size(header)
+    if size is None or not size[0] or not size[1]:
+        return None
+    return size
+
+
+class ImageIndex:
+    """
+    Sizes of the images under the static directory, kept between builds so an
+    image's header is only read again after the image changes.
+
+    Entries are keyed by the image's path and hold the mtime and size of the file
+    they were read from, plus its width and height (both None for files that are
+    not a known image format).
+
+    Args:
+        path: Where the index is persisted.
+        static_dir: Directory refresh() looks for images in.
+    """
+
+    def __init__(self, path=IMAGE_INDEX_PATH, static_dir="static", images=None):
+        self.path = path
+        self.static_dir = static_dir
+        self.images = images or {}
+        self.changed = False
+
+    @classmethod
+    def load(cls, path=IMAGE_INDEX_PATH, static_dir="static"):
+        """
+        Loads an index from disk. A missing, unreadable or outdated index yields an
+        empty one.
+        """
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path, static_dir)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable image index {path}: {e}")
+            return cls(path, static_dir)
+        if data.get("version") != IMAGE_INDEX_VERSION:
+            return cls(path, static_dir)
+        return cls(path, static_dir, data.get("images"))
+
+    def save(self):
+        """
+        Writes the index atomically if it changed since it was loaded or last saved.
+        """
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"version": IMAGE_INDEX_VERSION, "images": self.images}, sort_keys=True))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def dimensions(self, path):
+        """
+        Returns the (width, height) of the image at path, or None if it is missing or
+        not a known image format. The header is only read if the file's mtime or size
+        differ from the entry's.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if self.images.pop(path, None) is not None:
+                self.changed = True
+            return None
+        entry = self.images.get(path)
+        if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            try:
+                size = image_size(path)
+            except OSError as e:
+                print(f"Could not read the size of image {path}: {e}")
+                return None
+            width, height = size or (None, None)
+            entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "width": width, "height": height}
+            self.images[path] = entry
+            self.changed = True
+        if entry["width"] is None:
+            return None
+        return entry["width"], entry["height"]
+
+    def refresh(self):
+        """
+        Brings the index up to date with the images under the static directory,
+        reading the headers of new and changed ones and dropping removed ones.
+
+        Returns:
+            The paths of the images whose header was read, sorted.
+        """
+        paths = set()
+        for root, _, names in os.walk(self.static_dir):
+            for name in names:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.add(os.path.join(root, name))
+        read = []
+        for path in sorted(paths):
+            entry = self.images.get(path)
+            self.dimensions(path)
+            if self.images.get(path) is not entry:
+                read.append(path)
+        for path in [path for path in self.images if path not in paths]:
+            del self.images[path]
+            self.changed = True
+        return read
+
+
+class ImageDimensions(UrlRewriter):
+    """
+    Gives the images of markdown pages that show a file under the static directory
+    its width and height, so the browser reserves their space before they load,
+    and has them load lazily and decode off the main thread. URLs are left alone.
+
+    Args:
+        index: The ImageIndex to look sizes up in.
+    """
+
+    key = "image-dimensions"
+
+    def __init__(self, index):
+        self.index = index
+
+    def static_path(self, url):
+        path = local_url_path(url)
+        if not path or os.path.normpath(path).startswith(os.pardir):
+            return None
+        return os.path.join(self.index.static_dir, path)
+
+    def image_attributes(self, url):
+        path = self.static_path(url)
+        size = None if path is None else self.index.dimensions(path)
+        if size is None:
+            return None
+        return {"width": str(size[0]), "height": str(size[1]), "loading": "lazy", "decoding": "async"}
@@ -1,7 +1,12 @@
+import bisect
+import functools
 import re
 from textnode import TextNode, TextType, BlockType
 from htmlnode import HTMLNode, ParentNode, LeafNode, text_node_to_html_node
-import unittest
+
+# Bump whenever a change to the parser or renderer changes the HTML it produces, so
+# pages cached by an older version are parsed again
+PARSER_VERSION = 4
 
 IMAGE_PATTERN = r"!\[([^\[\]]*)\]\(((?:[^()]|\([^\)]*\))*)\)"
 LINK_PATTERN  = r"(?<!!)\[([^\[\]]*)\]\(((?:[^()]|\([^\)]*\))*)\)"
@@ -9,164 +14,368 @@ BOLD_PATTERN = r"\*\*([^*]+)\*\*"
 ITALIC_PATTERN = r"_([^_]+)_"
 CODE_PATTERN = r"`([^`]+)`"
 
-def extract_markdown_images(text):
-    return re.findall(IMAGE_PATTERN, text)
+IMAGE_REGEX = re.compile(IMAGE_PATTERN)
+LINK_REGEX = re.compile(LINK_PATTERN)
+BOLD_REGEX = re.compile(BOLD_PATTERN)
+ITALIC_REGEX = re.compile(ITALIC_PATTERN)
+CODE_REGEX = re.compile(CODE_PATTERN)
 
-def extract_markdown_links(text):
-    return re.findall(LINK_PATTERN, text)
+PAREN_REGEX = re.compile(r"[()]")
+CLOSE_PAREN_REGEX = re.compile(r"\)")
 
-def split_nodes_image(old_nodes):
-    new_nodes = []
-    for old_node in old_nodes:
-        if old_node.text_type != TextType.TEXT:
-            new_nodes.append(old_node)
-            continue
+class _SpanMatch:
+    __slots__ = ("_start", "_end", "_groups")
 
-        text_to_split = old_node.text
-        while True:
-            image_match = re.search(IMAGE_PATTERN, text_to_split)
-            if not image_match:
-                break
+    def __init__(self, start, end, text, url):
+        self._start = start
+        self._end = end
+        self._groups = (text, url)
 
-            alt_text, url = image_match.groups()
-            start, end = image_match.span()
+    def start(self):
+        return self._start
 
-            if start > 0:
-                new_nodes.append(TextNode(text_to_split[:start], TextType.TEXT))
+    def end(self):
+        return self._end
 
-            new_nodes.append(TextNode(alt_text, TextType.IMAGE, url))
-            text_to_split = text_to_split[end:]
+    def span(self):
+        return self._start, self._end
 
-        if text_to_split:
-            new_nodes.append(TextNode(text_to_split, TextType.TEXT))
+    def group(self, index):
+        return self._groups[index - 1]
 
-    return new_nodes
+class UrlSpanFinder:
+    """
+    Finds image or link spans with exactly the results of IMAGE_REGEX or LINK_REGEX,
+    but in time linear in the length of the text.
 
+    The regexes rescan the rest of the text from every "[...](" whose URL is never
+    closed, which is quadratic in text like "[a](" * 10000. Here the URL after each
+    "[...](" is walked one run of non-parenthesis characters or one "(...)" group at
+    a time, and the positions walked from are remembered when no closing ")" is
+    found. Walks are deterministic, so a later walk that reaches one of those
+    positions fails at once.
 
-def split_nodes_link(old_nodes):
+    Args:
+        prefix_pattern: The pattern's part up to and including the "(" opening the URL.
+    """
+
+    def __init__(self, prefix_pattern):
+        self.prefix_regex = re.compile(prefix_pattern)
+
+    def finditer(self, text, pos=0, endpos=None):
+        """
+        Yields match objects like the regex's finditer: start(), end(), span() and
+        group(1) (the text) and group(2) (the URL).
+        """
+        end = len(text) if endpos is None else min(endpos, len(text))
+        failed = set()
+        closes = None
+        while True:
+            prefix = self.prefix_regex.search(text, pos, end)
+            if prefix is None:
+                return
+            url_start = prefix.end()
+            walked = []
+            close = -1
+            state = url_start
+            while state not in failed:
+                walked.append(state)
+                paren = PAREN_REGEX.search(text, state, end)
+                if paren is None:
+                    break
+                paren_start = paren.start()
+                if text[paren_start] == ")":
+                    close = paren_start
+                    break
+                # "(" opens a group that runs to the next ")"
+                if closes is None:
+                    closes = [match.start() for match in CLOSE_PAREN_REGEX.finditer(text, url_start, end)]
+                i = bisect.bisect_right(closes, paren_start)
+                if i == len(closes):
+                    break
+                state = closes[i] + 1
+            if close == -1:
+                failed.update(walked)
+                pos = prefix.start() + 1
+                continue
+            yield _SpanMatch(prefix.start(), close + 1, prefix.group(1), text[url_start:close])
+            pos = close + 1
+
+    def findall(self, text):
+        return [match._groups for match in self.finditer(text)]
+
+IMAGE_FINDER = UrlSpanFinder(r"!\[([^\[\]]*)\]\(")
+LINK_FINDER = UrlSpanFinder(r"(?<!!)\[([^\[\]]*)\]\(")
+
+def extract_markdown_images(text):
+    return IMAGE_FINDER.findall(text)
+
+def extract_markdown_links(text):
+    return LINK_FINDER.findall(text)
+
+# Span types in order of precedence: each one is only looked for in the text
+# left over between the spans of the types before it.
+INLINE_SPANS = [
+    (IMAGE_FINDER, TextType.IMAGE),
+    (LINK_FINDER, TextType.LINK),
+    (CODE_REGEX, TextType.CODE),
+    (BOLD_REGEX, TextType.BOLD),
+    (ITALIC_REGEX, TextType.ITALIC),
+]
+
+def _span_node(match, text_type):
+    if text_type == TextType.IMAGE or text_type == TextType.LINK:
+        return TextNode(match.group(1), text_type, match.group(2))
+    return TextNode(match.group(1), text_type)
+
+def _tokenize_inline(text, start, end, level, nodes):
+    """
+    Appends the nodes for text[start:end] to nodes, looking for span types from
+    INLINE_SPANS[level] onwards. Matching runs on (pos, endpos) windows of the
+    original string, so no slices of the remaining text are ever copied.
+    """
+    if level == len(INLINE_SPANS):
+        nodes.append(TextNode(text[start:end], TextType.TEXT))
+        return
+    regex, text_type = INLINE_SPANS[level]
+    pos = start
+    for match in regex.finditer(text, start, end):
+        if match.start() > pos:
+            _tokenize_inline(text, pos, match.start(), level + 1, nodes)
+        nodes.append(_span_node(match, text_type))
+        pos = match.end()
+    if pos < end:
+        _tokenize_inline(text, pos, end, level + 1, nodes)
+
+def _split_nodes(old_nodes, regex, text_type):
     new_nodes = []
     for old_node in old_nodes:
         if old_node.text_type != TextType.TEXT:
             new_nodes.append(old_node)
             continue
 
-        text_to_split = old_node.text
-        while True:
-            link_match = re.search(LINK_PATTERN, text_to_split)
-            if not link_match:
-                break
-
-            link_text, url = link_match.groups()
-            start, end = link_match.span()
+        text = old_node.text
+        pos = 0
+        for match in regex.finditer(text):
+            start, end = match.span()
+            if start > pos:
+                new_nodes.append(TextNode(text[pos:start], TextType.TEXT))
+            new_nodes.append(_span_node(match, text_type))
+            pos = end
 
-            if start > 0:
-                new_nodes.append(TextNode(text_to_split[:start], TextType.TEXT))
+        if pos < len(text):
+            new_nodes.append(TextNode(text[pos:], TextType.TEXT))
 
-            new_nodes.append(TextNode(link_text, TextType.LINK, url))
-            text_to_split = text_to_split[end:]
+    return new_nodes
 
-        if text_to_split:
-            new_nodes.append(TextNode(text_to_split, TextType.TEXT))
+def split_nodes_image(old_nodes):
+    return _split_nodes(old_nodes, IMAGE_FINDER, TextType.IMAGE)
 
-    return new_nodes
+def split_nodes_link(old_nodes):
+    return _split_nodes(old_nodes, LINK_FINDER, TextType.LINK)
 
 def split_nodes_bold(old_nodes):
-    new_nodes = []
-    for old_node in old_nodes:
-        if old_node.text_type != TextType.TEXT:
-            new_nodes.append(old_node)
-            continue
-        
-        text_to_split = old_node.text
-        while True:
-            bold_match = re.search(BOLD_PATTERN, text_to_split)
-            if not bold_match:
-                break
-            
-            bold_text = bold_match.group(1)
-            start, end = bold_match.span()
-            
-            if start > 0:
-                new_nodes.append(TextNode(text_to_split[:start], TextType.TEXT))
-                
-            new_nodes.append(TextNode(bold_text, TextType.BOLD))
-            text_to_split = text_to_split[end:]
-            
-        if text_to_split:
-            new_nodes.append(TextNode(text_to_split, TextType.TEXT))
-    return new_nodes
+    return _split_nodes(old_nodes, BOLD_REGEX, TextType.BOLD)
 
 def split_nodes_italic(old_nodes):
-    new_nodes = []
-    for old_node in old_nodes:
-        if old_node.text_type != TextType.TEXT:
-            new_nodes.append(old_node)
-            continue
-            
-        text_to_split = old_node.text
-        while True:
-            italic_match = re.search(ITALIC_PATTERN, text_to_split)
-            if not italic_match:
-                break
-            
-            italic_text = italic_match.group(1)
-            start, end = italic_match.span()
-            
-            if start > 0:
-                new_nodes.append(TextNode(text_to_split[:start], TextType.TEXT))
-                
-            new_nodes.append(TextNode(italic_text, TextType.ITALIC))
-            text_to_split = text_to_split[end:]
-            
-        if text_to_split:
-            new_nodes.append(TextNode(text_to_split, TextType.TEXT))
-    return new_nodes
+    return _split_nodes(old_nodes, ITALIC_REGEX, TextType.ITALIC)
 
 def split_nodes_code(old_nodes):
-    new_nodes = []
-    for old_node in old_nodes:
-        if old_node.text_type != TextType.TEXT:
-            new_nodes.append(old_node)
-            continue
-            
-        text_to_split = old_node.text
-        while True:
-            code_match = re.search(CODE_PATTERN, text_to_split)
-            if not code_match:
-                break
-            
-            code_text = code_match.group(1)
-            start, end = code_match.span()
-            
-            if start > 0:
-                new_nodes.append(TextNode(text_to_split[:start], TextType.TEXT))
-            
-            new_nodes.append(TextNode(code_text, TextType.CODE))
-            text_to_split = text_to_split[end:]
-            
-        if text_to_split:
-            new_nodes.append(TextNode(text_to_split, TextType.TEXT))
-    return new_nodes
+    return _split_nodes(old_nodes, CODE_REGEX, TextType.CODE)
 
 def text_to_textnodes(text):
+    """
+    Splits a line of inline markdown into TextNodes in one left-to-right walk.
+
+    Images take precedence over links, links over code, code over bold and bold
+    over italic, exactly as if split_nodes_image, split_nodes_link, split_nodes_code,
+    split_nodes_bold and split_nodes_italic were applied in that order, but each
+    character is only examined once per span type.
+    """
     if not text:
         return [TextNode("", TextType.TEXT)]
-    nodes = [TextNode(text, TextType.TEXT)]
-    nodes = split_nodes_image(nodes)
-    nodes = split_nodes_link(nodes)
-    nodes = split_nodes_code(nodes)
-    nodes = split_nodes_bold(nodes)
-    nodes = split_nodes_italic(nodes)
+    nodes = []
+    _tokenize_inline(text, 0, len(text), 0, nodes)
     return nodes
 
+def _textnodes_tuple(text):
+    return tuple(text_to_textnodes(text))
+
+# LRU cache of inline fragments (see enable_inline_cache), or None when caching is off
+_inline_cache = None
+
+def enable_inline_cache(maxsize=4096):
+    """
+    Turns on a bounded LRU cache of parsed inline fragments, keyed by the exact
+    fragment text, for text_to_children. Repeated lines such as disclaimers, nav
+    lists and shared list items are then tokenized once. Cached results are tuples
+    of immutable TextNodes, so sharing them between pages is safe. Enabling the
+    cache again replaces it with an empty one of the new size.
+
+    Args:
+        maxsize: Number of fragments to keep.
+    """
+    global _inline_cache
+    _inline_cache = functools.lru_cache(maxsize=maxsize)(_textnodes_tuple)
+
+def disable_inline_cache():
+    global _inline_cache
+    _inline_cache = None
+
+def inline_cache_info():
+    """
+    Returns the hits, misses, maxsize and currsize of the inline cache as a
+    functools CacheInfo, or None if the cache is off.
+    """
+    if _inline_cache is None:
+        return None
+    return _inline_cache.cache_info()
+
+# Line kinds of the block parser. Every line is classified once, as it is read, and
+# the kinds of a block's lines fold into the one kind they all share, which types
+# the block; blocks whose lines differ in kind fold to LINE_TEXT
+LINE_TEXT = 0
+LINE_QUOTE = 1  # starts with ">", or holds only whitespace
+LINE_BULLET = 2  # "- " followed by text
+LINE_NUMBERED = 3  # "<n>. " followed by text, where n is the line's position in its block, counting from 1
+
+BLOCK_KIND_TYPES = {
+    LINE_TEXT: BlockType.PARAGRAPH,
+    LINE_QUOTE: BlockType.QUOTE,
+    LINE_BULLET: BlockType.UNORDERED_LIST,
+    LINE_NUMBERED: BlockType.ORDERED_LIST,
+}
+NUMBERED_LINE_REGEX = re.compile(r"(\d+)\. .")
+# Characters other than \n that str.splitlines() breaks lines at. The few blocks
+# holding any are typed by block_to_block_type instead, which splits them that way
+LINE_BREAK_REGEX = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+FENCE = "```"
+
+def item_number(digits):
+    """
+    Returns the number of an ordered list item from its digits, or -1 if it has
+    more than 18 significant digits, which no item's position in a list can have.
+    int() takes time quadratic in the number of digits, and refuses more than 4300.
+    """
+    digits = digits.lstrip("0")
+    if len(digits) > 18:
+        return -1
+    return int(digits or "0")
+
+def _line_kind(line, index):
+    first = line[:1]
+    if first == ">":
+        return LINE_QUOTE
+    if first == "-":
+        return LINE_BULLET if line.startswith("- ") and len(line) > 2 else LINE_TEXT
+    if first.isdecimal():
+        match = NUMBERED_LINE_REGEX.match(line)
+        return LINE_NUMBERED if match and item_number(match.group(1)) == index + 1 else LINE_TEXT
+    if not first or first.isspace():
+        return LINE_TEXT if line.strip() else LINE_QUOTE
+    return LINE_TEXT
+
+def _is_heading(line):
+    level = len(line) - len(line.lstrip("#"))
+    return 1 <= level <= 6 and line[level:level + 1] == " " and len(line) > level + 1
+
+def _typed_block(raw_lines, kind):
+    """
+    Returns the (block, BlockType, lines) of a block from its lines as read and the
+    kind they share, or None if the block is only whitespace. lines is what
+    block.splitlines() returns, or None for blocks that _line_kind cannot type.
+    """
+    block = "\n".join(raw_lines).strip()
+    if not block:
+        return None
+    lines = raw_lines
+    if len(lines) == 1:
+        lines[0] = block
+    else:
+        # Stripping the block strips the start of its first line and the end of its last
+        lines[0] = lines[0].lstrip()
+        lines[-1] = lines[-1].rstrip()
+    if not lines[0] or not lines[-1] or LINE_BREAK_REGEX.search(block):
+        return block, block_to_block_type(block), None
+    # Stripping can only turn a list item into text ("- " becomes "-")
+    if kind >= LINE_BULLET and _line_kind(lines[-1], len(lines) - 1) != kind:
+        kind = LINE_TEXT
+
+    if len(lines) == 1 and block == FENCE * 2:
+        return block, BlockType.CODE, lines
+    if len(lines) >= 2 and lines[0].strip() == FENCE and lines[-1].strip() == FENCE:
+        return block, BlockType.CODE, lines
+    if block[:1] == "#" and _is_heading(lines[0]):
+        return block, BlockType.HEADING, lines
+    return block, BLOCK_KIND_TYPES[kind], lines
+
+def iter_parsed_blocks(lines):
+    """
+    Yields a (block, BlockType, lines) tuple for each block of a markdown document
+    read from an iterable of lines, in one pass: each line is classified once as it
+    is read, and the block's type follows from the kinds of its lines. lines is the
+    block split into lines, as block_to_html_node needs them.
+
+    Blocks are separated by lines holding nothing but spaces and tabs, and each
+    block is stripped of leading and trailing whitespace. A block whose first line
+    is a ``` fence runs on through blank lines up to the next ``` fence line, so
+    code blocks keep their blank lines. As in CommonMark, a fence that is never
+    closed runs to the end of the document, which closes it.
+
+    Args:
+        lines: Iterable of lines, with or without their trailing newline.
+    """
+    raw_lines = []
+    kind = LINE_TEXT
+    # The block opened with a fence whose closing fence has not been read yet
+    fenced = False
+    for line in lines:
+        if line[-1:] == "\n":
+            line = line[:-1]
+        stripped = line.strip(" \t")
+        # A trailing \r is part of the line break of \r\n line endings
+        if not stripped or stripped == "\r" and line[-1] == "\r":
+            if fenced:
+                raw_lines.append(line)
+            elif raw_lines:
+                block = _typed_block(raw_lines, kind)
+                raw_lines = []
+                if block is not None:
+                    yield block
+            continue
+        if not raw_lines:
+            fenced = FENCE in stripped and stripped.strip() == FENCE
+            kind = _line_kind(line.lstrip(), 0)
+        else:
+            if fenced and FENCE in stripped and stripped.strip() == FENCE:
+                fenced = False
+            if kind and _line_kind(line, len(raw_lines)) != kind:
+                kind = LINE_TEXT
+        raw_lines.append(line)
+    if fenced:
+        # The end of the document closes the fence, after the block is stripped
+        while not raw_lines[-1].strip():
+            raw_lines.pop()
+        raw_lines.append(FENCE)
+    if raw_lines:
+        block = _typed_block(raw_lines, kind)
+        if block is not None:
+            yield block
+
+def iter_markdown_blocks(lines):
+    """
+    Yields the blocks of a markdown document one at a time from an iterable of lines,
+    such as an open file, so only the current block is ever held in memory. See
+    iter_parsed_blocks for how blocks are separated.
+
+    Args:
+        lines: Iterable of lines, with or without their trailing newline.
+    """
+    for block, _, _ in iter_parsed_blocks(lines):
+        yield block
+
 def markdown_to_blocks(markdown):
-    # Split on a newline, then any number of whitespace-only lines, then a newline
-    blocks = re.split(r"(?:\r?\n[ \t]*){2,}", markdown)
-    # Strip each block to remove leading/trailing whitespace
-    blocks = [block.strip() for block in blocks]
-    # Filter out empty blocks
-    blocks = [block for block in blocks if block]
-    return blocks
+    return list(iter_markdown_blocks(markdown.split("\n")))
 
 def block_to_block_type(block):
     lines = block.splitlines()
@@ -207,7 +416,7 @@ def block_to_block_type(block):
         for line in lines:
             match = re.match(r"^(\d+)\. .+", line)
             if match:
-                numbers.append(int(match.group(1)))
+                numbers.append(item_number(match.group(1)))
             else:
                 valid_ordered_list = False
                 break
@@ -223,49 +432,149 @@ def block_to_block_type(block):
     # Paragraph
     return BlockType.PARAGRAPH
 
-def text_to_children(text):
-    text_nodes = text_to_textnodes(text)
+def text_to_children(text, url_rewriter=None):
+    text_nodes = text_to_textnodes(text) if _inline_cache is None else _inline_cache(text)
     html_nodes = []
     for text_node in text_nodes:
-        html_nodes.append(text_node_to_html_node(text_node))
+        html_nodes.append(text_node_to_html_node(text_node, url_rewriter))
     return html_nodes
 
-def markdown_to_html_node(markdown):
-    blocks = markdown_to_blocks(markdown)
-    children = []
-    for block in blocks:
-        block_type = block_to_block_type(block)
-        if block_type == BlockType.HEADING:
-            level = block.split(" ")[0].count("#")
-            text = block[level + 1:].strip()
-            children.append(ParentNode(f"h{level}", text_to_children(text)))
-        elif block_type == BlockType.CODE:
-            lines = block.splitlines()
-            code_text = "\n".join(lines[1:-1]) + "\n"
-            children.append(ParentNode("pre", [LeafNode("code", code_text)]))
-        elif block_type == BlockType.QUOTE:
-            lines = block.splitlines()
-            #text = " ".join([line[2:] for line in lines])
-            text = "<br/>".join([line[2:].strip() for line in lines])
-            children.append(ParentNode("blockquote", text_to_children(text)))
-        elif block_type == BlockType.UNORDERED_LIST:
-            list_items = []
-            for line in block.splitlines():
-                text = line[2:]
-                list_items.append(ParentNode("li", text_to_children(text)))
-            children.append(ParentNode("ul", list_items))
-        elif block_type == BlockType.ORDERED_LIST:
-            list_items = []
-            for i, line in enumerate(block.splitlines(), 1):
-                text = line[len(str(i)) + 2:]
-                list_items.append(ParentNode("li", text_to_children(text)))
-            children.append(ParentNode("ol", list_items))
-        else:  # Paragraph
-            text = block.replace('\n', ' ')
-            children.append(ParentNode("p", text_to_children(text)))
+def break_lines(html_nodes):
+    """
+    Returns the leaves with each newline in their text replaced by a <br/> leaf,
+    splitting the leaf around it.
+    """
+    broken = []
+    for node in html_nodes:
+        if "\n" not in node.value:
+            broken.append(node)
+            continue
+        for i, part in enumerate(node.value.split("\n")):
+            if i:
+                broken.append(LeafNode("br", ""))
+            if part:
+                broken.append(LeafNode(node.tag, part, node.props))
+    return broken
+
+def iter_typed_blocks(lines):
+    """
+    Yields (block, BlockType) pairs from an iterable of lines, one block at a time.
+    """
+    for block, block_type, _ in iter_parsed_blocks(lines):
+        yield block, block_type
 
+def block_to_html_node(block, block_type, url_rewriter=None, lines=None):
+    """
+    Returns the HTMLNode of a block. lines, if given, must be block.splitlines(),
+    as iter_parsed_blocks yields it, which saves splitting the block again.
+    """
+    if block_type == BlockType.HEADING:
+        level = block.split(" ")[0].count("#")
+        text = block[level + 1:].strip()
+        return ParentNode(f"h{level}", text_to_children(text, url_rewriter))
+    if block_type == BlockType.PARAGRAPH:
+        text = block.replace('\n', ' ')
+        return ParentNode("p", text_to_children(text, url_rewriter))
+    if lines is None:
+        lines = block.splitlines()
+    if block_type == BlockType.CODE:
+        code_text = "\n".join(lines[1:-1]) + "\n"
+        return ParentNode("pre", [LeafNode("code", code_text)])
+    if block_type == BlockType.QUOTE:
+        #text = " ".join([line[2:] for line in lines])
+        text = "\n".join([line[2:].strip() for line in lines])
+        return ParentNode("blockquote", break_lines(text_to_children(text, url_rewriter)))
+    if block_type == BlockType.UNORDERED_LIST:
+        list_items = []
+        for line in lines:
+            text = line[2:]
+            list_items.append(ParentNode("li", text_to_children(text, url_rewriter)))
+        return ParentNode("ul", list_items)
+    if block_type == BlockType.ORDERED_LIST:
+        list_items = []
+        for i, line in enumerate(lines, 1):
+            text = line[len(str(i)) + 2:]
+            list_items.append(ParentNode("li", text_to_children(text, url_rewriter)))
+        return ParentNode("ol", list_items)
+    raise ValueError(f"Unknown block type: {block_type}")
+
+def markdown_to_html_node(markdown, url_rewriter=None):
+    children = []
+    for block, block_type, lines in iter_parsed_blocks(markdown.split("\n")):
+        children.append(block_to_html_node(block, block_type, url_rewriter, lines))
     return ParentNode("div", children)
 
+class MarkdownStream:
+    """
+    Renders markdown read from an iterable of lines as the same <div> that
+    markdown_to_html_node produces, parsing and writing one block at a time.
+    Memory use is bounded by the largest block rather than the whole document.
+
+    If a StageClock is given, time is attributed to the "split", "inline" and
+    "render" stages as each block goes through them. If a UrlRewriter is given,
+    it rewrites the URLs of links and images as they are rendered. If on_block is
+    given, it is called with the BlockType and HTMLNode of every block, such as to
+    collect the page's search terms.
+    """
+
+    def __init__(self, lines, clock=None, url_rewriter=None, on_block=None):
+        self.lines = lines
+        self.clock = clock
+        self.url_rewriter = url_rewriter
+        self.on_block = on_block
+
+    def render_to(self, writer):
+        if self.clock is not None:
+            return self._render_to_timed(writer)
+        wrote_block = False
+        writer.write("<div>")
+        for block, block_type, lines in iter_parsed_blocks(self.lines):
+            node = block_to_html_node(block, block_type, self.url_rewriter, lines)
+            if self.on_block is not None:
+                self.on_block(block_type, node)
+            node.render_to(writer)
+            wrote_block = True
+        if not wrote_block:
+            raise ValueError("A ParentNode must have children.")
+        writer.write("</div>")
+
+    def _render_to_timed(self, writer):
+        clock = self.clock
+        blocks = iter_parsed_blocks(self.lines)
+        wrote_block = False
+        writer.write("<div>")
+        while True:
+            with clock.stage("split"):
+                item = next(blocks, None)
+            if item is None:
+                break
+            with clock.stage("inline"):
+                block, block_type, lines = item
+                node = block_to_html_node(block, block_type, self.url_rewriter, lines)
+                if self.on_block is not None:
+                    self.on_block(item[1], node)
+            with clock.stage("render"):
+                node.render_to(writer)
+            wrote_block = True
+        if not wrote_block:
+            raise ValueError("A ParentNode must have children.")
+        writer.write("</div>")
+
+def read_title_lines(lines):
+    """
+    Reads just enough lines from an iterator for extract_title to decide on the
+    document's title, and returns them as a list. Usually that is the first line;
+    a bare "#" line also takes in the lines up to the next non-blank one.
+    """
+    title_lines = []
+    for line in lines:
+        title_lines.append(line)
+        # Only the new line can hold the first non-whitespace after the "#", so the
+        # lines read so far are never joined again
+        if not title_lines[0].startswith("#") or (line[1:] if len(title_lines) == 1 else line).strip():
+            break
+    return title_lines
+
 def extract_title(markdown):
     """
     Extracts the h1 header from a markdown string.
@@ -1,39 +1,37 @@
 from textnode import TextNode, TextType
 import os
 import shutil
-from inline_markdown import markdown_to_html_node, extract_title  # Import from inline_markdown
+from inline_markdown import PARSER_VERSION, MarkdownStream, extract_title, read_title_lines, enable_inline_cache, inline_cache_info  # Import from inline_markdown
+from htmlnode import escape_attribute
 import sys
+import argparse
+import contextlib
+import io
+import itertools
+import multiprocessing
+from manifest import BuildManifest, OutputChanges, MANIFEST_PATH, CHANGES_PATH, hash_bytes, hash_file, files_equal
+from template import load_template
+from static_sync import sync_static, sync_static_paths, remove_empty_dirs
+from watch import watch
+from parse_cache import ParseCache, CachingContent, DEFAULT_MAX_BYTES
+from urls import PrefixRewriter, site_url_rewriter
+from depgraph import DependencyGraph, ReferenceCollector, DEPGRAPH_PATH
+from image_meta import ImageIndex, ImageDimensions, IMAGE_INDEX_PATH
+from search_index import SearchIndex, TermCollector, SEARCH_PAGES_PATH, page_url
+from profiler import Profiler, TimedWriter, timed_lines, NULL_CLOCK
+from pipeline import PAGES_PER_TASK, BATCHES_PER_WORKER, batched, imap_window
+from spill import KeyLog
+import time
 
-def recursive_copy(source_dir, dest_dir):
-    """
-    Recursively copies the contents of the source directory to the destination directory,
-    excluding Zone.Identifier files.
-    Deletes the destination directory's contents beforehand.
-    """
-    if os.path.exists(dest_dir):
-        print(f"Deleting existing destination directory: {dest_dir}")
-        shutil.rmtree(dest_dir)
-
-    print(f"Creating destination directory: {dest_dir}")
-    os.makedirs(dest_dir)
-
-    for item in os.listdir(source_dir):
-        source_item = os.path.join(source_dir, item)
-        dest_item = os.path.join(dest_dir, item)
-
-        if item.endswith(":Zone.Identifier"):
-            print(f"Skipping file: {source_item}")
-            continue
-
-        if os.path.isfile(source_item):
-            print(f"Copying file: {source_item} to {dest_item}")
-            shutil.copy2(source_item, dest_item)  # copy2 preserves metadata
-        elif os.path.isdir(source_item):
-            print(f"Copying directory: {source_item} to {dest_item}")
-            recursive_copy(source_item, dest_item)
-
+CONTENT_DIR = "content"
+STATIC_DIR = "static"
+TEMPLATE_PATH = "template.html"
+DEST_DIR = "docs"
+PROFILE_PATH = os.path.join(".build", "trace.json")
+SHARDS_DIR = "shards"
 
-def generate_page(from_path, template_path, dest_path, basepath):
+def generate_page(from_path, template_path, dest_path, basepath, profiler=None, cache=None, rewriters=(),
+                  search_terms=None, references=None, source_hash=None):
     """
     Generates an HTML page from a markdown file, a template, and a destination path.
 
@@ -42,117 +40,884 @@ def generate_page(from_path, template_path, dest_path, basepath):
         template_path: Path to the HTML template file.
         dest_path: Path to write the generated HTML file.
         basepath: The base path for the site (e.g., "/", "/blog").
+        profiler: Optional Profiler that records how long each stage of the page took.
+        cache: Optional ParseCache; a page whose markdown is cached skips parsing.
+        rewriters: UrlRewriters, such as a CDN prefix for images, applied to link,
+            image and template URLs before the basepath.
+        search_terms: Optional dict; if given, the page's title and search terms are
+            stored in it under from_path as {"title": ..., "terms": [...]}.
+        references: Optional dict; if given, the image and link URLs of the page are
+            stored in it under from_path as {"images": [...], "links": [...]}, as
+            collected while the page is rendered (see depgraph.ReferenceCollector).
+        source_hash: The hash_file of from_path, if already known, which the page is
+            looked up in the cache by. It is computed when needed otherwise.
+
+    Returns:
+        "added", "changed" or "unchanged" (see write_page) if the page was generated,
+        or False if an error was reported.
     """
-    print(f"Generating page from {from_path} to {dest_path} using {template_path} with basepath {basepath}")
+    url_rewriter = site_url_rewriter(basepath, rewriters)
+    if profiler is None:
+        return _generate_page(from_path, template_path, dest_path, basepath, url_rewriter, None, cache, search_terms,
+                              references, source_hash)
+    with profiler.page(from_path) as clock:
+        return _generate_page(from_path, template_path, dest_path, basepath, url_rewriter, clock, cache, search_terms,
+                              references, source_hash)
 
-    # Read the markdown file
-    try:
-        with open(from_path, "r") as f:
-            markdown_content = f.read()
-    except FileNotFoundError:
-        print(f"Error: Markdown file not found at {from_path}")
-        return
-    except Exception as e:
-        print(f"Error reading markdown file: {e}")
-        return
 
-    # Read the template file
+def _generate_page(from_path, template_path, dest_path, basepath, url_rewriter, clock=None, cache=None,
+                   search_terms=None, references=None, source_hash=None):
+    print(f"Generating page from {from_path} to {dest_path} using {template_path} with basepath {basepath}")
+
+    # Load the compiled template with its URLs rewritten, read once per build and shared by every page
     try:
-        with open(template_path, "r") as f:
-            template_content = f.read()
+        template = load_template(template_path, url_rewriter)
     except FileNotFoundError:
         print(f"Error: Template file not found at {template_path}")
-        return
+        return False
     except Exception as e:
         print(f"Error reading template file: {e}")
-        return
+        return False
 
-    # Convert markdown to HTML
+    # Open the markdown file, which is read line by line while the page is written
     try:
-        html_content = markdown_to_html_node(markdown_content).to_html()
+        with (clock or NULL_CLOCK).stage("read"):
+            markdown_file = open(from_path, "r")
+    except FileNotFoundError:
+        print(f"Error: Markdown file not found at {from_path}")
+        return False
     except Exception as e:
-        print(f"Error converting markdown to HTML: {e}")
-        return
+        print(f"Error reading markdown file: {e}")
+        return False
 
-    # Extract the title
-    try:
-        title = extract_title(markdown_content)
-    except ValueError:
-        title = "Default Title" #provide a default title to prevent the program from crashing
+    with markdown_file:
+        key = None
+        if cache is not None:
+            # The file is hashed in chunks, so the page is still read line by line on a miss
+            try:
+                with (clock or NULL_CLOCK).stage("read"):
+                    key = cache.key(source_hash or hash_file(from_path), url_rewriter)
+                    cached = cache.get(key, url_rewriter)
+            except OSError as e:
+                print(f"Error reading markdown file: {e}")
+                return False
+            # Entries cached without search terms or references are parsed again when those are needed
+            if (cached is not None and (search_terms is None or cached[2] is not None)
+                    and (references is None or cached[3] is not None)):
+                print(f"Using cached parse of {from_path}")
+                title, body, terms, page_references = cached
+                if search_terms is not None:
+                    search_terms[from_path] = {"title": title, "terms": terms}
+                if references is not None:
+                    references[from_path] = page_references
+                try:
+                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                    status = write_page(template, title, body, dest_path, clock)
+                except OSError as e:
+                    print(f"Error writing to destination file: {e}")
+                    return False
+                print(page_status_message(status, dest_path))
+                return status
+        lines = iter(markdown_file) if clock is None else timed_lines(markdown_file, clock)
 
-    # Replace placeholders in the template
-    try:
-        output_content = template_content.replace("{{ Title }}", title).replace("{{ Content }}", html_content)
-    except Exception as e:
-        print(f"Error replacing placeholders in template: {e}")
-        return
+        # Extract the title from the first line(s)
+        try:
+            title_lines = read_title_lines(lines)
+        except Exception as e:
+            print(f"Error reading markdown file: {e}")
+            return False
+        try:
+            title = extract_title("".join(title_lines))
+        except ValueError:
+            title = "Default Title" #provide a default title to prevent the program from crashing
+
+        # Convert the markdown block by block, streaming the filled-in template into the destination file
+        try:
+            # Create any necessary directories
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            collector = TermCollector() if cache is not None or search_terms is not None else None
+            # Links and images are recorded as they are rendered, so the page is never read a second time
+            page_references = ReferenceCollector(url_rewriter) if cache is not None or references is not None else None
+            content = MarkdownStream(itertools.chain(title_lines, lines), clock,
+                                     url_rewriter if page_references is None else page_references,
+                                     None if collector is None else collector.add_block)
+            if cache is not None:
+                content = CachingContent(content)
+            status = write_page(template, title, content, dest_path, clock)
+        except UnicodeDecodeError as e:
+            print(f"Error reading markdown file: {e}")
+            return False
+        except OSError as e:
+            print(f"Error writing to destination file: {e}")
+            return False
+        except Exception as e:
+            print(f"Error converting markdown to HTML: {e}")
+            return False
 
-    # Replace href="/ and src="/ with href="{basepath} and src="{basepath}
-    output_content = output_content.replace('href="/', f'href="{basepath}')
-    output_content = output_content.replace('src="/', f'src="{basepath}')
+    terms = None if collector is None else collector.sorted_terms()
+    if search_terms is not None:
+        search_terms[from_path] = {"title": title, "terms": terms}
+    page_references = None if page_references is None else page_references.references()
+    if references is not None:
+        references[from_path] = page_references
+    if cache is not None and content.body() is not None:
+        try:
+            cache.put(key, title, content.body(), terms, page_references, url_rewriter)
+        except OSError as e:
+            print(f"Warning: could not cache parse of {from_path}: {e}")
 
+    print(page_status_message(status, dest_path))
+    return status
 
-    # Write the output to the destination file
+
+def page_status_message(status, dest_path):
+    if status == "unchanged":
+        return f"Successfully generated page at {dest_path} (unchanged, not rewritten)"
+    return f"Successfully generated page at {dest_path}"
+
+def write_page(template, title, content, dest_path, clock=None):
+    """
+    Renders the template with the page's title and content straight into dest_path.
+    The title is escaped as an attribute value, so templates may use it in text and
+    in attributes alike. The page is written to a temporary file first, so a failed render never leaves a
+    truncated page behind. If the result is byte for byte the same as the existing
+    file, that file is left untouched, mtime and all, so uploaders skip it.
+
+    Returns:
+        "added" if dest_path did not exist, "changed" if it was replaced, or
+        "unchanged" if it already held the same page.
+    """
+    timer = clock or NULL_CLOCK
+    tmp_path = f"{dest_path}.tmp"
     try:
-        # Create any necessary directories
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        with timer.stage("write"):
+            f = open(tmp_path, "w")
+        try:
+            writer = f if clock is None else TimedWriter(f, clock)
+            template.render_to(writer, Title=escape_attribute(title), Content=content)
+        finally:
+            with timer.stage("write"):
+                f.close()
+        with timer.stage("write"):
+            if files_equal(tmp_path, dest_path):
+                os.remove(tmp_path)
+                return "unchanged"
+            status = "changed" if os.path.exists(dest_path) else "added"
+            os.replace(tmp_path, dest_path)
+            return status
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-        with open(dest_path, "w") as f:
-            f.write(output_content)
-    except Exception as e:
-        print(f"Error writing to destination file: {e}")
-        return
 
-    print(f"Successfully generated page at {dest_path}")
+def page_dest_path(relative_path, dest_dir_path):
+    """
+    Returns the output path for a markdown file, given its path relative to the
+    content directory.
+    """
+    html_file_name = os.path.splitext(relative_path)[0] + ".html"
+    return os.path.join(dest_dir_path, html_file_name)
+
+
+def parse_shard(text):
+    """
+    Parses a shard written as "i/N", such as "2/4" for the second of four shards,
+    into an (index, count) tuple. Shards are numbered from 1.
+
+    Raises:
+        ValueError: If text is not of that form or the index is not between 1 and N.
+    """
+    index, separator, count = text.partition("/")
+    if not separator or not index.strip().isdigit() or not count.strip().isdigit():
+        raise ValueError(f"A shard is written as i/N, such as 2/4, not {text!r}")
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise ValueError(f"There is no shard {index}/{count}: shards are numbered from 1 to {count}")
+    return index, count
+
+
+def page_shard(relative_path, count):
+    """
+    Returns the shard, from 1 to count, that builds a page, given its path relative
+    to the content directory. The path is hashed with "/" separators, so every
+    machine puts every page in the same shard without talking to the others.
+    """
+    digest = hash_bytes(relative_path.replace(os.sep, "/").encode("utf-8"))
+    return int(digest[:16], 16) % count + 1
+
 
-def generate_pages_recursive(dir_path_content, template_path, dest_dir_path, basepath):
+def shard_dir(shard):
+    """
+    Returns the directory a shard build writes to, such as "shards/2-of-4" for shard
+    (2, 4). It is laid out like the site root: the shard's pages go to docs/ in it and
+    its manifest, dependency graph, image index, search terms and output changes to
+    .build/.
+    """
+    return os.path.join(SHARDS_DIR, f"{shard[0]}-of-{shard[1]}")
+
+
+def generate_pages_recursive(dir_path_content, template_path, dest_dir_path, basepath, manifest=None,
+                             jobs=1, deterministic=False, profiler=None, cache=None, rewriters=(), graph=None,
+                             invalidated=(), changes=None, search=None, shard=None):
     """
     Crawls the content directory and generates a new .html file for each markdown file,
     using the specified template. The generated pages are written to the docs directory
     in the same directory structure.
 
+    When a build manifest is given, only pages whose source, template, URL settings or parser version changed
+    since the last build, or that are listed in invalidated, are re-rendered, and outputs of
+    deleted sources are removed. When a DependencyGraph is given, the edges of every
+    generated page, collected while it is rendered, are recorded in it, pages it does
+    not know yet are generated even if they are current, and deleted pages are
+    dropped from it.
+
+    Pages are discovered, generated and recorded one at a time rather than listed up
+    front, and the content directory is walked in sorted order, the order the
+    manifest, graph and search index keep their pages on disk in, so the build
+    reads and updates them alongside the walk; the memory a build needs does not
+    grow with the size of the site (see pipeline).
+
     Args:
         dir_path_content: Path to the content directory containing markdown files.
         template_path: Path to the HTML template file.
         dest_dir_path: Path to the destination directory (e.g., "docs").
         basepath: The base path for the site (e.g., "/", "/blog").
+        manifest: Optional BuildManifest from the previous build.
+        jobs: Number of worker processes to render pages with (0 means one per CPU).
+        deterministic: Print the log of every page in walk order, even when
+            rendering in parallel.
+        profiler: Optional Profiler that records per-page, per-stage timings.
+        cache: Optional ParseCache of previously parsed markdown.
+        rewriters: UrlRewriters applied before the basepath, such as a CDN prefix.
+        graph: Optional DependencyGraph, updated in place.
+        invalidated: Markdown paths to re-render even if the manifest says they are current,
+            such as the pages that show a changed image.
+        changes: Optional OutputChanges that added, changed and removed pages are recorded in.
+        search: Optional SearchIndex; the terms of every generated page are recorded in it,
+            and pages it does not know yet are generated even if they are current.
+        shard: Optional (index, count) tuple (see parse_shard). Only the pages page_shard
+            assigns to that shard are generated; the others are left out of the manifest,
+            graph and search index as if they did not exist.
+
+    Returns:
+        A list of the markdown paths that failed to generate.
     """
+    rebuild_all = True
+    if manifest is not None:
+        template_hash = hash_file(template_path)
+        url_rewriters = ";".join(rewriter.key for rewriter in rewriters) or None
+        rebuild_all = manifest.settings_changed(template_hash, basepath, url_rewriters, PARSER_VERSION)
+        if rebuild_all:
+            print("Template, URL settings or parser version changed, regenerating all pages")
+        manifest.template_hash = template_hash
+        manifest.basepath = basepath
+        manifest.url_rewriters = url_rewriters
+        manifest.parser_version = PARSER_VERSION
+        manifest.shard = None if shard is None else list(shard)
+
+    invalidated = set(invalidated)
+    # Only needed to find deleted pages, which only matters when there is state to update
+    seen = KeyLog() if manifest is not None or graph is not None or search is not None else None
+    search_terms = None if search is None else {}
+    references = None if graph is None else {}
+    pending = discover_pages(dir_path_content, dest_dir_path, manifest, rebuild_all, invalidated, graph, search,
+                             seen, shard)
+    # tee buffers only the pages generate_pages has pulled but not yet returned a result for
+    pending, recorded = itertools.tee(pending)
+    page_paths = (page[1:] for page in pending)
+
+    # Generate the pages, recording each one as its result comes back
+    failed = []
+    generated = 0
+    unchanged = 0
+    results = generate_pages(page_paths, template_path, basepath, jobs, deterministic, profiler, cache, rewriters,
+                             search_terms, references)
+    for ok, (relative_path, md_file_path, html_dest_path, source_hash) in zip(results, recorded):
+        generated += 1
+        if not ok:
+            failed.append(md_file_path)
+        else:
+            unchanged += ok == "unchanged"
+            if changes is not None:
+                changes.record(html_dest_path, ok)
+        if search is not None:
+            record_search_terms(search, search_terms, md_file_path, html_dest_path, dest_dir_path)
+        if graph is not None:
+            record_references(graph, references, md_file_path, template_path)
+        if manifest is None:
+            continue
+        if ok:
+            manifest.record_page(relative_path, source_hash, html_dest_path)
+        else:
+            # Forget failed pages so the next build retries them
+            manifest.forget_page(relative_path)
 
-    for root, _, files in os.walk(dir_path_content):
+    if manifest is not None:
+        remove_stale_pages(manifest, seen, dest_dir_path, changes)
+    if graph is not None:
+        graph.prune(os.path.join(dir_path_content, source) for source in seen)
+    if search is not None:
+        search.prune(os.path.join(dir_path_content, source) for source in seen)
+    if seen is not None:
+        seen.close()
+
+    print(f"Generated {generated - len(failed)} of {generated} pages, {len(failed)} failed"
+          + (f", {unchanged} unchanged and not rewritten" if unchanged else ""))
+    for md_file_path in failed:
+        print(f"Failed to generate page from {md_file_path}")
+    return failed
+
+
+def discover_pages(dir_path_content, dest_dir_path, manifest, rebuild_all, invalidated, graph, search, seen,
+                   shard=None):
+    """
+    Walks the content directory in sorted order (see spill.walk_key) and yields a
+    (relative path, markdown path, output path, source hash) tuple for each page
+    that has to be generated, one at a time. Pages the manifest says are current
+    are skipped here, unless the search index or the dependency graph does not know
+    them yet. The source hash is None without a manifest. Every markdown path
+    walked is appended to seen, a KeyLog, relative to the content directory, unless
+    seen is None. With a shard, pages of other shards are not walked at all.
+    """
+    for root, dirs, files in os.walk(dir_path_content):
+        # The manifest, graph and search index are read in this order
+        dirs.sort()
+        files.sort()
+        # Calculate the relative path from the content directory once per directory
+        relative_root = os.path.relpath(root, dir_path_content)
         for file in files:
             if file.endswith(".md"):
                 # Construct the full paths
+                relative_path = file if relative_root == "." else os.path.join(relative_root, file)
+                if shard is not None and page_shard(relative_path, shard[1]) != shard[0]:
+                    continue
                 md_file_path = os.path.join(root, file)
 
-                # Calculate the relative path from the content directory
-                relative_path = os.path.relpath(md_file_path, dir_path_content)
-
                 # Construct the destination path in the docs directory
-                html_file_name = os.path.splitext(relative_path)[0] + ".html"
-                html_dest_path = os.path.join(dest_dir_path, html_file_name)
+                html_dest_path = page_dest_path(relative_path, dest_dir_path)
+
+                if seen is not None:
+                    seen.append(relative_path)
+                source_hash = None
+                if manifest is not None:
+                    source_hash = hash_file(md_file_path)
+                    if (not rebuild_all and md_file_path not in invalidated
+                            and (search is None or md_file_path in search.pages)
+                            and (graph is None or graph.dependencies(md_file_path) is not None)
+                            and manifest.is_page_current(relative_path, source_hash, html_dest_path)):
+                        print(f"Skipping unchanged page {md_file_path}")
+                        continue
+
+                yield relative_path, md_file_path, html_dest_path, source_hash
+
+
+def record_search_terms(search, search_terms, md_file_path, html_dest_path, dest_dir_path):
+    """
+    Moves the terms generate_page collected for a page into the SearchIndex, or
+    drops the page from the index if it failed to generate.
+    """
+    page = search_terms.pop(md_file_path, None)
+    if page is None:
+        search.forget_page(md_file_path)
+    else:
+        search.record_page(md_file_path, page_url(html_dest_path, dest_dir_path), page["title"], page["terms"])
+
+
+def record_references(graph, references, md_file_path, template_path):
+    """
+    Moves the references generate_page collected for a page into the
+    DependencyGraph as its edges, or drops the page from the graph if it failed to
+    generate.
+    """
+    page = references.pop(md_file_path, None)
+    if page is None:
+        graph.forget_page(md_file_path)
+    else:
+        graph.record_references(md_file_path, template_path, page["images"], page["links"])
+
 
-                # Generate the page
-                generate_page(md_file_path, template_path, html_dest_path, basepath)
+def generate_pages(page_paths, template_path, basepath, jobs=1, deterministic=False, profiler=None, cache=None,
+                   rewriters=(), search_terms=None, references=None):
+    """
+    Generates pages, either in this process or across a pool of worker processes,
+    and yields the result of generate_page for each one.
+
+    page_paths is consumed lazily: pages are pulled only a bounded number ahead of
+    the results yielded (see pipeline.imap_window), so a build streams through any
+    number of pages in the same memory. Workers are sent PAGES_PER_TASK pages at a
+    time, which keeps IPC overhead low.
+
+    Workers capture the output of generate_page and hand it back so every page's log
+    is printed in one piece. In deterministic mode both the log and the results come
+    back in the order of page_paths; otherwise logs are printed as pages finish, but
+    results are still yielded in the order of page_paths. If the inline cache is on,
+    its hit rate over these pages is printed once they are all generated.
+
+    Args:
+        page_paths: Iterable of (markdown path, destination path, source hash) tuples;
+            the source hash (see generate_page) may be None.
+        template_path: Path to the HTML template file.
+        basepath: The base path for the site.
+        jobs: Number of worker processes (0 means one per CPU, 1 renders serially).
+        deterministic: Print page logs in input order.
+        profiler: Optional Profiler; workers profile their pages and send the spans back.
+        cache: Optional ParseCache shared by every worker.
+        rewriters: UrlRewriters applied before the basepath.
+        search_terms: Optional dict that every page's title and search terms are stored
+            in, as by generate_page; workers send them back with their results.
+        references: Optional dict that every page's image and link URLs are stored in,
+            as by generate_page; workers send them back with their results.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    page_paths = iter(page_paths)
+    # Look ahead far enough to know whether there are enough pages for every worker
+    first_pages = list(itertools.islice(page_paths, jobs))
+    jobs = min(jobs, len(first_pages))
+    page_paths = itertools.chain(first_pages, page_paths)
+
+    inline_cache = inline_cache_info()
+    if jobs <= 1:
+        for from_path, dest_path, source_hash in page_paths:
+            yield generate_page(from_path, template_path, dest_path, basepath, profiler, cache, rewriters, search_terms,
+                                references, source_hash)
+        if inline_cache is not None:
+            after = inline_cache_info()
+            report_inline_cache(after.hits - inline_cache.hits, after.misses - inline_cache.misses)
+        return
+
+    profile = profiler is not None
+    tasks = ((from_path, template_path, dest_path, basepath, profile, cache, rewriters, search_terms is not None,
+              references is not None, source_hash)
+             for from_path, dest_path, source_hash in page_paths)
+    # Workers start with an empty inline cache of the same size as this process's
+    initializer, initargs = (enable_inline_cache, (inline_cache.maxsize,)) if inline_cache else (None, ())
+    worker_caches = {}
+
+    def print_logs(batch):
+        for _, log, _, _, _ in batch["pages"]:
+            print(log, end="")
+
+    with multiprocessing.Pool(jobs, initializer, initargs) as pool:
+        batches = imap_window(pool, _generate_pages_captured, batched(tasks, PAGES_PER_TASK),
+                              jobs * BATCHES_PER_WORKER, None if deterministic else print_logs)
+        for batch in batches:
+            if deterministic:
+                print_logs(batch)
+            worker_caches[batch["worker"]] = batch["inline_cache"]
+            for ok, _, events, terms, page_references in batch["pages"]:
+                if terms:
+                    search_terms.update(terms)
+                if page_references:
+                    references.update(page_references)
+                if profile:
+                    profiler.add_events(events)
+                yield ok
+    if inline_cache is not None:
+        report_inline_cache(sum(hits for hits, _ in worker_caches.values()),
+                            sum(misses for _, misses in worker_caches.values()))
+
+
+def report_inline_cache(hits, misses):
+    lookups = hits + misses
+    if lookups:
+        print(f"Inline cache: {hits} hits, {misses} misses ({hits / lookups:.0%} hit rate)")
+
+
+def _generate_pages_captured(tasks):
+    """
+    Worker entry point: runs generate_page for a batch of pages with the output of
+    each captured.
+    """
+    pages = []
+    for (from_path, template_path, dest_path, basepath, profile, cache, rewriters, collect_terms,
+         collect_references, source_hash) in tasks:
+        profiler = Profiler() if profile else None
+        search_terms = {} if collect_terms else None
+        references = {} if collect_references else None
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            try:
+                ok = generate_page(from_path, template_path, dest_path, basepath, profiler, cache, rewriters,
+                                   search_terms, references, source_hash)
+            except Exception as e:
+                print(f"Error generating page from {from_path}: {e}")
+                ok = False
+        pages.append((ok, log.getvalue(), profiler.events if profile else None, search_terms, references))
+    # CacheInfo does not pickle, so only its counts are sent back
+    inline_cache = inline_cache_info()
+    inline_counts = (inline_cache.hits, inline_cache.misses) if inline_cache else None
+    return {"pages": pages, "worker": os.getpid(), "inline_cache": inline_counts}
+
+
+def remove_stale_pages(manifest, seen_sources, dest_dir_path, changes=None):
+    """
+    Deletes the outputs of pages whose markdown source no longer exists and drops
+    them from the manifest. seen_sources are the sources that exist, relative to
+    the content directory and in walk order, such as the KeyLog discover_pages
+    fills.
+    """
+    manifest.pages.prune(seen_sources,
+                         lambda source, entry: remove_output(source, entry, dest_dir_path, changes))
+
+
+def remove_page(manifest, source, dest_dir_path, changes=None):
+    """
+    Deletes the output of a page whose markdown source was removed, along with any
+    directories under dest_dir_path that leaves empty, and drops it from the
+    manifest, recording the deletion in changes if given.
+    """
+    entry = manifest.forget_page(source)
+    if entry is not None:
+        remove_output(source, entry, dest_dir_path, changes)
+
+
+def remove_output(source, entry, dest_dir_path, changes=None):
+    """
+    Deletes the output a manifest entry records for a removed page, as remove_page
+    does, once the entry is out of the manifest.
+    """
+    if os.path.exists(entry["output"]):
+        print(f"Removing page for deleted source {source}: {entry['output']}")
+        os.remove(entry["output"])
+        remove_empty_dirs(os.path.dirname(entry["output"]), dest_dir_path)
+        if changes is not None:
+            changes.record(entry["output"], "deleted")
+
+
+def rebuild_changed(changed_paths, manifest, basepath, hash_static=False, cache=None, rewriters=(), graph=None,
+                    changes=None, search=None):
+    """
+    Brings docs up to date after the given files changed, doing only the work those
+    changes require: changed or deleted markdown files rebuild or remove their own
+    page, changed static files are synced one by one, and a template change
+    re-renders every page without touching static files. With a DependencyGraph,
+    the pages that show a changed static file are re-rendered too.
+
+    Args:
+        changed_paths: Paths reported by the watcher.
+        manifest: The BuildManifest of the running build, updated in place.
+        basepath: The base path for the site.
+        hash_static: Compare static files by content when their size or mtime differ.
+        cache: Optional ParseCache of previously parsed markdown.
+        rewriters: UrlRewriters applied before the basepath.
+        graph: Optional DependencyGraph of the running build, updated in place.
+        changes: Optional OutputChanges that changed outputs are recorded in.
+        search: Optional SearchIndex of the running build, updated and rewritten.
+
+    Returns:
+        A list of the markdown paths that failed to generate.
+    """
+    template_changed = False
+    rescan_content = False
+    rescan_static = False
+    pages = set()
+    static_files = set()
+    for path in changed_paths:
+        path = os.path.relpath(path)
+        if path == os.path.normpath(TEMPLATE_PATH):
+            template_changed = True
+        elif path.startswith(CONTENT_DIR + os.sep):
+            if path.endswith(".md"):
+                pages.add(os.path.relpath(path, CONTENT_DIR))
+            elif os.path.isdir(path) or not os.path.exists(path):
+                # A directory was moved or deleted, so look for what it held
+                rescan_content = True
+        elif path.startswith(STATIC_DIR + os.sep):
+            if os.path.isdir(path):
+                rescan_static = True
+            else:
+                static_files.add(os.path.relpath(path, STATIC_DIR))
+        elif path in (CONTENT_DIR, STATIC_DIR):
+            rescan_content = rescan_content or path == CONTENT_DIR
+            rescan_static = rescan_static or path == STATIC_DIR
+
+    synced = None
+    previous_static_files = manifest.static_files
+    if rescan_static:
+        synced = sync_static(STATIC_DIR, DEST_DIR, manifest.static_files, use_hash=hash_static)
+        manifest.static_files = synced["files"]
+    elif static_files:
+        synced = sync_static_paths(STATIC_DIR, DEST_DIR, static_files, manifest.static_files, use_hash=hash_static)
+        manifest.static_files = synced["files"]
+    if changes is not None and synced is not None:
+        changes.record_static(synced, previous_static_files)
+    invalidated = pages_using_static(graph, synced)
+
+    if template_changed or rescan_content:
+        # The manifest notices the new template hash and re-renders every page
+        failed = generate_pages_recursive(CONTENT_DIR, TEMPLATE_PATH, DEST_DIR, basepath, manifest, cache=cache,
+                                          rewriters=rewriters, graph=graph, invalidated=invalidated, changes=changes,
+                                          search=search)
+    else:
+        failed = []
+        pages |= {os.path.relpath(md_file_path, CONTENT_DIR) for md_file_path in invalidated}
+        for relative_path in sorted(pages):
+            md_file_path = os.path.join(CONTENT_DIR, relative_path)
+            html_dest_path = page_dest_path(relative_path, DEST_DIR)
+            if not os.path.exists(md_file_path):
+                remove_page(manifest, relative_path, DEST_DIR, changes)
+                if graph is not None:
+                    graph.forget_page(md_file_path)
+                if search is not None:
+                    search.forget_page(md_file_path)
+                continue
+            source_hash = hash_file(md_file_path)
+            if md_file_path not in invalidated and manifest.is_page_current(relative_path, source_hash, html_dest_path):
+                continue
+            search_terms = None if search is None else {}
+            references = None if graph is None else {}
+            status = generate_page(md_file_path, TEMPLATE_PATH, html_dest_path, basepath, cache=cache,
+                                   rewriters=rewriters, search_terms=search_terms, references=references,
+                                   source_hash=source_hash)
+            if search is not None:
+                record_search_terms(search, search_terms, md_file_path, html_dest_path, DEST_DIR)
+            if graph is not None:
+                record_references(graph, references, md_file_path, TEMPLATE_PATH)
+            if status:
+                manifest.record_page(relative_path, source_hash, html_dest_path)
+                if changes is not None:
+                    changes.record(html_dest_path, status)
+            else:
+                failed.append(md_file_path)
+                manifest.forget_page(relative_path)
+    if cache is not None:
+        # Walking the whole cache after every change would cost more than the change itself
+        cache.prune_if_full()
+    manifest.save()
+    if graph is not None:
+        graph.save()
+    # Pages are rendered in this process, so the index holds the sizes of any changed images they show
+    images = image_index(rewriters)
+    if images is not None:
+        images.save()
+    if search is not None:
+        write_search_index(search, changes)
+    if changes is not None:
+        changes.save()
+    return failed
+
+
+def write_search_index(search, changes=None):
+    """
+    Writes the client-side search index into the output directory, records the
+    files it touched in changes, and keeps the page terms for the next build.
+    Nothing is written if no page's terms changed.
+    """
+    if not search.changed:
+        print("Search index unchanged")
+        return
+    for path, status in search.write(DEST_DIR):
+        if changes is not None:
+            changes.record(path, status)
+    search.save()
+
+
+def image_index(rewriters):
+    """
+    Returns the ImageIndex of the ImageDimensions among rewriters, or None.
+    """
+    for rewriter in rewriters:
+        if isinstance(rewriter, ImageDimensions):
+            return rewriter.index
+    return None
 
 
-def main():
-    # Get the basepath from the command line arguments
-    if len(sys.argv) > 1:
-        basepath = sys.argv[1]
+def pages_using_static(graph, synced):
+    """
+    Returns the markdown paths of the pages that show a static file that sync_static
+    or sync_static_paths just copied or removed.
+    """
+    if graph is None or synced is None:
+        return set()
+    return set(graph.pages_using_any(os.path.join(STATIC_DIR, relative_path)
+                                     for relative_path in synced["copied"] + synced["removed"]))
+
+
+def build_site(manifest, graph, search, basepath, hash_static=False, jobs=1, deterministic=False, profiler=None,
+               cache=None, rewriters=(), shard=None):
+    """
+    Brings docs up to date with content/, static/ and the template: syncs static
+    files, generates the pages that changed since the build the manifest records,
+    writes the search index and saves the manifest, graph and output changes.
+
+    A shard build writes into shard_dir(shard) instead and generates only its own
+    pages. The first shard also syncs the static files; the search index is left to
+    shard_merge, which writes it from the search terms of every shard.
+
+    Args:
+        manifest: The BuildManifest of the previous build, updated in place.
+        graph: The DependencyGraph of the previous build, updated in place.
+        search: Optional SearchIndex, updated in place.
+        basepath: The base path for the site.
+        hash_static: Compare static files by content when their size or mtime differ.
+        jobs: Number of worker processes to render pages with.
+        deterministic: Keep the log in the order pages are walked, even with jobs.
+        profiler: Optional Profiler that records the build steps and every page.
+        cache: Optional ParseCache of previously parsed markdown.
+        rewriters: UrlRewriters applied before the basepath.
+        shard: Optional (index, count) tuple of the shard to build (see parse_shard).
+
+    Returns:
+        A (failed, changes) tuple of the markdown paths that failed to generate and
+        the OutputChanges of the build.
+    """
+    def build_step(name):
+        return profiler.span(name) if profiler else contextlib.nullcontext()
+
+    root = "" if shard is None else shard_dir(shard)
+    dest_dir = os.path.join(root, DEST_DIR)
+    # Copy new and changed static files from static to docs, and remove deleted ones
+    changes = OutputChanges(dest_dir)
+    synced = None
+    if shard is None or shard[0] == 1:
+        with build_step("sync_static"):
+            synced = sync_static(STATIC_DIR, dest_dir, manifest.static_files, use_hash=hash_static)
+        changes.record_static(synced, manifest.static_files)
+        manifest.static_files = synced["files"]
+    invalidated = pages_using_static(graph, synced)
+    # Read the sizes of new and changed images here, so worker processes find every size in the index
+    images = image_index(rewriters)
+    if images is not None:
+        with build_step("image_index"):
+            # Shards that do not sync static files learn of changed images only here
+            invalidated.update(graph.pages_using_any(images.refresh()))
+        images.save()
+
+    # Generate pages, skipping the ones that did not change since the last build unless they show a changed image
+    with build_step("generate_pages"):
+        failed = generate_pages_recursive(CONTENT_DIR, TEMPLATE_PATH, dest_dir, basepath, manifest,
+                                          jobs=jobs, deterministic=deterministic, profiler=profiler, cache=cache,
+                                          rewriters=rewriters, graph=graph, invalidated=invalidated,
+                                          changes=changes, search=search, shard=shard)
+    if search is not None:
+        with build_step("search_index"):
+            if shard is None:
+                write_search_index(search, changes)
+            else:
+                search.save()
+    if cache is not None:
+        cache.prune()
+    manifest.save()
+    graph.save()
+    # The deploy step uploads the files listed here
+    changes.save(os.path.join(root, CHANGES_PATH))
+    return failed, changes
+
+
+def add_build_arguments(parser):
+    """
+    Adds the options that shape a build to an argparse parser, shared by the build
+    command and the build daemon.
+    """
+    parser.add_argument("basepath", nargs="?", default="/", help='base path for the site (e.g., "/", "/blog/")')
+    parser.add_argument("--hash-static", action="store_true",
+                        help="compare static files by content when their size or mtime differ")
+    parser.add_argument("--image-cdn", metavar="URL",
+                        help="load root-relative images from URL instead, e.g. https://cdn.example.com")
+    parser.add_argument("--no-image-dimensions", action="store_true",
+                        help="do not give images under static/ their width and height and lazy loading")
+    parser.add_argument("--no-search", action="store_true",
+                        help="do not write the client-side search index to docs/search")
+    parser.add_argument("--no-cache", action="store_true", help="parse every page instead of reusing cached parses")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="size the parse cache is pruned back to after each build (default %(default)s MB)")
+    parser.add_argument("--inline-cache", type=int, default=0, metavar="N",
+                        help="cache the parsed inline markdown of up to N repeated fragments (0 disables)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="render pages with N worker processes (0 means one per CPU)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="keep the log in the order pages are walked, even with --jobs")
+
+
+def build_settings(args, root=""):
+    """
+    Returns the ParseCache (or None) and the list of extra UrlRewriters for parsed
+    build arguments, and turns on the inline cache if asked to. Unless turned off,
+    the rewriters include ImageDimensions with the image index of the last build
+    kept under root, such as a shard's directory.
+    """
+    cache = None if args.no_cache else ParseCache(max_bytes=args.cache_size * 1024 * 1024)
+    rewriters = [PrefixRewriter(args.image_cdn)] if args.image_cdn else []
+    if not args.no_image_dimensions:
+        rewriters.append(ImageDimensions(ImageIndex.load(os.path.join(root, IMAGE_INDEX_PATH), STATIC_DIR)))
+    if args.inline_cache:
+        enable_inline_cache(args.inline_cache)
+    return cache, rewriters
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Build the static site from content/ into docs/.")
+    add_build_arguments(parser)
+    parser.add_argument("--clean", action="store_true", help="delete docs/ and rebuild every page from scratch")
+    parser.add_argument("--watch", action="store_true",
+                        help="after building, watch content/, static/ and the template and rebuild on changes")
+    parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_PATH, metavar="TRACE",
+                        help=f"record per-page, per-stage timings as a Chrome trace (default {PROFILE_PATH})")
+    parser.add_argument("--shard", type=shard_argument, metavar="i/N",
+                        help=f"build only the i-th of N shards of the pages, into {SHARDS_DIR}/i-of-N; "
+                             "combine the shards with shard_merge.py")
+    args = parser.parse_args(argv)
+    if args.shard and args.watch:
+        parser.error("--watch rebuilds the whole site and cannot be combined with --shard")
+    return args
+
+
+def shard_argument(text):
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    basepath = args.basepath
+
+    # A shard keeps its output and build state apart from the site's and the other shards'
+    root = "" if args.shard is None else shard_dir(args.shard)
+    dest_dir = os.path.join(root, DEST_DIR)
+    manifest_path = os.path.join(root, MANIFEST_PATH)
+    graph_path = os.path.join(root, DEPGRAPH_PATH)
+    search_path = os.path.join(root, SEARCH_PAGES_PATH)
+    if args.clean:
+        # Delete anything in the docs directory and forget the previous build
+        if os.path.exists(dest_dir):
+            print(f"Deleting existing {dest_dir} directory")
+            shutil.rmtree(dest_dir)
+        manifest = BuildManifest(manifest_path)
+        graph = DependencyGraph(graph_path, content_dir=CONTENT_DIR, static_dir=STATIC_DIR)
+        search = SearchIndex(search_path)
     else:
-        basepath = "/"
+        manifest = BuildManifest.load(manifest_path)
+        graph = DependencyGraph.load(graph_path, content_dir=CONTENT_DIR, static_dir=STATIC_DIR)
+        search = SearchIndex.load(search_path)
+    if args.no_search:
+        search = None
+
+    profiler = Profiler() if args.profile else None
+    # Each shard notices changed images by itself, so it keeps its own image index
+    cache, rewriters = build_settings(args, root)
+    build_site(manifest, graph, search, basepath, hash_static=args.hash_static, jobs=args.jobs,
+               deterministic=args.deterministic, profiler=profiler, cache=cache, rewriters=rewriters,
+               shard=args.shard)
 
-    # Delete anything in the docs directory
-    if os.path.exists("docs"):
-        print("Deleting existing docs directory")
-        shutil.rmtree("docs")
+    if profiler:
+        profiler.write_trace(args.profile)
+        print(profiler.summary())
+        print(f"Wrote build trace to {args.profile}")
 
-    # Copy all the static files from static to docs
-    recursive_copy("static", "docs")
+    if args.watch:
+        def on_change(changed_paths):
+            start = time.perf_counter()
+            rebuild_changed(changed_paths, manifest, basepath, hash_static=args.hash_static, cache=cache,
+                            rewriters=rewriters, graph=graph, changes=OutputChanges(DEST_DIR), search=search)
+            print(f"Rebuilt in {(time.perf_counter() - start) * 1000:.0f} ms")
 
-    # Generate pages recursively
-    generate_pages_recursive("content", "template.html", "docs", basepath)
+        watch([CONTENT_DIR, STATIC_DIR, TEMPLATE_PATH], on_change, polling=args.poll)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
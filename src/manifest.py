@@ -0,0 +1,263 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import weakref
+from spill import PageTable, load_table, sorted_spill
+
+MANIFEST_VERSION = 2
+MANIFEST_PATH = os.path.join(".build", "manifest.json")
+CHANGES_PATH = os.path.join(".build", "changes.json")
+CHANGE_STATUSES = ("added", "changed", "deleted")
+
+
+def hash_bytes(data):
+    """
+    Returns the hex sha256 digest of a bytes object.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+_hash_cache = None
+
+
+def enable_hash_cache():
+    """
+    Makes hash_file remember the digest of every file it hashes, keyed by the
+    file's mtime, size and inode, and return it again while those are unchanged.
+    Meant for long-running processes such as the build daemon, which would
+    otherwise read every page again on every build.
+    """
+    global _hash_cache
+    if _hash_cache is None:
+        _hash_cache = {}
+
+
+def disable_hash_cache():
+    global _hash_cache
+    _hash_cache = None
+
+
+def hash_file(path):
+    """
+    Returns the hex sha256 digest of a file's contents, read in chunks.
+
+    Args:
+        path: Path to the file to hash.
+    """
+    if _hash_cache is not None:
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cached = _hash_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    if _hash_cache is not None:
+        _hash_cache[path] = (key, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def files_equal(path_a, path_b):
+    """
+    Returns True if two files have the same contents, comparing sizes first and
+    then the bytes in chunks. A missing file is never equal to anything.
+    """
+    try:
+        if os.path.getsize(path_a) != os.path.getsize(path_b):
+            return False
+        with open(path_a, "rb") as a, open(path_b, "rb") as b:
+            while True:
+                chunk = a.read(65536)
+                if chunk != b.read(65536):
+                    return False
+                if not chunk:
+                    return True
+    except FileNotFoundError:
+        return False
+
+
+class BuildManifest:
+    """
+    Records what the last build produced so the next one can skip pages whose
+    inputs did not change.
+
+    The manifest stores the hash of the template, the basepath, the key of any
+    extra URL rewriters and the markdown parser version used for the build, plus one entry per markdown source (keyed by its path relative to the
+    content directory) holding the source hash and the output path it produced,
+    and the list of static files synced into the output directory. A shard build
+    (see main.parse_shard) also stores its shard as [index, count].
+
+    The page entries are a spill.PageTable, read from disk as the build walks the
+    content directory rather than loaded, and the rest is its header.
+    """
+
+    def __init__(self, path=MANIFEST_PATH, data=None, pages=None):
+        self.path = path
+        data = data or {}
+        self.template_hash = data.get("template_hash")
+        self.basepath = data.get("basepath")
+        self.url_rewriters = data.get("url_rewriters")
+        self.parser_version = data.get("parser_version")
+        self.pages = pages if pages is not None else PageTable(directory=os.path.dirname(path))
+        self.static_files = data.get("static_files", [])
+        self.shard = data.get("shard")
+
+    @classmethod
+    def load(cls, path=MANIFEST_PATH):
+        """
+        Loads a manifest from disk, all but its page entries. A missing, unreadable
+        or outdated manifest yields an empty one, which simply forces a full build.
+        """
+        try:
+            data, pages = load_table(path)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable build manifest {path}: {e}")
+            return cls(path)
+
+        if data.get("version") != MANIFEST_VERSION:
+            print(f"Ignoring build manifest {path} from another version")
+            return cls(path)
+        return cls(path, data, pages)
+
+    def save(self):
+        """
+        Writes the manifest atomically so an interrupted build never leaves a
+        half-written file behind.
+        """
+        self.pages.save(self.path, {
+            "version": MANIFEST_VERSION,
+            "template_hash": self.template_hash,
+            "basepath": self.basepath,
+            "url_rewriters": self.url_rewriters,
+            "parser_version": self.parser_version,
+            "static_files": self.static_files,
+            "shard": self.shard,
+        })
+
+    def settings_changed(self, template_hash, basepath, url_rewriters=None, parser_version=None):
+        """
+        Returns True if the template, basepath, URL rewriters (identified by their
+        key) or parser version differ from the last build, in which case every page
+        has to be re-rendered: a new parser can render the same markdown differently.
+        """
+        return (self.template_hash != template_hash or self.basepath != basepath
+                or self.url_rewriters != url_rewriters or self.parser_version != parser_version)
+
+    def is_page_current(self, source, source_hash, output_path):
+        """
+        Returns True if the page was built from identical source and its output
+        still exists on disk.
+        """
+        entry = self.pages.get(source)
+        if entry is None:
+            return False
+        return entry["hash"] == source_hash and entry["output"] == output_path and os.path.exists(output_path)
+
+    def record_page(self, source, source_hash, output_path):
+        self.pages[source] = {"hash": source_hash, "output": output_path}
+
+    def forget_page(self, source):
+        return self.pages.pop(source, None)
+
+
+class OutputChanges:
+    """
+    Collects the output files a build added, changed and deleted, so a deploy step
+    can upload just those. Paths are recorded relative to the output directory.
+
+    The saved file looks like:
+
+        {"added": ["blog/new/index.html"], "changed": ["index.html"], "deleted": ["old.html"]}
+
+    Recorded paths are appended to an unnamed temporary file rather than kept, and
+    sorted out on disk when they are read back (see spill.sorted_spill), so a build
+    that writes every page of a large site records them in the same memory.
+
+    Args:
+        dest_dir: The output directory (e.g., "docs").
+    """
+
+    def __init__(self, dest_dir):
+        self.dest_dir = dest_dir
+        self.log = tempfile.TemporaryFile()
+        weakref.finalize(self, self.log.close)
+        self.count = 0
+
+    def record(self, output_path, status):
+        """
+        Records an output file as "added", "changed" or "deleted". Other statuses,
+        such as "unchanged", are ignored. A file recorded again keeps its last status.
+        """
+        if status not in CHANGE_STATUSES:
+            return
+        relative_path = os.path.relpath(output_path, self.dest_dir)
+        self.log.write(json.dumps([relative_path, self.count, status]).encode("utf-8") + b"\n")
+        self.count += 1
+
+    def record_static(self, synced, previous_files):
+        """
+        Records the files copied and removed by sync_static or sync_static_paths.
+        """
+        previous_files = set(previous_files)
+        for relative_path in synced["copied"]:
+            status = "changed" if relative_path in previous_files else "added"
+            self.record(os.path.join(self.dest_dir, relative_path), status)
+        for relative_path in synced["removed"]:
+            self.record(os.path.join(self.dest_dir, relative_path), "deleted")
+
+    def statuses(self):
+        """
+        Yields (relative path, status) for every file recorded, sorted by path, with
+        the status it was recorded with last.
+        """
+        self.log.flush()
+        self.log.seek(0)
+        try:
+            records = sorted_spill(json.loads(line) for line in self.log)
+            for relative_path, versions in itertools.groupby(records, key=lambda record: record[0]):
+                *_, (_, _, status) = versions
+                yield relative_path, status
+        finally:
+            self.log.seek(0, os.SEEK_END)
+
+    def to_dict(self):
+        data = {status: [] for status in CHANGE_STATUSES}
+        for relative_path, status in self.statuses():
+            data[status].append(relative_path)
+        return data
+
+    def save(self, path=CHANGES_PATH):
+        """
+        Writes the changes atomically, as json.dump(to_dict(), indent=1) would but a
+        path at a time, and prints a one-line summary.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lists = {status: tempfile.TemporaryFile("w+", encoding="utf-8") for status in CHANGE_STATUSES}
+        counts = dict.fromkeys(CHANGE_STATUSES, 0)
+        for relative_path, status in self.statuses():
+            lists[status].write(("," if counts[status] else "") + "\n  " + json.dumps(relative_path))
+            counts[status] += 1
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("{")
+            for status, paths in lists.items():
+                f.write(("" if status == CHANGE_STATUSES[0] else ",") + f'\n "{status}": [')
+                if counts[status]:
+                    paths.seek(0)
+                    shutil.copyfileobj(paths, f)
+                    f.write("\n ")
+                f.write("]")
+                paths.close()
+            f.write("\n}")
+        os.replace(tmp_path, path)
+        print(f"Output changes: {counts['added']} added, {counts['changed']} changed, "
+              f"{counts['deleted']} deleted (listed in {path})")
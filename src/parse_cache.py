@@ -0,0 +1,184 @@
+import json
+import os
+import tempfile
+from manifest import hash_bytes
+from inline_markdown import PARSER_VERSION
+from spill import sorted_spill
+
+CACHE_DIR = os.path.join(".build", "cache")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed markdown: the rendered body HTML, the extracted title,
+    the page's search terms and the URLs it references, keyed by the hash of the
+    markdown file, the parser version and the URL rewriting the body was rendered
+    with. The body does not depend on the template, so a template change only costs
+    template assembly and writes.
+
+    Each entry also records the image_attributes the rewriter gave the page's
+    images, such as their sizes, and is a miss once any of them would come out
+    differently.
+
+    Each entry is a small JSON file written to a temporary name and renamed into
+    place, so parallel workers never see a partial entry; a missing or unreadable
+    entry is treated as a miss. Reading an entry touches its mtime, and prune()
+    deletes the least recently used entries once the cache grows past max_bytes.
+    After a prune the cache keeps count of the bytes put() adds, so prune_if_full()
+    can skip walking the cache while it is below max_bytes.
+
+    Args:
+        path: Directory holding the cache entries.
+        max_bytes: Size the cache is pruned back to.
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        # Bytes in the cache as of the last prune plus what put() wrote since, or None if unknown
+        self.size = None
+
+    def key(self, source_hash, url_rewriter=None):
+        """
+        Returns the cache key for a markdown file with the given hash (see
+        manifest.hash_file) rendered with url_rewriter.
+        """
+        urls = "" if url_rewriter is None else url_rewriter.key
+        return hash_bytes(f"{PARSER_VERSION}\0{urls}\0{source_hash}".encode("utf-8"))
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key, url_rewriter=None):
+        """
+        Returns the (title, body, terms, references) stored under key, or None on a
+        miss. terms and references are None for entries stored without them. An
+        entry whose images url_rewriter now gives other attributes is a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("version") != PARSER_VERSION:
+            return None
+        if url_rewriter is not None:
+            for url, attributes in (entry.get("image_attributes") or {}).items():
+                if url_rewriter.image_attributes(url) != attributes:
+                    return None
+        return entry.get("title"), entry.get("body"), entry.get("terms"), entry.get("references")
+
+    def put(self, key, title, body, terms=None, references=None, url_rewriter=None):
+        """
+        Stores the title, body HTML and optionally the search terms and references
+        (see depgraph.ReferenceCollector) for key, replacing any existing entry.
+        With a url_rewriter, the attributes it gives the images among references
+        are stored for get() to check.
+        """
+        image_attributes = None
+        if url_rewriter is not None and references is not None:
+            image_attributes = {url: url_rewriter.image_attributes(url) for url in references["images"]}
+        data = json.dumps({"version": PARSER_VERSION, "title": title, "body": body, "terms": terms,
+                           "references": references, "image_attributes": image_attributes}).encode("utf-8")
+        path = self._entry_path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.size is not None:
+            # A replaced entry is counted twice, which only brings the next prune forward
+            self.size += len(data)
+
+    def prune(self):
+        """
+        Deletes the least recently used entries until the cache is at most max_bytes.
+        Entries removed by another process in the meantime are skipped. The entries
+        are sorted by age on disk (see spill.sorted_spill), and only when the cache
+        is over max_bytes.
+
+        Returns:
+            The number of entries deleted.
+        """
+        total = sum(size for _, size, _ in self._entries())
+        removed = 0
+        if total > self.max_bytes:
+            for mtime, size, path in sorted_spill(self._entries(), directory=os.path.dirname(self.path)):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self.size = total
+        return removed
+
+    def _entries(self):
+        """
+        Yields the (mtime in ns, size, path) of every entry in the cache.
+        """
+        for root, dirs, files in os.walk(self.path):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime_ns, stat.st_size, path
+
+    def prune_if_full(self):
+        """
+        Prunes the cache if put() may have taken it past max_bytes since the last
+        prune, or if this cache was never pruned. Entries put by other processes,
+        such as build workers, are not counted until the next prune.
+
+        Returns:
+            The number of entries deleted.
+        """
+        if self.size is not None and self.size <= self.max_bytes:
+            return 0
+        return self.prune()
+
+
+class CachingContent:
+    """
+    Wraps page content that is rendered with render_to and keeps a copy of what it
+    wrote, so the body can be stored in the cache once the page is written. Bodies
+    larger than limit characters are written without being kept.
+    """
+
+    def __init__(self, content, limit=1024 * 1024):
+        self.content = content
+        self.limit = limit
+        self.writer = None
+        self.fragments = []
+        self.size = 0
+
+    def render_to(self, writer):
+        self.writer = writer
+        self.content.render_to(self)
+
+    def write(self, text):
+        if self.size <= self.limit:
+            self.fragments.append(text)
+            self.size += len(text)
+        return self.writer.write(text)
+
+    def body(self):
+        """
+        Returns the rendered body, or None if it was too large to keep.
+        """
+        if self.size > self.limit:
+            return None
+        return "".join(self.fragments)
@@ -0,0 +1,124 @@
+"""
+Plumbing for building a site as a stream of pages, in memory that does not grow
+with the number of pages.
+
+A build runs every page through the same stages:
+
+    discover -> read -> parse -> render -> write
+
+Discovery is a generator over os.walk that yields one page at a time, and the
+pages it skips are never held. Reading, parsing, rendering and writing happen
+inside generate_page. MarkdownStream pulls the markdown line by line, parses and
+renders one block at a time, and the template streams the HTML straight into the
+output file. The stages are connected by queues of bounded depth:
+
+    discover -> render:  a generator, so one page is pulled only when the next
+                         stage is ready for it.
+    render -> workers:   with --jobs, imap_window keeps at most `window` batches
+                         of pages submitted to the pool but not yet consumed.
+    workers -> results:  results are consumed (recorded in the manifest, the
+                         dependency graph and the search index) as they come
+                         back, not collected into lists.
+
+Build state that describes the whole site is not held in memory either (see
+spill). The build manifest, dependency graph and search index keep their pages
+in PageTable files sorted in walk order; discovery walks the content directory in
+that order and reads them alongside, and the pages a build records are appended
+to change files that are merged into the tables when they are saved. The pages
+walked, which deleted pages are found by, go to a KeyLog file, and the output
+changes, the postings of a full search index write and the parse cache entries
+to prune are sorted on disk by sorted_spill.
+
+Memory is therefore bounded by:
+
+    - one markdown block and one page's title (serial build), or
+      window x PAGES_PER_TASK pages and their logs (parallel build);
+    - the entries of the largest content directory, which os.walk lists at once;
+    - the parse cache's copy of one rendered page body (at most 1 MB, see
+      CachingContent);
+    - RUN_ITEMS items sorted at once and a read buffer for each of up to
+      MERGE_FAN_IN runs merged (see spill.sorted_spill);
+    - what a build changes rather than what the site holds: the search terms and
+      page titles it changed, up to MAX_NOTED_CHANGES before the whole index is
+      written instead, the ids of deleted pages, and the pages that show a
+      changed image.
+
+test_pipeline checks that the peak RSS of a default build (main.py) stays flat
+from SMALL_SITE_PAGES to LARGE_SITE_PAGES synthetic pages; `benchmark.py rss`
+measures it for any sizes. Watch mode and shard_merge may look pages up out of
+walk order, which loads a table into memory (see PageTable), and the profiler,
+when enabled, keeps every page's spans.
+"""
+import itertools
+import queue
+
+PAGES_PER_TASK = 16
+BATCHES_PER_WORKER = 4
+
+
+def batched(items, size):
+    """
+    Yields lists of up to size consecutive items from an iterable, pulling only as
+    many items as the next list needs.
+    """
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def imap_window(pool, func, items, window, on_done=None):
+    """
+    Like pool.imap, but pulls items from the iterable only as results are consumed:
+    at most window items are ever submitted and not yet yielded. pool.imap queues
+    every item up front, which holds the whole input in memory.
+
+    Args:
+        pool: A multiprocessing.Pool (or multiprocessing.dummy.Pool).
+        func: Function to apply to each item in the pool.
+        items: Iterable of items; it is consumed lazily.
+        window: Maximum number of items in flight.
+        on_done: Optional function called in this thread with each result as soon
+            as it arrives, in completion order.
+
+    Yields:
+        func(item) for each item, in the order of items.
+
+    Raises:
+        Exception: Whatever func raised for the first failed item, once it is reached.
+    """
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    items = iter(items)
+    done = queue.Queue()
+    finished = {}
+    submitted = 0
+    consumed = 0
+    exhausted = False
+    while True:
+        while not exhausted and submitted - consumed < window:
+            item = next(items, _END)
+            if item is _END:
+                exhausted = True
+                break
+            pool.apply_async(func, (item,),
+                             callback=lambda result, i=submitted: done.put((i, True, result)),
+                             error_callback=lambda error, i=submitted: done.put((i, False, error)))
+            submitted += 1
+        if consumed == submitted:
+            return
+        while consumed not in finished:
+            i, ok, result = done.get()
+            if ok and on_done is not None:
+                on_done(result)
+            finished[i] = (ok, result)
+        ok, result = finished.pop(consumed)
+        consumed += 1
+        if not ok:
+            raise result
+        yield result
+
+
+_END = object()
@@ -0,0 +1,184 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+STAGES = ["read", "split", "inline", "render", "template", "write"]
+
+
+class StageClock:
+    """
+    Attributes elapsed time to whichever stage is currently active. Stages nest,
+    and time spent in an inner stage is not counted towards the outer one, so the
+    totals add up to the time the clock ran.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(int)
+        self._stack = []
+        self._last = time.perf_counter_ns()
+
+    def enter(self, stage):
+        now = time.perf_counter_ns()
+        if self._stack:
+            self.totals[self._stack[-1]] += now - self._last
+        self._stack.append(stage)
+        self._last = now
+
+    def exit(self):
+        now = time.perf_counter_ns()
+        self.totals[self._stack.pop()] += now - self._last
+        self._last = now
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        self.enter(stage)
+        try:
+            yield
+        finally:
+            self.exit()
+
+
+class NullClock:
+    """
+    Stand-in for StageClock when profiling is off.
+    """
+
+    def stage(self, stage):
+        return contextlib.nullcontext()
+
+
+NULL_CLOCK = NullClock()
+
+
+class TimedWriter:
+    """
+    Wraps a writer and charges the time spent in write() to the "write" stage.
+    """
+
+    def __init__(self, writer, clock):
+        self.writer = writer
+        self.clock = clock
+
+    def write(self, text):
+        self.clock.enter("write")
+        try:
+            return self.writer.write(text)
+        finally:
+            self.clock.exit()
+
+
+def timed_lines(lines, clock):
+    """
+    Yields from an iterable of lines, charging the time spent reading to the "read" stage.
+    """
+    iterator = iter(lines)
+    while True:
+        clock.enter("read")
+        try:
+            line = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            clock.exit()
+        yield line
+
+
+class Profiler:
+    """
+    Collects spans for a build and writes them as a Chrome trace-event file that can
+    be opened in chrome://tracing or Perfetto.
+
+    Each page gets a real span covering its whole generation. The stages inside a
+    page interleave block by block (reading, splitting, inline parsing, rendering,
+    template filling and writing), so their times are summed per page and drawn as
+    consecutive spans inside the page span, marked with "aggregated": true.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    def _add_span(self, name, category, start_ns, duration_ns, args=None):
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": duration_ns / 1000,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": args or {},
+        })
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """
+        Records a span for a build step, such as syncing static files.
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._add_span(name, "build", start, time.perf_counter_ns() - start, args)
+
+    @contextlib.contextmanager
+    def page(self, source):
+        """
+        Records a page span and its per-stage breakdown. Yields the StageClock that
+        generate_page uses to attribute time to stages.
+        """
+        clock = StageClock()
+        start = time.perf_counter_ns()
+        clock.enter("template")
+        try:
+            yield clock
+        finally:
+            clock.exit()
+            duration = time.perf_counter_ns() - start
+            stage_ms = {stage: clock.totals[stage] / 1e6 for stage in STAGES if stage in clock.totals}
+            self._add_span(source, "page", start, duration, {"stages_ms": stage_ms})
+            offset = start
+            for stage in STAGES:
+                if stage in clock.totals:
+                    self._add_span(stage, "stage", offset, clock.totals[stage],
+                                   {"page": source, "aggregated": True})
+                    offset += clock.totals[stage]
+
+    def add_events(self, events):
+        """
+        Adds spans recorded by another Profiler, such as one in a worker process.
+        """
+        self.events.extend(events)
+
+    def write_trace(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self, top=10):
+        """
+        Returns a printable report of the slowest pages and the time spent in each stage.
+        """
+        pages = sorted((e for e in self.events if e["cat"] == "page"), key=lambda e: e["dur"], reverse=True)
+        stage_totals = defaultdict(float)
+        for event in self.events:
+            if event["cat"] == "stage":
+                stage_totals[event["name"]] += event["dur"]
+        total = sum(stage_totals.values()) or 1
+
+        lines = [f"Slowest pages ({len(pages)} profiled):"]
+        for event in pages[:top]:
+            lines.append(f"  {event['dur'] / 1000:9.2f} ms  {event['name']}")
+        lines.append("Time per stage across all pages:")
+        for stage in STAGES:
+            if stage in stage_totals:
+                lines.append(f"  {stage:<9} {stage_totals[stage] / 1000:9.2f} ms  {stage_totals[stage] / total:6.1%}")
+        for event in self.events:
+            if event["cat"] == "build":
+                lines.append(f"Build step {event['name']}: {event['dur'] / 1000:.2f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,526 @@
+import heapq
+import itertools
+import json
+import os
+import re
+import string
+from manifest import files_equal
+from pipeline import batched
+from spill import PageTable, load_table, sorted_spill
+from textnode import BlockType
+
+SEARCH_INDEX_VERSION = 2
+# Version of the per-page terms kept between builds
+SEARCH_PAGES_VERSION = 3
+SEARCH_PAGES_PATH = os.path.join(".build", "search_pages.json")
+SEARCH_DIR = "search"
+PREFIX_LENGTH = 2
+PAGES_PER_FILE = 256
+MAX_TERM_LENGTH = 32
+# Term and page changes write() applies to the files they touch; more rewrite the whole index
+MAX_NOTED_CHANGES = 200000
+# Ids written per chunk of a posting list when the whole index is written
+POSTINGS_PER_CHUNK = 4096
+
+TERM_REGEX = re.compile(r"[^\W_]+")
+# Splitting on ASCII punctuation with str.translate is several times faster than
+# TERM_REGEX; the rare terms left with other punctuation go through the regex
+PUNCTUATION_TO_SPACE = str.maketrans({char: " " for char in string.punctuation})
+SHARD_NAME_REGEX = re.compile(r"[a-z0-9]+")
+
+LOADER_JS = """\
+// Client for the search index written by the site build. Usage:
+//   <script src="/search/search.js"></script>
+//   siteSearch("rivendell elves").then(results => ...)  // [{url, title}, ...]
+(function () {
+  var base = new URL(".", document.currentScript.src);
+  var root = new URL("..", base);
+  var shards = {};
+  var pageFiles = {};
+  var index = null;
+
+  function fetchJson(path) {
+    return fetch(new URL(path, base)).then(function (response) {
+      return response.ok ? response.json() : {};
+    });
+  }
+
+  function shardName(prefix) {
+    if (/^[a-z0-9]+$/.test(prefix)) return prefix;
+    return "_" + Array.from(new TextEncoder().encode(prefix), function (b) {
+      return b.toString(16).padStart(2, "0");
+    }).join("");
+  }
+
+  function loadIndex() {
+    if (!index) index = fetchJson("index.json");
+    return index;
+  }
+
+  function postings(term, prefixLength) {
+    var name = shardName(term.slice(0, prefixLength));
+    if (!shards[name]) shards[name] = fetchJson("t/" + name + ".json");
+    return shards[name].then(function (shard) {
+      var ids = [], id = 0, gaps = shard[term] || [];
+      for (var i = 0; i < gaps.length; i++) ids.push(id += gaps[i]);
+      return ids;
+    });
+  }
+
+  function page(id, pagesPerFile) {
+    var name = Math.floor(id / pagesPerFile);
+    if (!pageFiles[name]) pageFiles[name] = fetchJson("p/" + name + ".json");
+    return pageFiles[name].then(function (pages) { return pages[id]; });
+  }
+
+  window.siteSearch = function (query) {
+    var terms = (query.toLowerCase().match(/[\\p{L}\\p{N}]+/gu) || [])
+      .filter(function (term) { return term.length > 1; });
+    if (!terms.length) return Promise.resolve([]);
+    return loadIndex().then(function (index) {
+      return Promise.all(terms.map(function (term) { return postings(term, index.prefix); }))
+        .then(function (lists) {
+          var hits = lists.reduce(function (a, b) {
+            return a.filter(function (id) { return b.indexOf(id) !== -1; });
+          });
+          return Promise.all(hits.map(function (id) { return page(id, index.pages_per_file); }));
+        })
+        .then(function (pages) {
+          return pages.filter(Boolean).map(function (page) {
+            return {url: new URL(page[0], root).pathname, title: page[1]};
+          });
+        });
+    });
+  };
+})();
+"""
+
+
+def text_terms(text):
+    """
+    Returns the set of search terms in a piece of text: lowercased runs of letters
+    and digits, two to MAX_TERM_LENGTH characters long.
+    """
+    terms = set(text.lower().translate(PUNCTUATION_TO_SPACE).split())
+    for term in [term for term in terms if not term.isalnum()]:
+        terms.discard(term)
+        terms.update(TERM_REGEX.findall(term))
+    return {term for term in terms if 1 < len(term) <= MAX_TERM_LENGTH}
+
+
+class TermCollector:
+    """
+    Gathers the search terms of a page while MarkdownStream renders it, from the
+    text of the leaves each block was parsed into (the TextNode stream). Code
+    blocks are skipped; image alt text is included. Each block is folded into the
+    page's set of terms as it comes, so only the terms are kept, not the text.
+    """
+
+    def __init__(self):
+        self.terms = set()
+
+    def add_block(self, block_type, node):
+        if block_type == BlockType.CODE:
+            return
+        texts = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.children is None:
+                texts.append(node.props["alt"] if node.tag == "img" else node.value)
+            else:
+                stack.extend(node.children)
+        # Splitting the whole block at once is cheaper than splitting each leaf
+        self.terms |= text_terms(" ".join(texts))
+
+    def sorted_terms(self):
+        return sorted(self.terms)
+
+
+def shard_name(prefix):
+    """
+    Returns the file name (without extension) of the shard holding terms that start
+    with prefix. The JS loader computes the same name.
+    """
+    if SHARD_NAME_REGEX.fullmatch(prefix):
+        return prefix
+    return "_" + prefix.encode("utf-8").hex()
+
+
+class SearchIndex:
+    """
+    Builds a compact inverted index of the site for client-side search.
+
+    The terms of every page are kept in .build/search_pages.json between builds,
+    so only pages that were re-rendered need their terms collected again. write()
+    turns them into a static index under the output directory:
+
+        search/index.json   {"version": 2, "prefix": 2, "pages_per_file": 256, "generation": 7}
+        search/p/<n>.json   {"id": [url, title], ...} for the page ids n * 256 to n * 256 + 255
+        search/t/<ab>.json  {"term": [id gaps, ...], ...} for the terms starting "ab"
+        search/search.js    the loader that fetches only the files a query needs
+
+    Every page keeps its id for as long as it exists, and the ids of deleted pages
+    are given to new ones, so adding or removing a page changes only the files
+    holding its terms and its id. Ids are handed out in walk order whenever the
+    whole index is written. Each posting list is sorted and stored as gaps
+    between ids, which keeps the numbers and the files small.
+
+    record_page() and forget_page() note which terms gained or lost which page and
+    which pages' URL or title changed, and write() rewrites just the files holding
+    those, reading them as the last write left them. Once more than
+    MAX_NOTED_CHANGES are noted, write() writes the whole index instead, which
+    takes no more memory. generation is counted up in index.json before any
+    other file is written and saved along with the page terms, so a write that was
+    interrupted, or an output directory that was deleted or written by another
+    index, is noticed and the whole index is written again.
+
+    The pages are a spill.PageTable, read from disk as they are needed, and writing
+    the whole index sorts the postings on disk (see spill.sorted_spill), so neither
+    holds the site in memory.
+
+    changed is True until save() if any page was recorded differently or forgotten
+    since the index was loaded, and starts out True, as the files on disk may not
+    match what was loaded.
+
+    Args:
+        path: Where the per-page terms are kept between builds.
+        pages: The saved terms, title, URL and id of every page, keyed by source, as
+            a PageTable or dict.
+        generation: The generation of the index files the saved pages were written to.
+        next_id: The id after the highest one given out, and
+        free_ids: the ids below it no page has; both are worked out from pages
+            unless given.
+    """
+
+    def __init__(self, path=SEARCH_PAGES_PATH, pages=None, generation=0, next_id=None, free_ids=None):
+        self.path = path
+        self.generation = generation
+        self.changed = True
+        # term -> {page id: whether the page now has the term}, and page id -> [url, title],
+        # or None if the page is gone; both None until the files are written in full
+        self.term_changes = {} if pages is not None else None
+        self.page_changes = {} if pages is not None else None
+        self.noted_changes = 0
+        if pages is None:
+            pages = PageTable(directory=os.path.dirname(path))
+        elif isinstance(pages, dict):
+            pages = PageTable(pages=pages)
+        self.pages = pages
+        if next_id is None:
+            ids = {page["id"] for page in self.pages.values()}
+            next_id = max(ids, default=-1) + 1
+            free_ids = [page_id for page_id in range(next_id) if page_id not in ids]
+        self.next_id = next_id
+        self.free_ids = free_ids or []
+        heapq.heapify(self.free_ids)
+
+    @classmethod
+    def load(cls, path=SEARCH_PAGES_PATH):
+        try:
+            data, pages = load_table(path)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable search terms {path}: {e}")
+            return cls(path)
+        if data.get("version") != SEARCH_PAGES_VERSION:
+            return cls(path)
+        return cls(path, pages, data.get("generation", 0), data.get("next_id", 0), data.get("free_ids", []))
+
+    def save(self):
+        self.pages.save(self.path, {"version": SEARCH_PAGES_VERSION, "generation": self.generation,
+                                    "next_id": self.next_id, "free_ids": sorted(self.free_ids)})
+        self.changed = False
+
+    def record_page(self, source, url, title, terms):
+        """
+        Replaces the indexed title, URL and terms of a page. A page seen for the
+        first time is given the lowest free id.
+
+        Args:
+            source: Path to the page's markdown file.
+            url: The page's URL relative to the site root, such as "blog/tom/".
+            title: The page's title.
+            terms: The page's search terms.
+        """
+        terms = sorted(set(terms) | text_terms(title))
+        old = self.pages.get(source)
+        if old is not None and (old["url"], old["title"], old["terms"]) == (url, title, terms):
+            return
+        if old is None:
+            page_id = heapq.heappop(self.free_ids) if self.free_ids else self.next_id
+            self.next_id = max(self.next_id, page_id + 1)
+            old_terms = set()
+        else:
+            page_id = old["id"]
+            old_terms = set(old["terms"])
+        if old is None or (old["url"], old["title"]) != (url, title):
+            self._note_page(page_id, [url, title])
+        self._note_terms(page_id, set(terms) - old_terms, True)
+        self._note_terms(page_id, old_terms - set(terms), False)
+        self.pages[source] = {"id": page_id, "url": url, "title": title, "terms": terms}
+        self.changed = True
+
+    def forget_page(self, source):
+        page = self.pages.pop(source, None)
+        if page is not None:
+            self._drop(source, page)
+
+    def prune(self, sources):
+        """
+        Forgets every page whose source is not among sources, which are in walk
+        order (see spill.walk_key).
+        """
+        self.pages.prune(sources, self._drop)
+
+    def _drop(self, source, page):
+        # Past that many, new pages get new ids until writing the whole index hands them out afresh
+        if len(self.free_ids) < MAX_NOTED_CHANGES:
+            heapq.heappush(self.free_ids, page["id"])
+        self._note_page(page["id"], None)
+        self._note_terms(page["id"], page["terms"], False)
+        self.changed = True
+
+    def _note_page(self, page_id, entry):
+        if self.page_changes is None:
+            return
+        self.page_changes[page_id] = entry
+        self._count_changes(1)
+
+    def _note_terms(self, page_id, terms, present):
+        if self.term_changes is None:
+            return
+        for term in terms:
+            self.term_changes.setdefault(term, {})[page_id] = present
+        self._count_changes(len(terms))
+
+    def _count_changes(self, count):
+        self.noted_changes += count
+        if self.noted_changes > MAX_NOTED_CHANGES:
+            self.term_changes = None
+            self.page_changes = None
+
+    def page_files(self):
+        """
+        Returns a dict of page file number to {id: [url, title]}.
+        """
+        files = {}
+        for number, pages in self._page_files():
+            files.setdefault(number, {}).update(pages)
+        return files
+
+    def _page_files(self):
+        """
+        Yields (page file number, {id: [url, title]}) for every run of pages whose
+        ids fall in the same file, in walk order: one per file once _write_all has
+        numbered the pages in that order.
+        """
+        pages = self.pages.values()
+        for number, file_pages in itertools.groupby(pages, key=lambda page: page["id"] // PAGES_PER_FILE):
+            yield number, {str(page["id"]): [page["url"], page["title"]] for page in file_pages}
+
+    def shards(self):
+        """
+        Returns a dict of shard name to {term: id gaps}.
+        """
+        return {name: {term: _gaps(list(ids)) for term, ids in terms} for name, terms in self._shards()}
+
+    def _shards(self):
+        """
+        Yields (shard name, terms) for every shard in name order, where terms yields
+        the shard's (term, page ids) in term order and page ids yields ascending ids.
+        Each has to be read before the next is asked for. The postings are sorted on
+        disk, so one term's ids are never all held at once.
+        """
+        postings = sorted_spill(([term, page["id"]] for page in self.pages.values() for term in page["terms"]),
+                                directory=os.path.dirname(self.path))
+        for name, shard in itertools.groupby(postings, key=lambda posting: shard_name(posting[0][:PREFIX_LENGTH])):
+            yield name, ((term, (page_id for _, page_id in term_postings))
+                         for term, term_postings in itertools.groupby(shard, key=lambda posting: posting[0]))
+
+    def write(self, dest_dir):
+        """
+        Writes the index and its loader under dest_dir/search. Only the files that
+        record_page() and forget_page() changed are rewritten, unless the files on
+        disk are not the ones this index last wrote, in which case every file is
+        written and the files no longer needed are deleted. Files whose contents
+        came out the same are left alone.
+
+        Returns:
+            A list of (output path, status) pairs, where status is "added", "changed"
+            or "deleted", for the files that were touched.
+        """
+        search_dir = os.path.join(dest_dir, SEARCH_DIR)
+        full = self.term_changes is None or _read_json(os.path.join(search_dir, "index.json")).get(
+            "generation") != self.generation
+        if not full and not self.term_changes and not self.page_changes:
+            return []
+        for directory in ("t", "p"):
+            os.makedirs(os.path.join(search_dir, directory), exist_ok=True)
+
+        # Written first, so a write that does not finish leaves the generations apart
+        self.generation += 1
+        touched = []
+        _write_file(os.path.join(search_dir, "index.json"), _compact_json({
+            "version": SEARCH_INDEX_VERSION, "prefix": PREFIX_LENGTH, "pages_per_file": PAGES_PER_FILE,
+            "generation": self.generation}), touched)
+        _write_file(os.path.join(search_dir, "search.js"), LOADER_JS, touched)
+        if full:
+            page_count = self._write_all(search_dir, touched)
+        else:
+            page_count = len(self.pages)
+            self._write_changes(search_dir, touched)
+        self.term_changes = {}
+        self.page_changes = {}
+        self.noted_changes = 0
+        print(f"Wrote search index: {page_count} pages, {len(touched)} files updated"
+              + (" (full rewrite)" if full else ""))
+        return touched
+
+    def _write_all(self, search_dir, touched):
+        # Every file is written anyway, so the ids are handed out afresh in walk order,
+        # which makes the index of a site the same however its pages were recorded
+        page_count = 0
+        for page_id, (source, page) in enumerate(self.pages.items()):
+            if page["id"] != page_id:
+                page["id"] = page_id
+                self.pages[source] = page
+            page_count += 1
+        self.next_id = page_count
+        self.free_ids = []
+        written = set()
+        for number, pages in self._page_files():
+            path = os.path.join(search_dir, "p", f"{number}.json")
+            _write_file(path, _compact_json(pages), touched)
+            written.add(path)
+        for name, terms in self._shards():
+            path = os.path.join(search_dir, "t", f"{name}.json")
+            _write_file(path, _shard_json(terms), touched)
+            written.add(path)
+        for directory in ("t", "p"):
+            for file in sorted(os.listdir(os.path.join(search_dir, directory))):
+                path = os.path.join(search_dir, directory, file)
+                if path not in written:
+                    _write_file(path, None, touched)
+        return page_count
+
+    def _write_changes(self, search_dir, touched):
+        changes_by_file = {}
+        for page_id, entry in self.page_changes.items():
+            changes_by_file.setdefault(page_id // PAGES_PER_FILE, {})[str(page_id)] = entry
+        for number, page_changes in sorted(changes_by_file.items()):
+            path = os.path.join(search_dir, "p", f"{number}.json")
+            pages = _read_json(path)
+            for page_id, entry in page_changes.items():
+                if entry is None:
+                    pages.pop(page_id, None)
+                else:
+                    pages[page_id] = entry
+            pages = dict(sorted(pages.items(), key=lambda item: int(item[0])))
+            _write_file(path, _compact_json(pages) if pages else None, touched)
+
+        changes_by_shard = {}
+        for term, changes in self.term_changes.items():
+            changes_by_shard.setdefault(shard_name(term[:PREFIX_LENGTH]), {})[term] = changes
+        for name, term_changes in sorted(changes_by_shard.items()):
+            path = os.path.join(search_dir, "t", f"{name}.json")
+            shard = _read_json(path)
+            for term, changes in term_changes.items():
+                ids = set(_ids(shard.get(term, [])))
+                for page_id, present in changes.items():
+                    if present:
+                        ids.add(page_id)
+                    else:
+                        ids.discard(page_id)
+                if ids:
+                    shard[term] = _gaps(sorted(ids))
+                else:
+                    shard.pop(term, None)
+            _write_file(path, _compact_json(dict(sorted(shard.items()))) if shard else None, touched)
+
+
+def _gaps(ids):
+    return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+
+
+def _ids(gaps):
+    return itertools.accumulate(gaps)
+
+
+def _read_json(path):
+    """
+    Returns the JSON object in a file the index wrote, or an empty dict if it is
+    missing or unreadable.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_file(path, text, touched):
+    """
+    Writes text, a string or an iterable of strings, to path, or deletes path if
+    text is None, and appends (path, status) to touched unless the file was left as
+    it was.
+    """
+    if text is None:
+        if os.path.exists(path):
+            os.remove(path)
+            touched.append((path, "deleted"))
+        return
+    status = _write_if_changed(path, [text] if isinstance(text, str) else text)
+    if status != "unchanged":
+        touched.append((path, status))
+
+
+def _compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _shard_json(terms):
+    """
+    Yields the _compact_json of a shard in pieces, from the (term, ascending page
+    ids) pairs _shards gives, so no posting list is held whole.
+    """
+    yield "{"
+    for number, (term, ids) in enumerate(terms):
+        yield ("," if number else "") + _compact_json(term) + ":["
+        previous = 0
+        for chunk_number, chunk in enumerate(batched(ids, POSTINGS_PER_CHUNK)):
+            gaps = []
+            for page_id in chunk:
+                gaps.append(page_id - previous)
+                previous = page_id
+            yield ("," if chunk_number else "") + ",".join(map(str, gaps))
+        yield "]"
+    yield "}"
+
+
+def _write_if_changed(path, chunks):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    if files_equal(tmp_path, path):
+        os.remove(tmp_path)
+        return "unchanged"
+    status = "changed" if os.path.exists(path) else "added"
+    os.replace(tmp_path, path)
+    return status
+
+
+def page_url(dest_path, dest_dir):
+    """
+    Returns the URL of an output page relative to the site root, dropping a
+    trailing index.html: "docs/blog/tom/index.html" becomes "blog/tom/".
+    """
+    url = os.path.relpath(dest_path, dest_dir).replace(os.sep, "/")
+    if url == "index.html":
+        return ""
+    if url.endswith("/index.html"):
+        return url[:-len("index.html")]
+    return url
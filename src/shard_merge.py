@@ -0,0 +1,241 @@
+import argparse
+import os
+import shutil
+import sys
+from depgraph import DependencyGraph, DEPGRAPH_PATH
+from image_meta import ImageIndex, IMAGE_INDEX_PATH
+from main import CONTENT_DIR, DEST_DIR, SHARDS_DIR, STATIC_DIR, page_dest_path, page_shard
+from manifest import BuildManifest, OutputChanges, MANIFEST_PATH, CHANGES_PATH, files_equal
+from search_index import SearchIndex, SEARCH_PAGES_PATH
+from static_sync import remove_empty_dirs
+
+
+class Shard:
+    """
+    The output and build state of one shard build, read from the directory the
+    build wrote them to (see main.shard_dir), wherever that directory was moved.
+
+    Args:
+        directory: The shard's directory, such as "shards/2-of-4".
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.dest_dir = os.path.join(directory, DEST_DIR)
+        self.manifest = BuildManifest.load(os.path.join(directory, MANIFEST_PATH))
+        self.search_path = os.path.join(directory, SEARCH_PAGES_PATH)
+        self.graph_path = os.path.join(directory, DEPGRAPH_PATH)
+        self.image_index_path = os.path.join(directory, IMAGE_INDEX_PATH)
+
+    @property
+    def name(self):
+        index, count = self.manifest.shard
+        return f"shard {index}/{count} ({self.directory})"
+
+    def outputs(self):
+        """
+        Returns the files the shard produced as a dict of path relative to the output
+        directory to the path of the file in the shard.
+        """
+        outputs = {}
+        for source in self.manifest.pages:
+            relative_path = page_dest_path(source, "")
+            outputs[relative_path] = os.path.join(self.dest_dir, relative_path)
+        for relative_path in self.manifest.static_files:
+            outputs[relative_path] = os.path.join(self.dest_dir, relative_path)
+        return outputs
+
+
+def find_shards(shards_dir=SHARDS_DIR):
+    """
+    Returns the directories of the shard builds under shards_dir, sorted.
+    """
+    if not os.path.isdir(shards_dir):
+        return []
+    return sorted(os.path.join(shards_dir, name) for name in os.listdir(shards_dir)
+                  if os.path.isdir(os.path.join(shards_dir, name)))
+
+
+def check_shards(shards, search=True):
+    """
+    Returns the files the shards produced, as a dict of path relative to the output
+    directory to the path of the file in its shard, after checking that the shards
+    add up to one build of the whole site.
+
+    Raises:
+        ValueError: Listing every problem found: a directory that holds no shard
+            build, shards missing or given twice, shards built with different
+            settings or by a different partition, a file produced by two shards, or
+            an output the shard's manifest lists but that is not there.
+    """
+    errors = []
+    for shard in shards:
+        if shard.manifest.shard is None:
+            errors.append(f"{shard.directory} holds no shard build")
+        elif search and not os.path.exists(shard.search_path):
+            errors.append(f"{shard.name} was built without the search index; merge with --no-search")
+    if errors:
+        raise ValueError("\n".join(errors))
+    if not shards:
+        raise ValueError("No shards to merge")
+
+    count = shards[0].manifest.shard[1]
+    names = {}
+    for shard in shards:
+        index, shard_count = shard.manifest.shard
+        if shard_count != count:
+            errors.append(f"{shard.name} is one of {shard_count} shards, not {count}")
+        elif index in names:
+            errors.append(f"{shard.name} is the same shard as {names[index]}")
+        else:
+            names[index] = shard.name
+    missing = [f"{index}/{count}" for index in range(1, count + 1) if index not in names]
+    if missing:
+        errors.append(f"Missing shards {', '.join(missing)}")
+
+    first = shards[0].manifest
+    for shard in shards[1:]:
+        if (shard.manifest.template_hash, shard.manifest.basepath, shard.manifest.url_rewriters,
+                shard.manifest.parser_version) != (
+                first.template_hash, first.basepath, first.url_rewriters, first.parser_version):
+            errors.append(f"{shard.name} was built with another template, basepath, URL rewriters or parser "
+                          f"version than {shards[0].name}")
+
+    owners = {}
+    outputs = {}
+    for shard in shards:
+        index, shard_count = shard.manifest.shard
+        for source in sorted(shard.manifest.pages):
+            if page_shard(source, shard_count) != index:
+                errors.append(f"{shard.name} built {source}, which belongs to shard "
+                              f"{page_shard(source, shard_count)}/{shard_count}")
+        for relative_path, path in sorted(shard.outputs().items()):
+            if relative_path in owners:
+                errors.append(f"{relative_path} is produced by both {owners[relative_path]} and {shard.name}")
+                continue
+            if not os.path.isfile(path):
+                errors.append(f"{shard.name} lists {relative_path} but {path} does not exist")
+            owners[relative_path] = shard.name
+            outputs[relative_path] = path
+    if errors:
+        raise ValueError("\n".join(errors))
+    return outputs
+
+
+def merge_shards(shard_dirs, dest_dir=DEST_DIR, manifest_path=MANIFEST_PATH, graph_path=DEPGRAPH_PATH,
+                 search_path=SEARCH_PAGES_PATH, changes_path=CHANGES_PATH, search=True,
+                 image_index_path=IMAGE_INDEX_PATH):
+    """
+    Combines the outputs of shard builds into one output directory, as if the whole
+    site had been built in one go. Nothing is written unless check_shards finds the
+    shards complete and disjoint.
+
+    Files are copied only if they differ from what dest_dir holds, and the files the
+    previous build or merge recorded that no shard produced are deleted. The merged
+    manifest, dependency graph and image index are saved where a normal build keeps
+    them, so the next build of the whole site is incremental, and the search index
+    is updated with the search terms of every shard.
+
+    Args:
+        shard_dirs: The shard directories, such as ["shards/1-of-2", "shards/2-of-2"].
+        dest_dir: The output directory to merge into.
+        manifest_path: Where the merged manifest is saved; the manifest found there
+            tells which files the previous build wrote.
+        graph_path: Where the merged dependency graph is saved.
+        search_path: Where the merged search terms are saved.
+        changes_path: Where the OutputChanges of the merge are saved.
+        search: Write the search index.
+        image_index_path: Where the merged image index is saved, unless the shards
+            were built without image dimensions.
+
+    Returns:
+        The OutputChanges of the merge.
+
+    Raises:
+        ValueError: If the shards do not add up to one build (see check_shards).
+    """
+    shards = [Shard(directory) for directory in shard_dirs]
+    outputs = check_shards(shards, search)
+    first = shards[0].manifest
+
+    changes = OutputChanges(dest_dir)
+    for relative_path, path in sorted(outputs.items()):
+        dest_path = os.path.join(dest_dir, relative_path)
+        if files_equal(path, dest_path):
+            continue
+        status = "changed" if os.path.exists(dest_path) else "added"
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        shutil.copy2(path, dest_path)
+        changes.record(dest_path, status)
+
+    previous = BuildManifest.load(manifest_path)
+    previous_outputs = [page_dest_path(source, "") for source in previous.pages] + previous.static_files
+    for relative_path in sorted(set(previous_outputs) - set(outputs)):
+        dest_path = os.path.join(dest_dir, relative_path)
+        if os.path.exists(dest_path):
+            print(f"Removing {dest_path}, which no shard produced")
+            os.remove(dest_path)
+            remove_empty_dirs(os.path.dirname(dest_path), dest_dir)
+            changes.record(dest_path, "deleted")
+
+    manifest = BuildManifest(manifest_path)
+    manifest.template_hash = first.template_hash
+    manifest.basepath = first.basepath
+    manifest.url_rewriters = first.url_rewriters
+    manifest.parser_version = first.parser_version
+    for shard in shards:
+        for source, entry in shard.manifest.pages.items():
+            manifest.record_page(source, entry["hash"], page_dest_path(source, dest_dir))
+        manifest.static_files = sorted(set(manifest.static_files) | set(shard.manifest.static_files))
+    manifest.save()
+
+    graph = DependencyGraph(graph_path, CONTENT_DIR, STATIC_DIR)
+    for shard in shards:
+        graph.pages.update(DependencyGraph.load(shard.graph_path, CONTENT_DIR, STATIC_DIR).pages)
+    graph.save()
+
+    # Every shard indexes all of static/, so later shards only add the images that changed in between
+    images = ImageIndex(image_index_path, STATIC_DIR)
+    for shard in shards:
+        images.images.update(ImageIndex.load(shard.image_index_path, STATIC_DIR).images)
+    images.changed = bool(images.images)
+    images.save()
+
+    if search:
+        # Starting from the previous merge keeps page ids, so only the index files that changed are rewritten
+        index = SearchIndex.load(search_path)
+        sources = set()
+        for shard in shards:
+            for source, page in SearchIndex.load(shard.search_path).pages.items():
+                index.record_page(source, page["url"], page["title"], page["terms"])
+                sources.add(source)
+        for source in [source for source in index.pages if source not in sources]:
+            index.forget_page(source)
+        for path, status in index.write(dest_dir):
+            changes.record(path, status)
+        index.save()
+
+    print(f"Merged {len(shards)} shards into {dest_dir}: {len(manifest.pages)} pages, "
+          f"{len(manifest.static_files)} static files")
+    changes.save(changes_path)
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=f"Merge the shard builds made with main.py --shard i/N into {DEST_DIR}/, checking that they "
+                    "cover every shard once and that no two produce the same file.")
+    parser.add_argument("shards", nargs="*",
+                        help=f"shard directories (default: every directory under {SHARDS_DIR}/)")
+    parser.add_argument("--no-search", action="store_true", help="do not write the client-side search index")
+    args = parser.parse_args(argv)
+
+    try:
+        merge_shards(args.shards or find_shards(), search=not args.no_search)
+    except ValueError as e:
+        print(f"Cannot merge the shards:\n{e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+Build state kept on disk rather than in memory, so that a build's memory does not
+grow with the number of pages (see pipeline).
+
+State with an entry per page lives in a PageTable file: a JSON header line, then
+one line per page holding its key (such as a markdown path) and value as JSON,
+separated by a tab. The lines are sorted by walk_key, the order discover_pages
+walks the content directory in, so a build reads the table alongside its walk and
+writes what changed in that same order; save() merges the two in one pass.
+
+Anything else a build has to sort or dedupe, such as the postings of the search
+index, goes through sorted_spill, which sorts in runs of bounded size on disk.
+"""
+import heapq
+import itertools
+import json
+import os
+import tempfile
+from collections.abc import MutableMapping
+
+# Items sorted_spill sorts in memory before writing them out as a run
+RUN_ITEMS = 4096
+# Runs sorted_spill merges at once; more are merged in rounds, keeping few files open
+MERGE_FAN_IN = 64
+# Places a PageTable reads its file from at once, such as the walk and the results of a build
+MAX_CURSORS = 3
+# Change files a PageTable merges on every read; past this it loads the table instead
+MAX_LAYERS = 8
+TOMBSTONE = b"null"
+
+
+def walk_key(path):
+    """
+    Returns the sort key of a path in the order a sorted os.walk yields it: the
+    files of a directory by name, then its subdirectories by name, each with
+    everything under it.
+    """
+    parts = path.split(os.sep)
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+def _encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def sorted_spill(items, key=None, directory=None, run_items=RUN_ITEMS):
+    """
+    Yields items sorted by key, like sorted(), holding at most run_items of them in
+    memory: every run of run_items is sorted and written to a temporary file, and
+    the runs are merged as they are read back. The items must survive a JSON round
+    trip (tuples come back as lists).
+
+    Args:
+        items: Iterable of the items to sort, consumed before the first is yielded.
+        key: Optional function of an item to sort by.
+        directory: Where the runs are written (default: the system's temporary
+            directory), created if missing.
+    """
+    items = iter(items)
+    first = list(itertools.islice(items, run_items))
+    first.sort(key=key)
+    if len(first) < run_items:
+        # Fits in one run, which is not worth writing out
+        yield from first
+        return
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    runs = []
+    try:
+        run, first = first, None
+        while run:
+            runs.append(_write_run(run, directory))
+            run = list(itertools.islice(items, run_items))
+            run.sort(key=key)
+        while len(runs) > MERGE_FAN_IN:
+            merged = _write_run(heapq.merge(*map(_read_run, runs[:MERGE_FAN_IN]), key=key), directory)
+            for path in runs[:MERGE_FAN_IN]:
+                os.remove(path)
+            runs = runs[MERGE_FAN_IN:] + [merged]
+        yield from heapq.merge(*map(_read_run, runs), key=key)
+    finally:
+        for path in runs:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _write_run(items, directory):
+    fd, path = tempfile.mkstemp(dir=directory, prefix="run.", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        for item in items:
+            f.write(_encode(item) + b"\n")
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class KeyLog:
+    """
+    An append-only list of strings, such as the pages a build walked, kept in an
+    unnamed temporary file. It can be read back any number of times, but only once
+    at a time.
+
+    Args:
+        directory: Where the file is kept (default: the system's temporary directory).
+    """
+
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+
+    def append(self, key):
+        self.file.write(_encode(key) + b"\n")
+
+    def __iter__(self):
+        self.file.flush()
+        self.file.seek(0)
+        try:
+            for line in self.file:
+                yield json.loads(line)
+        finally:
+            # Appending again starts at the end, however much was read
+            self.file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self.file.close()
+
+
+def load_table(path):
+    """
+    Opens the PageTable file at path without reading its pages.
+
+    Returns:
+        A (header, PageTable) tuple.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If its header is not a JSON object.
+    """
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        offset = f.tell()
+    if not isinstance(header, dict):
+        raise ValueError("the header is not a JSON object")
+    return header, PageTable(path, offset=offset, header=header)
+
+
+def _records(path, offset):
+    """
+    Yields the (walk key, key, raw value) of every line of a table or change file
+    from offset on, leaving the values unparsed.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            tab = line.index(b"\t")
+            key = json.loads(line[:tab])
+            yield walk_key(key), key, line[tab + 1:].rstrip(b"\n")
+
+
+def _tagged(records, tag):
+    for walk, key, raw in records:
+        yield walk, tag, key, raw
+
+
+class _Cursor:
+    """
+    A place in a table file: every line before the walk key of the last lookup has
+    been read, and pending is the first line at or after it, or None at the end.
+    """
+    __slots__ = ("records", "position", "pending")
+
+    def __init__(self, records):
+        self.records = records
+        self.position = ()
+        self.pending = next(records, None)
+
+    def seek(self, walk):
+        self.position = walk
+        while self.pending is not None and self.pending[0] < walk:
+            self.pending = next(self.records, None)
+        if self.pending is not None and self.pending[0] == walk:
+            return self.pending[2]
+        return None
+
+
+class PageTable(MutableMapping):
+    """
+    A mapping of page keys, such as markdown paths, to JSON values that is read from
+    its file (see the module docstring) as it is used instead of being loaded.
+
+    A lookup reads the file forward from where an earlier lookup left off, so
+    looking pages up in walk order, as a build does, reads the file once however
+    many pages it holds. Changes are appended to change files in the order they are
+    made, a new file whenever a key does not come after the last one changed, and
+    save() merges them into the table. Iterating merges them on the fly, in walk
+    order.
+
+    Anything else, such as looking up a page at or before one already changed, is
+    served by loading the whole table into a dict, which the table keeps using from
+    then on; so is a table given its pages as a dict.
+
+    Args:
+        path: The table file, or None for a new table.
+        offset: Where the pages start in the file, after its header.
+        pages: Optional dict of the pages, for a table kept in memory.
+        header: The header the file was loaded with, if any.
+        directory: Where change files are written (default: the directory of path).
+    """
+
+    def __init__(self, path=None, offset=0, pages=None, header=None, directory=None):
+        self.path = path
+        self.offset = offset
+        self.header = header
+        self.directory = directory or (os.path.dirname(path) if path else None)
+        self._dict = pages
+        self._cursors = []
+        # Change files, oldest first, and the one being written to
+        self._layers = []
+        self._writer = None
+        self._last_written = None
+        self._last_changed = None
+
+    def get(self, key, default=None):
+        if self._dict is None:
+            walk = walk_key(key)
+            if self._last_changed is None or walk > self._last_changed:
+                if self.path is None:
+                    return default
+                cursor = self._cursor(walk)
+                if cursor is not None:
+                    raw = cursor.seek(walk)
+                    return default if raw is None else json.loads(raw)
+            self._load()
+        return self._dict.get(key, default)
+
+    def _cursor(self, walk):
+        """
+        Returns the cursor that reads least to get to walk, a new one if none is
+        before it, or None if there are MAX_CURSORS already.
+        """
+        usable = [cursor for cursor in self._cursors if cursor.position <= walk]
+        if usable:
+            return max(usable, key=lambda cursor: cursor.position)
+        if len(self._cursors) == MAX_CURSORS:
+            return None
+        cursor = _Cursor(_records(self.path, self.offset))
+        self._cursors.append(cursor)
+        return cursor
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, value):
+        if self._dict is not None:
+            self._dict[key] = value
+        else:
+            self._write(key, _encode(value))
+
+    def discard(self, key):
+        """
+        Removes key if present, without looking it up.
+        """
+        if self._dict is not None:
+            self._dict.pop(key, None)
+        else:
+            self._write(key, TOMBSTONE)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.discard(key)
+
+    def pop(self, key, default=None):
+        value = self.get(key)
+        if value is None:
+            return default
+        self.discard(key)
+        return value
+
+    def _write(self, key, raw):
+        walk = walk_key(key)
+        if self._writer is None or walk <= self._last_written:
+            self._seal()
+            if len(self._layers) == MAX_LAYERS:
+                self._load()
+                if raw == TOMBSTONE:
+                    self._dict.pop(key, None)
+                else:
+                    self._dict[key] = json.loads(raw)
+                return
+            directory = self.directory or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=directory, prefix="changes.", suffix=".tmp")
+            self._writer = os.fdopen(fd, "wb")
+            self._layers.append(path)
+        self._writer.write(_encode(key) + b"\t" + raw + b"\n")
+        self._last_written = walk
+        if self._last_changed is None or walk > self._last_changed:
+            self._last_changed = walk
+
+    def _seal(self):
+        """
+        Finishes the change file being written, so it can be read; the next change
+        starts a new one.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _raw_items(self):
+        """
+        Yields the (key, raw value) of every page in walk order, merging the table
+        file with the change files as they are when this is called.
+        """
+        if self._dict is not None:
+            for key, value in sorted(self._dict.items(), key=lambda item: walk_key(item[0])):
+                yield key, _encode(value)
+            return
+        self._seal()
+        sources = [_records(path, 0) for path in self._layers]
+        if self.path is not None:
+            sources.insert(0, _records(self.path, self.offset))
+        merged = heapq.merge(*(_tagged(records, tag) for tag, records in enumerate(sources)))
+        for _, versions in itertools.groupby(merged, key=lambda record: record[0]):
+            # The newest change to a key wins
+            *_, (_, _, key, raw) = versions
+            if raw != TOMBSTONE:
+                yield key, raw
+
+    def items(self):
+        """
+        Yields the (key, value) of every page in walk order.
+        """
+        if self._dict is not None:
+            yield from sorted(self._dict.items(), key=lambda item: walk_key(item[0]))
+            return
+        for key, raw in self._raw_items():
+            yield key, json.loads(raw)
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def __iter__(self):
+        if self._dict is not None:
+            return iter(sorted(self._dict, key=walk_key))
+        return (key for key, _ in self._raw_items())
+
+    def __len__(self):
+        if self._dict is not None:
+            return len(self._dict)
+        return sum(1 for _ in self._raw_items())
+
+    def __repr__(self):
+        return f"PageTable({dict(self.items())!r})"
+
+    def prune(self, keys, on_removed=None):
+        """
+        Removes every page whose key is not among keys, calling on_removed(key,
+        value) for each first.
+
+        Args:
+            keys: Iterable of the keys to keep, in walk order, such as a KeyLog of
+                the pages a build walked.
+            on_removed: Optional function called with each removed page.
+        """
+        keys = iter(keys)
+        kept = next(keys, None)
+        kept_walk = None if kept is None else walk_key(kept)
+        for key, raw in self._raw_items():
+            walk = walk_key(key)
+            while kept_walk is not None and kept_walk < walk:
+                kept = next(keys, None)
+                kept_walk = None if kept is None else walk_key(kept)
+            if kept_walk == walk:
+                continue
+            if on_removed is not None:
+                on_removed(key, json.loads(raw))
+            self.discard(key)
+
+    def save(self, path, header):
+        """
+        Writes the table to path atomically, with header as its first line, and
+        reads it from there from then on. A table that did not change since it was
+        loaded from path is left as it is.
+        """
+        if self._dict is None and not self._layers and path == self.path and header == self.header:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_encode(header) + b"\n")
+            offset = f.tell()
+            for key, raw in self._raw_items():
+                f.write(_encode(key) + b"\t" + raw + b"\n")
+        self._close()
+        os.replace(tmp_path, path)
+        if self._dict is None:
+            self.path = path
+            self.offset = offset
+            self.header = header
+            self.directory = directory or None
+
+    def _load(self):
+        """
+        Loads every page into a dict, which the table uses from then on.
+        """
+        pages = dict(self.items())
+        self._close()
+        self._dict = pages
+
+    def _close(self):
+        self._seal()
+        for cursor in self._cursors:
+            cursor.records.close()
+        self._cursors = []
+        for path in self._layers:
+            os.remove(path)
+        self._layers = []
+        self._last_written = None
+        self._last_changed = None
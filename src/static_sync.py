@@ -0,0 +1,140 @@
+import os
+import shutil
+from manifest import hash_file
+
+
+def list_static_files(source_dir):
+    """
+    Returns the paths of every file under source_dir, relative to it and sorted,
+    excluding Zone.Identifier files.
+    """
+    files = []
+    for root, _, names in os.walk(source_dir):
+        for name in names:
+            source_item = os.path.join(root, name)
+            if name.endswith(":Zone.Identifier"):
+                print(f"Skipping file: {source_item}")
+                continue
+            files.append(os.path.relpath(source_item, source_dir))
+    files.sort()
+    return files
+
+
+def is_file_current(source_item, dest_item, use_hash=False):
+    """
+    Returns True if dest_item already holds the same file as source_item.
+
+    Files with the same size and modification time are assumed to be identical,
+    since copies are made with copy2, which preserves mtimes. With use_hash, files
+    whose size or mtime differ are also compared by content hash, so a touched but
+    unmodified source does not cause a copy. The copy then gets the source's mtime,
+    so the next sync finds it current without hashing either file again.
+    """
+    try:
+        dest_stat = os.stat(dest_item)
+    except FileNotFoundError:
+        return False
+    source_stat = os.stat(source_item)
+    if source_stat.st_size != dest_stat.st_size:
+        return False
+    if source_stat.st_mtime_ns == dest_stat.st_mtime_ns:
+        return True
+    if not use_hash or hash_file(source_item) != hash_file(dest_item):
+        return False
+    shutil.copystat(source_item, dest_item)
+    return True
+
+
+def copy_static_file(source_dir, dest_dir, relative_path, use_hash=False):
+    """
+    Copies one static file into dest_dir unless an identical copy is already there.
+    Returns True if the file was copied.
+    """
+    source_item = os.path.join(source_dir, relative_path)
+    dest_item = os.path.join(dest_dir, relative_path)
+    if is_file_current(source_item, dest_item, use_hash):
+        return False
+    print(f"Copying file: {source_item} to {dest_item}")
+    os.makedirs(os.path.dirname(dest_item), exist_ok=True)
+    shutil.copy2(source_item, dest_item)  # copy2 preserves metadata
+    return True
+
+
+def remove_static_file(source_dir, dest_dir, relative_path):
+    """
+    Removes the copy of a static file that was deleted from source_dir, along with
+    any directories that removal leaves empty.
+    """
+    dest_item = os.path.join(dest_dir, relative_path)
+    if os.path.exists(dest_item):
+        print(f"Removing file deleted from {source_dir}: {dest_item}")
+        os.remove(dest_item)
+        remove_empty_dirs(os.path.dirname(dest_item), dest_dir)
+
+
+def sync_static(source_dir, dest_dir, previous_files=(), use_hash=False):
+    """
+    Makes dest_dir mirror the static files in source_dir without touching files that
+    did not change. New and changed files are copied with their metadata, and files
+    that were synced by a previous build but no longer exist in source_dir are removed.
+    Other files in dest_dir, such as generated pages, are left alone.
+
+    Args:
+        source_dir: Path to the static directory.
+        dest_dir: Path to the destination directory (e.g., "docs").
+        previous_files: Relative paths synced by the previous build.
+        use_hash: Compare file contents when size or mtime differ.
+
+    Returns:
+        A dict with the sorted relative paths of every synced file ("files"), the
+        ones that were copied ("copied") and the ones that were removed ("removed").
+    """
+    files = list_static_files(source_dir)
+    copied = [path for path in files if copy_static_file(source_dir, dest_dir, path, use_hash)]
+
+    removed = sorted(set(previous_files) - set(files))
+    for relative_path in removed:
+        remove_static_file(source_dir, dest_dir, relative_path)
+
+    print(f"Synced static files: {len(copied)} copied, {len(files) - len(copied)} unchanged, {len(removed)} removed")
+    return {"files": files, "copied": copied, "removed": removed}
+
+
+def sync_static_paths(source_dir, dest_dir, relative_paths, previous_files=(), use_hash=False):
+    """
+    Like sync_static, but only looks at the given paths, relative to source_dir.
+    Paths that still exist are copied if they changed; paths that are gone are
+    removed from dest_dir.
+
+    Returns:
+        The same dict as sync_static, with "files" updated from previous_files.
+    """
+    files = set(previous_files)
+    copied = []
+    removed = []
+    for relative_path in sorted(set(relative_paths)):
+        if relative_path.endswith(":Zone.Identifier"):
+            continue
+        if os.path.isfile(os.path.join(source_dir, relative_path)):
+            files.add(relative_path)
+            if copy_static_file(source_dir, dest_dir, relative_path, use_hash):
+                copied.append(relative_path)
+        elif relative_path in files:
+            files.discard(relative_path)
+            remove_static_file(source_dir, dest_dir, relative_path)
+            removed.append(relative_path)
+    return {"files": sorted(files), "copied": copied, "removed": removed}
+
+
+def remove_empty_dirs(directory, stop_dir):
+    """
+    Removes directory and its parents while they are empty, stopping at stop_dir.
+    """
+    stop_dir = os.path.abspath(stop_dir)
+    directory = os.path.abspath(directory)
+    while directory != stop_dir and directory.startswith(stop_dir + os.sep):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
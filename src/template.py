@@ -0,0 +1,101 @@
+import os
+import re
+from urls import rewrite_html_urls
+
+PLACEHOLDER_PATTERN = re.compile(r"(\{\{\s*(\w+)\s*\}\})")
+
+
+class Template:
+    """
+    An HTML template split once into static chunks and named slots.
+
+    "{{ Title }}" and "{{ Content }}" style placeholders become slots; rendering fills
+    every slot and joins the pieces in a single pass instead of copying the whole
+    document once per placeholder.
+    """
+
+    def __init__(self, source, name=None):
+        self.name = name
+        self.parts = []
+        self.slots = []
+        self._slot_at = {}
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            self.parts.append(source[pos:match.start()])
+            self.slots.append((len(self.parts), match.group(2)))
+            self._slot_at[len(self.parts)] = match.group(2)
+            # Keep the raw placeholder so unfilled slots render unchanged
+            self.parts.append(match.group(1))
+            pos = match.end()
+        self.parts.append(source[pos:])
+
+    @property
+    def slot_names(self):
+        return [name for _, name in self.slots]
+
+    def render(self, **values):
+        """
+        Returns the template with each slot replaced by the value of the same name.
+        Slots without a value are left as written in the template.
+        """
+        parts = list(self.parts)
+        for index, name in self.slots:
+            if name in values:
+                parts[index] = values[name]
+        return "".join(parts)
+
+    def render_to(self, writer, **values):
+        """
+        Streams the template to writer, filling each slot as it is reached. A value
+        may be a string or anything with a render_to(writer) method, such as an
+        HTMLNode, which is then rendered straight into writer.
+        """
+        for index, part in enumerate(self.parts):
+            name = self._slot_at.get(index)
+            if name is None or name not in values:
+                writer.write(part)
+                continue
+            value = values[name]
+            if isinstance(value, str):
+                writer.write(value)
+            else:
+                value.render_to(writer)
+
+    def __repr__(self):
+        return f"Template({self.name}, slots: {self.slot_names})"
+
+
+_template_cache = {}
+
+
+def load_template(template_path, url_rewriter=None):
+    """
+    Returns the compiled Template for a file, reading and splitting it only the
+    first time it is requested (or again after the file changes on disk).
+
+    Args:
+        template_path: Path to the HTML template file.
+        url_rewriter: Optional UrlRewriter applied to the href and src attributes
+            in the template, such as the stylesheet link.
+
+    Raises:
+        FileNotFoundError: If the template does not exist.
+    """
+    stat = os.stat(template_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cache_key = (template_path, None if url_rewriter is None else url_rewriter.key)
+    cached = _template_cache.get(cache_key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(template_path, "r") as f:
+        source = f.read()
+    if url_rewriter is not None:
+        source = rewrite_html_urls(source, url_rewriter)
+    template = Template(source, template_path)
+    _template_cache[cache_key] = (key, template)
+    return template
+
+
+def clear_template_cache():
+    _template_cache.clear()
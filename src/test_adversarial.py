@@ -0,0 +1,48 @@
+import unittest
+import os
+from benchmark import adversarial_cases, time_call
+from corpus import fuzz_markdown
+from inline_markdown import markdown_to_html_node
+
+# Input sizes in KiB. Set STATICSITE_ADVERSARIAL_KB to e.g. "256,4096" to check the
+# claim on larger input; the default keeps the suite quick
+SMALL_KB, LARGE_KB = (int(size) for size in os.environ.get("STATICSITE_ADVERSARIAL_KB", "16,64").split(","))
+SECONDS_PER_MB = float(os.environ.get("STATICSITE_SECONDS_PER_MB", "5"))
+# Linear code takes LARGE_KB / SMALL_KB times as long on the large input, quadratic
+# code that squared. Allow for timer noise, and skip the ratio for times so short
+# that noise dominates them. A case over the limit is timed again with more repeats
+# before it fails, as a busy machine can slow down any single measurement
+GROWTH_TOLERANCE = 2
+MIN_RATIO_SECONDS = 0.005
+RETRY_REPEAT = 10
+
+
+class TestAdversarialInputs(unittest.TestCase):
+    def test_runtime_grows_linearly(self):
+        growth = LARGE_KB / SMALL_KB
+        for name, func, case, build in adversarial_cases():
+            with self.subTest(function=name, case=case):
+                small_text, text = build(SMALL_KB * 1024), build(LARGE_KB * 1024)
+                small, large = time_call(func, small_text), time_call(func, text)
+                if large > MIN_RATIO_SECONDS and large / small >= growth * GROWTH_TOLERANCE:
+                    small = time_call(func, small_text, repeat=RETRY_REPEAT)
+                    large = time_call(func, text, repeat=RETRY_REPEAT)
+                seconds_per_mb = large / (len(text.encode()) / 1e6)
+                self.assertLess(seconds_per_mb, SECONDS_PER_MB,
+                                f"{name} took {seconds_per_mb:.2f} s/MB on {case}")
+                if large > MIN_RATIO_SECONDS:
+                    self.assertLess(large / small, growth * GROWTH_TOLERANCE,
+                                    f"{name} took {small * 1000:.1f} ms on {SMALL_KB} KiB of {case} but "
+                                    f"{large * 1000:.1f} ms on {LARGE_KB} KiB")
+
+    def test_fuzzed_documents_render(self):
+        for seed in range(50):
+            with self.subTest(seed=seed):
+                markdown_to_html_node(fuzz_markdown(2000, seed)).to_html()
+
+    def test_long_item_numbers_are_not_list_items(self):
+        html = markdown_to_html_node("1" * 5000 + ". item").to_html()
+        self.assertTrue(html.startswith("<div><p>111"))
+
+if __name__ == "__main__":
+    unittest.main()
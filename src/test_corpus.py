@@ -0,0 +1,40 @@
+import unittest
+import os
+import tempfile
+from corpus import CorpusGenerator, parse_mix
+from inline_markdown import markdown_to_blocks, block_to_block_type, markdown_to_html_node, extract_title
+from textnode import BlockType
+
+class TestCorpus(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("paragraph=4, code=1"), {"paragraph": 4, "code": 1})
+        with self.assertRaises(ValueError):
+            parse_mix("table=1")
+        with self.assertRaises(ValueError):
+            parse_mix("paragraph=lots")
+
+    def test_pages_are_reproducible(self):
+        self.assertEqual(CorpusGenerator(seed=3).page("A", 20), CorpusGenerator(seed=3).page("A", 20))
+        self.assertNotEqual(CorpusGenerator(seed=3).page("A", 20), CorpusGenerator(seed=4).page("A", 20))
+
+    def test_block_mix_is_respected(self):
+        page = CorpusGenerator({"code": 1, "ordered_list": 1}).page("Mix", 40)
+        blocks = markdown_to_blocks(page)
+        self.assertEqual(len(blocks), 41)
+        self.assertEqual(extract_title(page), "Mix")
+        kinds = {block_to_block_type(block) for block in blocks[1:]}
+        self.assertEqual(kinds, {BlockType.CODE, BlockType.ORDERED_LIST})
+
+    def test_every_page_renders(self):
+        generator = CorpusGenerator(span_density=0.5)
+        for i in range(20):
+            markdown_to_html_node(generator.page(f"Page {i}", 10)).to_html()
+
+    def test_write_corpus(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = CorpusGenerator().write_corpus(tmp, 5, 3, pages_per_dir=2)
+            self.assertEqual(len(paths), 5)
+            self.assertEqual(sorted(os.listdir(tmp)), ["section0", "section1", "section2"])
+
+if __name__ == "__main__":
+    unittest.main()
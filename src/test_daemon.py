@@ -0,0 +1,103 @@
+import unittest
+import contextlib
+import io
+import os
+import tempfile
+import threading
+from daemon import BuildDaemon
+from daemon_client import send_request, daemon_running
+
+
+class DaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # The builder works on content/, static/ and template.html in the current directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp.name)
+        os.makedirs(os.path.join("content", "blog"))
+        os.makedirs("static")
+        self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.write(os.path.join("content", "index.md"), "# Home\n\nWelcome")
+        self.write(os.path.join("content", "blog", "post.md"), "# Post\n\nHello")
+        self.daemon = BuildDaemon()
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+
+class TestBuildDaemon(DaemonTestCase):
+    def test_builds_only_what_changed(self):
+        response = self.daemon.handle_request({"command": "build"})
+        self.assertTrue(response["ok"])
+        self.assertIn("index.html", response["changes"]["added"])
+        self.assertIn(os.path.join("blog", "post.html"), response["changes"]["added"])
+        self.assertEqual(self.daemon.handle_request({"command": "build"})["changes"],
+                         {"added": [], "changed": [], "deleted": []})
+
+        self.write(os.path.join("content", "blog", "post.md"), "# Post\n\nHello again")
+        response = self.daemon.handle_request({"command": "build", "paths": [os.path.abspath("content/blog/post.md")]})
+        self.assertIn(os.path.join("blog", "post.html"), response["changes"]["changed"])
+        self.assertIn("Generating page from content/blog/post.md", response["log"])
+        self.assertNotIn("content/index.md", response["log"])
+        with open(os.path.join("docs", "blog", "post.html")) as f:
+            self.assertEqual(f.read(), "<title>Post</title><div><h1>Post</h1><p>Hello again</p></div>")
+
+    def test_reports_failed_pages(self):
+        with open(os.path.join("content", "broken.md"), "wb") as f:
+            f.write(b"# Broken\n\n\xff")
+        response = self.daemon.handle_request({"command": "build"})
+        self.assertFalse(response["ok"])
+        self.assertEqual(response["failed"], [os.path.join("content", "broken.md")])
+
+    def test_reloads_state_written_by_another_build(self):
+        self.daemon.handle_request({"command": "build"})
+        other = BuildDaemon()
+        self.write(os.path.join("content", "index.md"), "# Home\n\nChanged elsewhere")
+        other.build()
+        response = self.daemon.handle_request({"command": "build"})
+        self.assertIn("changed on disk, reloading", response["log"])
+        self.assertEqual(response["changes"], {"added": [], "changed": [], "deleted": []})
+
+    def test_stats_and_errors(self):
+        self.daemon.handle_request({"command": "build"})
+        stats = self.daemon.handle_request({"command": "stats"})["stats"]
+        self.assertEqual((stats["builds"], stats["pages"], stats["search_pages"]), (1, 2, 2))
+        self.assertEqual(self.daemon.handle_line(b'{"command": "bulid"}'),
+                         b'{"ok": false, "error": "Unknown command: bulid"}\n')
+        self.assertIn(b'"ok": false', self.daemon.handle_line(b'{"command": "build", "paths": "a.md"}'))
+        self.assertIn(b'"ok": false', self.daemon.handle_line(b"not json"))
+
+
+class TestDaemonSocket(DaemonTestCase):
+    def test_requests_over_the_socket(self):
+        socket_path = os.path.join(".build", "daemon.sock")
+        ready = threading.Event()
+
+        def serve():
+            with contextlib.redirect_stdout(io.StringIO()):
+                ready.set()
+                self.daemon.serve(socket_path)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        ready.wait()
+        for _ in range(200):
+            if daemon_running(socket_path):
+                break
+            thread.join(0.01)
+        try:
+            self.assertTrue(send_request({"command": "build"}, socket_path)["ok"])
+            self.assertEqual(send_request({"command": "stats"}, socket_path)["stats"]["builds"], 1)
+            with self.assertRaises(RuntimeError):
+                BuildDaemon().serve(socket_path)
+        finally:
+            send_request({"command": "stop"}, socket_path)
+            thread.join()
+        self.assertFalse(os.path.exists(socket_path))
+        with self.assertRaises(OSError):
+            send_request({"command": "stats"}, socket_path)
+
+if __name__ == "__main__":
+    unittest.main()
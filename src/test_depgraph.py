@@ -0,0 +1,105 @@
+import unittest
+import os
+import tempfile
+from depgraph import DependencyGraph, ReferenceCollector, local_url_path
+from inline_markdown import markdown_to_html_node
+from parse_cache import ParseCache
+from test_manifest import BuildTestCase
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.content = os.path.join(self.tmp.name, "content")
+        self.static = os.path.join(self.tmp.name, "static")
+        os.makedirs(os.path.join(self.content, "blog", "tom"))
+        os.makedirs(os.path.join(self.static, "images"))
+        for path in ["index.md", "contact.md", os.path.join("blog", "tom", "index.md")]:
+            open(os.path.join(self.content, path), "w").close()
+        open(os.path.join(self.static, "images", "tom.png"), "w").close()
+        self.graph = DependencyGraph(os.path.join(self.tmp.name, "depgraph.json"), self.content, self.static)
+        self.index = os.path.join(self.content, "index.md")
+        collector = ReferenceCollector()
+        markdown_to_html_node("# Home\n\n![Tom](/images/tom.png) ![Gone](/images/gone.png)\n\n"
+                              "[Tom](/blog/tom) [Contact](/contact#form) [Home](/) [Web](https://example.com)",
+                              collector)
+        self.graph.record_references(self.index, "template.html", **collector.references())
+
+    def test_local_url_path(self):
+        self.assertEqual(local_url_path("/blog/tom/?x=1#top"), "blog/tom")
+        self.assertEqual(local_url_path("/"), "")
+        self.assertIsNone(local_url_path("https://example.com/"))
+        self.assertIsNone(local_url_path("//cdn.example.com/a.png"))
+
+    def test_edges_resolve_to_local_files(self):
+        self.assertEqual(self.graph.dependencies(self.index), {
+            "template": "template.html",
+            "images": [os.path.join(self.static, "images", "tom.png")],
+            "links": [os.path.join(self.content, "blog", "tom", "index.md"), os.path.join(self.content, "contact.md")],
+        })
+
+    def test_queries(self):
+        self.assertEqual(self.graph.pages_using(os.path.join(self.static, "images", "tom.png")), [self.index])
+        self.assertEqual(self.graph.pages_using("template.html"), [self.index])
+        self.assertEqual(self.graph.pages_using(os.path.join(self.static, "images", "other.png")), [])
+        self.assertEqual(self.graph.pages_linking_to(os.path.join(self.content, "contact.md")), [self.index])
+
+    def test_save_and_load(self):
+        self.graph.save()
+        loaded = DependencyGraph.load(self.graph.path, self.content, self.static)
+        self.assertEqual(loaded.pages, self.graph.pages)
+
+
+class TestGraphBuild(BuildTestCase):
+    def setUp(self):
+        super().setUp()
+        self.static = os.path.join(self.tmp.name, "static")
+        os.makedirs(self.static)
+        self.image = os.path.join(self.static, "tom.png")
+        self.write(self.image, "png")
+        self.post = os.path.join(self.content, "blog", "post.md")
+        self.write(self.post, "# Post\n\n![Tom](/tom.png)")
+        self.graph = DependencyGraph(os.path.join(self.tmp.name, "depgraph.json"), self.content, self.static)
+
+    def test_build_records_pages_and_forgets_deleted_ones(self):
+        self.build(graph=self.graph)
+        self.assertEqual(sorted(self.graph.pages), [self.post, os.path.join(self.content, "index.md")])
+        self.assertEqual(self.graph.pages_using(self.image), [self.post])
+        os.remove(self.post)
+        self.build(graph=self.graph)
+        self.assertEqual(list(self.graph.pages), [os.path.join(self.content, "index.md")])
+
+    def test_edges_are_collected_while_rendering(self):
+        self.write(self.post, "# Post\n\n![Tom](/tom.png) [Home](/)\n\n```\n![Code](/code.png)\n```")
+        self.write(os.path.join(self.static, "code.png"), "png")
+        self.build("/StaticSite/", graph=self.graph)
+        # URLs are resolved as written, before the basepath is added, and code is not scanned
+        self.assertEqual(self.graph.dependencies(self.post)["images"], [self.image])
+        self.assertEqual(self.graph.dependencies(self.post)["links"], [os.path.join(self.content, "index.md")])
+
+    def test_cached_pages_keep_their_edges(self):
+        cache = ParseCache(os.path.join(self.tmp.name, "cache"))
+        self.build(graph=self.graph, cache=cache)
+        edges = self.graph.dependencies(self.post)
+        os.remove(self.manifest_path)
+        self.graph.pages.clear()
+        log = self.build(graph=self.graph, cache=cache)
+        self.assertEqual(log.count("Using cached parse"), 2)
+        self.assertEqual(self.graph.dependencies(self.post), edges)
+
+    def test_pages_missing_from_graph_are_rebuilt(self):
+        self.build(graph=self.graph)
+        self.graph.forget_page(self.post)
+        log = self.build(graph=self.graph)
+        self.assertEqual(log.count("Generating page"), 1)
+        self.assertEqual(self.graph.pages_using(self.image), [self.post])
+
+    def test_invalidated_pages_are_rebuilt(self):
+        self.build(graph=self.graph)
+        log = self.build(graph=self.graph, invalidated=self.graph.pages_using(self.image))
+        self.assertEqual(log.count("Generating page"), 1)
+        self.assertIn("post.md", log)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from htmlnode import LeafNode, ParentNode
+import io
+from htmlnode import HTMLNode, LeafNode, ParentNode, escape_text, escape_attribute
 
 class TestParentNode(unittest.TestCase):
     def test_to_html_with_children(self):
@@ -41,5 +42,54 @@ class TestParentNode(unittest.TestCase):
         parent_node = ParentNode("div", [child_node], {"class": "container"})
         self.assertEqual(parent_node.to_html(), '<div class="container"><span>child</span></div>')
 
+class TestRenderTo(unittest.TestCase):
+    def test_render_to_matches_to_html(self):
+        node = ParentNode("div", [
+            ParentNode("p", [LeafNode(None, "Hi "), LeafNode("a", "link", {"href": "/x"})]),
+            LeafNode("img", "", {"src": "/i.png", "alt": "i"}),
+        ], {"class": "page"})
+        buffer = io.StringIO()
+        node.render_to(buffer)
+        self.assertEqual(buffer.getvalue(), node.to_html())
+
+    def test_render_to_writes_fragments(self):
+        class Recorder:
+            def __init__(self):
+                self.fragments = []
+            def write(self, text):
+                self.fragments.append(text)
+
+        recorder = Recorder()
+        ParentNode("ul", [LeafNode("li", "a"), LeafNode("li", "b")]).render_to(recorder)
+        self.assertEqual(recorder.fragments, ["<ul>", "<li>a</li>", "<li>b</li>", "</ul>"])
+
+    def test_render_to_leaf_without_value(self):
+        with self.assertRaises(ValueError):
+            ParentNode("p", [LeafNode("b", None)]).render_to(io.StringIO())
+
+class TestEscaping(unittest.TestCase):
+    def test_escape_text(self):
+        self.assertEqual(escape_text("a < b && c > \"d\""), "a &lt; b &amp;&amp; c &gt; \"d\"")
+        plain = "nothing to escape"
+        self.assertIs(escape_text(plain), plain)
+
+    def test_escape_attribute(self):
+        self.assertEqual(escape_attribute("/q?a=1&b='<x>'\""), "/q?a=1&amp;b=&#x27;&lt;x&gt;&#x27;&quot;")
+
+    def test_leaves_escape_values_and_props(self):
+        self.assertEqual(LeafNode(None, "1 < 2 & 3").to_html(), "1 &lt; 2 &amp; 3")
+        self.assertEqual(LeafNode("code", "<b>&amp;</b>").to_html(), "<code>&lt;b&gt;&amp;amp;&lt;/b&gt;</code>")
+        self.assertEqual(LeafNode("a", "R&D", {"href": "/?a=1&b=\"2\""}).to_html(),
+                         '<a href="/?a=1&amp;b=&quot;2&quot;">R&amp;D</a>')
+        self.assertEqual(LeafNode("img", "", {"src": "/i.png", "alt": "<Tom>"}).to_html(),
+                         '<img src="/i.png" alt="&lt;Tom&gt;" />')
+        self.assertEqual(LeafNode("br", "").to_html(), "<br/>")
+
+    def test_values_other_than_strings_are_converted(self):
+        self.assertEqual(HTMLNode("img", None, None, {"width": 10}).props_to_html(), ' width="10"')
+        self.assertEqual(escape_text(3), "3")
+        self.assertEqual(escape_attribute(None), "None")
+        self.assertEqual(LeafNode("td", 42, {"colspan": 2}).to_html(), '<td colspan="2">42</td>')
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
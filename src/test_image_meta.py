@@ -0,0 +1,167 @@
+import unittest
+import os
+import struct
+import tempfile
+import contextlib
+import io
+from image_meta import ImageIndex, ImageDimensions, image_size, exif_orientation
+from inline_markdown import markdown_to_html_node
+from parse_cache import ParseCache
+from urls import site_url_rewriter
+
+
+def png(width, height):
+    return b"\x89PNG\r\n\x1a\n" + b"\0\0\0\x0dIHDR" + struct.pack(">II", width, height) + b"\x08\x06\0\0\0" + b"\0" * 16
+
+
+def gif(width, height):
+    return b"GIF89a" + struct.pack("<HH", width, height) + b"\0" * 20
+
+
+def webp(chunk, payload):
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(payload)) + b"WEBP" + chunk + struct.pack("<I", len(payload)) + payload
+
+
+def exif(orientation, order="<"):
+    tiff = (b"II*\0" if order == "<" else b"MM\0*") + struct.pack(order + "I", 8)
+    tiff += struct.pack(order + "H", 2)
+    tiff += struct.pack(order + "HHIHH", 0x010F, 2, 1, 0, 0)
+    tiff += struct.pack(order + "HHIHH", 0x0112, 3, 1, orientation, 0)
+    return b"Exif\0\0" + tiff
+
+
+def jpeg(width, height, orientation=None):
+    data = b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0" + b"\0" * 9
+    if orientation is not None:
+        segment = exif(orientation)
+        data += b"\xff\xe1" + struct.pack(">H", len(segment) + 2) + segment
+    data += b"\xff\xdb" + struct.pack(">H", 67) + b"\0" * 65
+    # Fill bytes before the frame marker are allowed
+    data += b"\xff\xff\xc2" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\0"
+    return data + b"\xff\xda" + b"\0" * 32 + b"\xff\xd9"
+
+
+class TestImageSize(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def size_of(self, data):
+        path = os.path.join(self.tmp.name, "image")
+        with open(path, "wb") as f:
+            f.write(data)
+        return image_size(path)
+
+    def test_formats(self):
+        self.assertEqual(self.size_of(png(928, 468)), (928, 468))
+        self.assertEqual(self.size_of(gif(320, 200)), (320, 200))
+        self.assertEqual(self.size_of(jpeg(640, 480)), (640, 480))
+
+    def test_webp_variants(self):
+        lossy = b"\0\0\0" + b"\x9d\x01\x2a" + struct.pack("<HH", 400 | 0x4000, 300)
+        self.assertEqual(self.size_of(webp(b"VP8 ", lossy)), (400, 300))
+        lossless = b"\x2f" + ((400 - 1) | (300 - 1) << 14).to_bytes(4, "little") + b"\0"
+        self.assertEqual(self.size_of(webp(b"VP8L", lossless)), (400, 300))
+        extended = b"\0" * 4 + (400 - 1).to_bytes(3, "little") + (300 - 1).to_bytes(3, "little")
+        self.assertEqual(self.size_of(webp(b"VP8X", extended)), (400, 300))
+
+    def test_jpeg_orientation_turns_the_size(self):
+        self.assertEqual(self.size_of(jpeg(640, 480, orientation=6)), (480, 640))
+        self.assertEqual(self.size_of(jpeg(640, 480, orientation=3)), (640, 480))
+        self.assertEqual(exif_orientation(exif(8, ">")), 8)
+
+    def test_unknown_or_damaged_files(self):
+        self.assertIsNone(self.size_of(b"body { color: red }"))
+        self.assertIsNone(self.size_of(b""))
+        self.assertIsNone(self.size_of(png(928, 468)[:20]))
+        self.assertIsNone(self.size_of(jpeg(640, 480)[:80]))
+        self.assertIsNone(self.size_of(png(0, 468)))
+        # Scan data before any frame
+        self.assertIsNone(self.size_of(b"\xff\xd8\xff\xda" + b"\0" * 40))
+
+    def test_image_data_is_not_needed(self):
+        self.assertEqual(self.size_of(jpeg(640, 480)[:-34]), (640, 480))
+
+
+class TestImageIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.static = os.path.join(self.tmp.name, "static")
+        os.makedirs(os.path.join(self.static, "images"))
+        self.tom = os.path.join(self.static, "images", "tom.png")
+        self.write(self.tom, png(928, 468))
+        self.write(os.path.join(self.static, "index.css"), b"body {}")
+        self.index_path = os.path.join(self.tmp.name, ".build", "images.json")
+        self.index = ImageIndex(self.index_path, self.static)
+
+    def write(self, path, data, mtime_ns=None):
+        with open(path, "wb") as f:
+            f.write(data)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_refresh_reads_changed_images_only(self):
+        self.assertEqual(self.index.refresh(), [self.tom])
+        self.assertEqual(self.index.dimensions(self.tom), (928, 468))
+        self.index.save()
+
+        index = ImageIndex.load(self.index_path, self.static)
+        self.assertEqual(index.refresh(), [])
+        self.assertFalse(index.changed)
+        self.write(self.tom, png(100, 50), mtime_ns=os.stat(self.tom).st_mtime_ns + 10**9)
+        self.assertEqual(index.refresh(), [self.tom])
+        self.assertEqual(index.dimensions(self.tom), (100, 50))
+
+    def test_removed_images_are_dropped(self):
+        self.index.refresh()
+        os.remove(self.tom)
+        self.index.refresh()
+        self.assertEqual(self.index.images, {})
+        self.assertIsNone(self.index.dimensions(self.tom))
+
+    def test_unreadable_index_is_ignored(self):
+        os.makedirs(os.path.dirname(self.index_path))
+        with open(self.index_path, "w") as f:
+            f.write("{not json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            index = ImageIndex.load(self.index_path, self.static)
+        self.assertEqual(index.images, {})
+
+
+class TestImageDimensions(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.static = os.path.join(self.tmp.name, "static")
+        os.makedirs(os.path.join(self.static, "images"))
+        self.tom = os.path.join(self.static, "images", "tom.png")
+        with open(self.tom, "wb") as f:
+            f.write(png(928, 468))
+        self.rewriter = ImageDimensions(ImageIndex(os.path.join(self.tmp.name, "images.json"), self.static))
+
+    def test_local_images_get_dimensions(self):
+        markdown = "![Tom](/images/tom.png?v=2) ![Gone](/images/gone.png) ![Far](https://example.com/tom.png)"
+        html = markdown_to_html_node(markdown, site_url_rewriter("/site/", [self.rewriter])).to_html()
+        self.assertEqual(
+            html,
+            '<div><p><img src="/site/images/tom.png?v=2" alt="Tom" width="928" height="468" loading="lazy" '
+            'decoding="async" /> <img src="/site/images/gone.png" alt="Gone" /> '
+            '<img src="https://example.com/tom.png" alt="Far" /></p></div>',
+        )
+
+    def test_urls_outside_static_are_ignored(self):
+        self.assertIsNone(self.rewriter.image_attributes("/../static/images/tom.png"))
+
+    def test_cache_entry_follows_image_size(self):
+        cache = ParseCache(os.path.join(self.tmp.name, "cache"))
+        key = cache.key("hash", self.rewriter)
+        references = {"images": ["/images/tom.png", "/images/gone.png"], "links": []}
+        cache.put(key, "Tom", "<div></div>", [], references, self.rewriter)
+        self.assertEqual(cache.get(key, self.rewriter), ("Tom", "<div></div>", [], references))
+        with open(self.tom, "wb") as f:
+            f.write(png(100, 50) + b"\0")
+        self.assertIsNone(cache.get(key, self.rewriter))
+
+if __name__ == "__main__":
+    unittest.main()
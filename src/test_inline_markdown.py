@@ -1,8 +1,15 @@
 import unittest
 from inline_markdown import extract_title, extract_markdown_images, extract_markdown_links, split_nodes_image, split_nodes_link, text_to_textnodes, markdown_to_blocks, block_to_block_type, markdown_to_html_node, text_to_children
+from inline_markdown import iter_typed_blocks, MarkdownStream, read_title_lines
+from inline_markdown import enable_inline_cache, disable_inline_cache, inline_cache_info
+from inline_markdown import IMAGE_FINDER, LINK_FINDER, IMAGE_REGEX, LINK_REGEX
 from textnode import TextNode, TextType, BlockType
 from htmlnode import HTMLNode, ParentNode, LeafNode, text_node_to_html_node
+from corpus import CorpusGenerator
 import re
+import io
+import random
+import tracemalloc
 
 def normalize_whitespace(text):
     return re.sub(r'\s+', ' ', text).strip()
@@ -522,4 +529,158 @@ the **same** even with inline stuff
         self.assertEqual(html_nodes[1].to_html(), "<b>bolded</b>")
         self.assertEqual(html_nodes[5].to_html(), "<code>code</code>")
         self.assertEqual(html_nodes[7].to_html(), '<a href="url">link</a>')
-        self.assertEqual(html_nodes[9].to_html(), '<img src="url" alt="image" />')
\ No newline at end of file
+        self.assertEqual(html_nodes[9].to_html(), '<img src="url" alt="image" />')
+
+class TestTextToTextnodesPrecedence(unittest.TestCase):
+    def test_link_inside_bold_wins(self):
+        self.assertEqual(text_to_textnodes("**see [docs](u)**"), [
+            TextNode("**see ", TextType.TEXT),
+            TextNode("docs", TextType.LINK, "u"),
+            TextNode("**", TextType.TEXT),
+        ])
+
+    def test_code_protects_emphasis(self):
+        self.assertEqual(text_to_textnodes("`a **b** c` **d**"), [
+            TextNode("a **b** c", TextType.CODE),
+            TextNode(" ", TextType.TEXT),
+            TextNode("d", TextType.BOLD),
+        ])
+
+    def test_unclosed_delimiters_stay_text(self):
+        self.assertEqual(text_to_textnodes("**open _and `tick"), [
+            TextNode("**open _and `tick", TextType.TEXT),
+        ])
+
+    def test_many_spans(self):
+        text = " ".join(["**b** _i_ `c` [l](u) ![a](s)"] * 1000)
+        nodes = text_to_textnodes(text)
+        self.assertEqual(len(nodes), 10 * 1000 - 1)
+        self.assertEqual(nodes[-1], TextNode("a", TextType.IMAGE, "s"))
+
+
+class TestUrlSpanFinder(unittest.TestCase):
+    def test_matches_the_regexes(self):
+        rng = random.Random(7)
+        for _ in range(20000):
+            text = "".join(rng.choice("[]()!a \n") for _ in range(rng.randint(0, 24)))
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, len(text))
+            for finder, regex in ((IMAGE_FINDER, IMAGE_REGEX), (LINK_FINDER, LINK_REGEX)):
+                self.assertEqual([(m.span(), m.group(1), m.group(2)) for m in finder.finditer(text, start, end)],
+                                 [(m.span(), m.group(1), m.group(2)) for m in regex.finditer(text, start, end)],
+                                 (text, start, end))
+
+    def test_unclosed_urls(self):
+        self.assertEqual(extract_markdown_links("[a](" * 3 + ")"), [("a", "")])
+        self.assertEqual(extract_markdown_links("[a](x(" * 3 + "y)"), [])
+        self.assertEqual(extract_markdown_images("![a](b(c)d) ![e](f"), [("a", "b(c)d")])
+
+
+class TestStreamingBlocks(unittest.TestCase):
+    MARKDOWN = "# Title\n\nSome **bold**\ntext\n\n- a\n- b\n\n```\ncode\n```\n"
+
+    def test_iter_typed_blocks_from_file_lines(self):
+        lines = io.StringIO(self.MARKDOWN)
+        self.assertEqual(list(iter_typed_blocks(lines)), [
+            ("# Title", BlockType.HEADING),
+            ("Some **bold**\ntext", BlockType.PARAGRAPH),
+            ("- a\n- b", BlockType.UNORDERED_LIST),
+            ("```\ncode\n```", BlockType.CODE),
+        ])
+
+    def test_fenced_code_keeps_blank_lines(self):
+        md = "```\nfirst\n\n  \nlast\n```\n\nAfter"
+        self.assertEqual(markdown_to_blocks(md), ["```\nfirst\n\n  \nlast\n```", "After"])
+        self.assertEqual(markdown_to_html_node(md).to_html(),
+                         "<div><pre><code>first\n\n  \nlast\n</code></pre><p>After</p></div>")
+
+    def test_html_is_escaped(self):
+        md = "```\nif a < b && c > d:\n    print('<p>')\n```\n\n> x < y\n> **a\n> b** & c\n\nA <div> & [R&D](/r?a=1&b=2)"
+        self.assertEqual(markdown_to_html_node(md).to_html(),
+                         "<div><pre><code>if a &lt; b &amp;&amp; c &gt; d:\n    print('&lt;p&gt;')\n</code></pre>"
+                         "<blockquote>x &lt; y<br/><b>a</b><br/><b>b</b> &amp; c</blockquote>"
+                         '<p>A &lt;div&gt; &amp; <a href="/r?a=1&amp;b=2">R&amp;D</a></p></div>')
+
+    def test_unclosed_fence_runs_to_the_end_of_the_document(self):
+        self.assertEqual(markdown_to_blocks("```\nA\n\nB\n\n \n"), ["```\nA\n\nB\n```"])
+        self.assertEqual(markdown_to_html_node("Intro\n\n```\nA\n\nB").to_html(),
+                         "<div><p>Intro</p><pre><code>A\n\nB\n</code></pre></div>")
+        self.assertEqual(markdown_to_html_node("```").to_html(), "<div><pre><code>\n</code></pre></div>")
+        # Only a fence on the block's first line opens one
+        self.assertEqual(markdown_to_blocks("Text\n```\nA\n\nB\n```"), ["Text\n```\nA", "B\n```"])
+
+    def test_block_types_match_block_to_block_type(self):
+        md = (CorpusGenerator(seed=3).page("Corpus", 200) +
+              "\n\n- \n\n1. a\n2. \n\n> a\n \xa0\n> b\n\n- a\n-b\n\n2. a\n\n####### h\n\n# \n\nPara\r\nLine\n\n``````")
+        typed_blocks = list(iter_typed_blocks(md.split("\n")))
+        self.assertEqual(len(typed_blocks), 210)
+        for block, block_type in typed_blocks:
+            self.assertEqual(block_type, block_to_block_type(block), block)
+
+    def test_markdown_stream_matches_markdown_to_html_node(self):
+        buffer = io.StringIO()
+        MarkdownStream(io.StringIO(self.MARKDOWN)).render_to(buffer)
+        self.assertEqual(buffer.getvalue(), markdown_to_html_node(self.MARKDOWN).to_html())
+
+    def test_markdown_stream_empty_document(self):
+        with self.assertRaises(ValueError):
+            MarkdownStream(iter([])).render_to(io.StringIO())
+
+    def test_read_title_lines(self):
+        self.assertEqual(read_title_lines(iter(["# Title\n", "body\n"])), ["# Title\n"])
+        self.assertEqual(read_title_lines(iter(["Intro\n", "# Title\n"])), ["Intro\n"])
+        self.assertEqual(read_title_lines(iter(["#\n", "\n", "Title\n", "rest\n"])), ["#\n", "\n", "Title\n"])
+        self.assertEqual(extract_title("".join(read_title_lines(iter(["#\n", "\n", "Title\n"])))), "Title")
+        self.assertEqual(read_title_lines(iter([])), [])
+
+    def test_memory_is_bounded_by_block_size(self):
+        class NullWriter:
+            def write(self, text):
+                pass
+
+        def lines():
+            for i in range(5000):
+                yield f"Paragraph {i} with **bold** and [a link](/page{i}) in it\n"
+                yield "\n"
+
+        tracemalloc.start()
+        MarkdownStream(lines()).render_to(NullWriter())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # The document is over 300 KB; rendering it must not hold it all at once
+        self.assertLess(peak, 64 * 1024)
+
+
+class TestInlineCache(unittest.TestCase):
+    def setUp(self):
+        enable_inline_cache(2)
+        self.addCleanup(disable_inline_cache)
+
+    def test_cache_is_off_by_default(self):
+        disable_inline_cache()
+        self.assertIsNone(inline_cache_info())
+
+    def test_repeated_fragments_hit_the_cache(self):
+        text = "Read **more** on [the blog](/blog)"
+        first = text_to_children(text)
+        second = text_to_children(text)
+        self.assertEqual([node.to_html() for node in first], [node.to_html() for node in second])
+        info = inline_cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_least_recently_used_fragment_is_evicted(self):
+        for text in ["a", "b", "a", "c", "a", "b"]:
+            text_to_children(text)
+        info = inline_cache_info()
+        # "b" was evicted by "c", so it misses again
+        self.assertEqual((info.hits, info.misses, info.currsize), (2, 4, 2))
+
+    def test_rendering_is_unchanged(self):
+        markdown = "# T\n\n- [Home](/)\n- [Home](/)\n\n_Shared_ disclaimer\n\n_Shared_ disclaimer"
+        disable_inline_cache()
+        expected = markdown_to_html_node(markdown).to_html()
+        enable_inline_cache(16)
+        self.assertEqual(markdown_to_html_node(markdown).to_html(), expected)
+        self.assertEqual(markdown_to_html_node(markdown).to_html(), expected)
+        self.assertGreater(inline_cache_info().hits, 0)
+
@@ -0,0 +1,251 @@
+import unittest
+import os
+import tempfile
+import contextlib
+import io
+from manifest import BuildManifest, OutputChanges, hash_file, enable_hash_cache, disable_hash_cache
+from main import generate_pages_recursive, build_site, build_settings, parse_args, rebuild_changed
+from depgraph import DependencyGraph
+from search_index import SearchIndex
+from inline_markdown import PARSER_VERSION
+from test_image_meta import png
+
+TEMPLATE = "<html><title>{{ Title }}</title><body>{{ Content }}</body></html>"
+
+
+class BuildTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.content = os.path.join(self.tmp.name, "content")
+        self.docs = os.path.join(self.tmp.name, "docs")
+        self.template = os.path.join(self.tmp.name, "template.html")
+        self.manifest_path = os.path.join(self.tmp.name, ".build", "manifest.json")
+        os.makedirs(os.path.join(self.content, "blog"))
+        self.write(self.template, TEMPLATE)
+        self.write(os.path.join(self.content, "index.md"), "# Home\n\nWelcome")
+        self.write(os.path.join(self.content, "blog", "post.md"), "# Post\n\nHello")
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def build(self, basepath="/", **kwargs):
+        manifest = BuildManifest.load(self.manifest_path)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            generate_pages_recursive(self.content, self.template, self.docs, basepath, manifest, **kwargs)
+        manifest.save()
+        return out.getvalue()
+
+
+class TestIncrementalBuild(BuildTestCase):
+    def test_second_build_skips_unchanged_pages(self):
+        self.build()
+        log = self.build()
+        self.assertNotIn("Generating page", log)
+        self.assertEqual(log.count("Skipping unchanged page"), 2)
+
+    def test_only_changed_page_is_rebuilt(self):
+        self.build()
+        self.write(os.path.join(self.content, "blog", "post.md"), "# Post\n\nHello again")
+        log = self.build()
+        self.assertEqual(log.count("Generating page"), 1)
+        self.assertIn("post.md", log)
+        with open(os.path.join(self.docs, "blog", "post.html")) as f:
+            self.assertIn("Hello again", f.read())
+
+    def test_template_change_rebuilds_everything(self):
+        self.build()
+        self.write(self.template, TEMPLATE.replace("<body>", "<body class=\"new\">"))
+        log = self.build()
+        self.assertEqual(log.count("Generating page"), 2)
+
+    def test_basepath_change_rebuilds_everything(self):
+        self.build()
+        log = self.build("/StaticSite/")
+        self.assertEqual(log.count("Generating page"), 2)
+
+    def test_parser_version_change_rebuilds_everything(self):
+        self.build()
+        manifest = BuildManifest.load(self.manifest_path)
+        self.assertEqual(manifest.parser_version, PARSER_VERSION)
+        # As left behind by a build with an older parser
+        manifest.parser_version = PARSER_VERSION - 1
+        manifest.save()
+        log = self.build()
+        self.assertEqual(log.count("Generating page"), 2)
+        self.assertEqual(BuildManifest.load(self.manifest_path).parser_version, PARSER_VERSION)
+
+    def test_deleted_source_removes_output(self):
+        self.build()
+        os.remove(os.path.join(self.content, "blog", "post.md"))
+        self.build()
+        self.assertFalse(os.path.exists(os.path.join(self.docs, "blog")))
+        self.assertTrue(os.path.exists(os.path.join(self.docs, "index.html")))
+        self.assertNotIn(os.path.join("blog", "post.md"), BuildManifest.load(self.manifest_path).pages)
+
+    def test_missing_output_is_regenerated(self):
+        self.build()
+        os.remove(os.path.join(self.docs, "index.html"))
+        log = self.build()
+        self.assertEqual(log.count("Generating page"), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.docs, "index.html")))
+
+
+class TestRebuildChanged(BuildTestCase):
+    def setUp(self):
+        super().setUp()
+        # rebuild_changed works on content/, static/ and template.html in the current directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp.name)
+        os.makedirs(os.path.join("static", "images"))
+        self.write(os.path.join("static", "index.css"), "body {}")
+        with open(os.path.join("static", "images", "tom.png"), "wb") as f:
+            f.write(png(40, 20))
+        self.write(os.path.join("content", "blog", "post.md"), "# Post\n\n![Tom](/images/tom.png)")
+        self.manifest = BuildManifest.load()
+        self.graph = DependencyGraph.load()
+        self.search = SearchIndex.load()
+        _, self.rewriters = build_settings(parse_args([]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_site(self.manifest, self.graph, self.search, "/", rewriters=self.rewriters)
+
+    def rebuild(self, *paths):
+        changes = OutputChanges("docs")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failed = rebuild_changed([os.path.abspath(path) for path in paths], self.manifest, "/",
+                                     rewriters=self.rewriters, graph=self.graph, changes=changes, search=self.search)
+        self.assertEqual(failed, [])
+        return out.getvalue(), changes.to_dict()
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_edited_page_is_rendered_again(self):
+        post = os.path.join("content", "blog", "post.md")
+        self.write(post, "# Post\n\nHello again")
+        log, changes = self.rebuild(post)
+        self.assertEqual(log.count("Generating page"), 1)
+        self.assertIn(f"Generating page from {post}", log)
+        self.assertIn("Hello again", self.read(os.path.join("docs", "blog", "post.html")))
+        self.assertIn(os.path.join("blog", "post.html"), changes["changed"])
+        self.assertIn("again", self.search.pages[post]["terms"])
+        self.assertEqual(self.graph.dependencies(post)["images"], [])
+
+    def test_deleted_page_is_removed(self):
+        post = os.path.join("content", "blog", "post.md")
+        os.remove(post)
+        log, changes = self.rebuild(post)
+        self.assertNotIn("Generating page", log)
+        self.assertFalse(os.path.exists(os.path.join("docs", "blog")))
+        self.assertIn(os.path.join("blog", "post.html"), changes["deleted"])
+        self.assertNotIn(os.path.join("blog", "post.md"), BuildManifest.load().pages)
+        self.assertIsNone(self.graph.dependencies(post))
+        self.assertNotIn(post, self.search.pages)
+
+    def test_template_change_renders_every_page_but_copies_no_static_file(self):
+        css = os.path.join("docs", "index.css")
+        # A static sync would copy the file over this mtime
+        os.utime(css, ns=(0, 0))
+        self.write("template.html", TEMPLATE.replace("<body>", '<body class="new">'))
+        log, changes = self.rebuild("template.html")
+        self.assertEqual(log.count("Generating page"), 2)
+        self.assertIn('<body class="new">', self.read(os.path.join("docs", "index.html")))
+        self.assertEqual(os.stat(css).st_mtime_ns, 0)
+        self.assertEqual(sorted(changes["changed"])[:2], [os.path.join("blog", "post.html"), "index.html"])
+        self.assertNotIn("index.css", changes["changed"])
+
+    def test_static_change_renders_the_pages_showing_it(self):
+        image = os.path.join("static", "images", "tom.png")
+        self.assertIn('width="40"', self.read(os.path.join("docs", "blog", "post.html")))
+        with open(image, "wb") as f:
+            f.write(png(80, 30))
+        log, changes = self.rebuild(image)
+        self.assertEqual(log.count("Generating page"), 1)
+        self.assertIn("post.md", log)
+        self.assertIn('width="80" height="30"', self.read(os.path.join("docs", "blog", "post.html")))
+        self.assertEqual(sorted(changes["changed"]), [os.path.join("blog", "post.html"),
+                                                      os.path.join("images", "tom.png")])
+
+
+class TestParallelBuild(BuildTestCase):
+    def test_parallel_matches_serial_output(self):
+        for i in range(6):
+            self.write(os.path.join(self.content, "blog", f"extra{i}.md"), f"# Extra {i}\n\nBody **{i}**")
+        serial_log = self.build(deterministic=True)
+        with open(os.path.join(self.docs, "blog", "extra3.html")) as f:
+            serial_html = f.read()
+
+        self.write(self.template, TEMPLATE + "\n")
+        self.build(deterministic=True)
+        self.write(self.template, TEMPLATE)
+        parallel_log = self.build(jobs=3, deterministic=True)
+        with open(os.path.join(self.docs, "blog", "extra3.html")) as f:
+            self.assertEqual(f.read(), serial_html)
+        self.assertEqual(parallel_log, serial_log)
+
+    def test_parallel_reports_failures(self):
+        broken_path = os.path.join(self.content, "broken.md")
+        with open(broken_path, "wb") as f:
+            f.write(b"# Broken \xff\xfe")
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            failed = generate_pages_recursive(self.content, self.template, self.docs, "/", jobs=2)
+        self.assertEqual(failed, [broken_path])
+        self.assertIn("Generated 2 of 3 pages, 1 failed", out.getvalue())
+        self.assertIn("Error reading markdown file", out.getvalue())
+
+class TestOutputChanges(BuildTestCase):
+    def build_changes(self, **kwargs):
+        changes = OutputChanges(self.docs)
+        self.build(changes=changes, **kwargs)
+        return changes.to_dict()
+
+    def test_first_build_adds_every_page(self):
+        self.assertEqual(self.build_changes(), {
+            "added": [os.path.join("blog", "post.html"), "index.html"], "changed": [], "deleted": [],
+        })
+
+    def test_identical_output_is_not_rewritten(self):
+        self.build()
+        index = os.path.join(self.docs, "index.html")
+        os.utime(index, ns=(0, 0))
+        # A new manifest forces every page to be rendered again
+        os.remove(self.manifest_path)
+        self.assertEqual(self.build_changes(), {"added": [], "changed": [], "deleted": []})
+        self.assertEqual(os.stat(index).st_mtime_ns, 0)
+
+    def test_changed_and_deleted_pages(self):
+        self.build()
+        self.write(os.path.join(self.content, "index.md"), "# Home\n\nWelcome back")
+        os.remove(os.path.join(self.content, "blog", "post.md"))
+        self.assertEqual(self.build_changes(), {
+            "added": [], "changed": ["index.html"], "deleted": [os.path.join("blog", "post.html")],
+        })
+
+    def test_record_static(self):
+        changes = OutputChanges("docs")
+        changes.record_static({"copied": ["a.css", "b.png"], "removed": ["c.png"]}, ["a.css", "c.png"])
+        self.assertEqual(changes.to_dict(), {"added": ["b.png"], "changed": ["a.css"], "deleted": ["c.png"]})
+
+class TestHashCache(BuildTestCase):
+    def test_cached_hash_follows_file_changes(self):
+        enable_hash_cache()
+        self.addCleanup(disable_hash_cache)
+        path = os.path.join(self.content, "index.md")
+        first = hash_file(path)
+        stat = os.stat(path)
+        # Same size and mtime: the file is not read again
+        self.write(path, "# Home\n\nWelcomb")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(hash_file(path), first)
+        os.utime(path, ns=(0, 0))
+        second = hash_file(path)
+        self.assertNotEqual(first, second)
+        disable_hash_cache()
+        self.assertEqual(hash_file(path), second)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import os
+import tempfile
+from parse_cache import ParseCache
+from test_manifest import BuildTestCase, TEMPLATE
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = ParseCache(os.path.join(self.tmp.name, "cache"))
+
+    def test_put_then_get(self):
+        key = self.cache.key("# Home\n\nWelcome")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "Home", "<div><p>Welcome</p></div>")
+        self.assertEqual(self.cache.get(key), ("Home", "<div><p>Welcome</p></div>", None, None))
+        self.cache.put(key, "Home", "<div><p>Welcome</p></div>", ["welcome"], {"images": [], "links": ["/"]})
+        self.assertEqual(self.cache.get(key), ("Home", "<div><p>Welcome</p></div>", ["welcome"],
+                                               {"images": [], "links": ["/"]}))
+        self.assertNotEqual(key, self.cache.key("# Home\n\nWelcome!"))
+
+    def test_corrupt_entry_is_a_miss(self):
+        key = self.cache.key("text")
+        self.cache.put(key, "Title", "<div></div>")
+        with open(self.cache._entry_path(key), "w") as f:
+            f.write('{"version": ')
+        self.assertIsNone(self.cache.get(key))
+
+    def test_prune_removes_least_recently_used(self):
+        keys = [self.cache.key(str(i)) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, "T", "x" * 100)
+            os.utime(self.cache._entry_path(key), ns=(i * 10**9, i * 10**9))
+        # Reading the oldest entry makes it the most recently used
+        self.cache.get(keys[0])
+        self.cache.max_bytes = 2 * os.path.getsize(self.cache._entry_path(keys[0]))
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+
+    def test_prune_if_full_counts_what_put_adds(self):
+        self.cache.put(self.cache.key("a"), "T", "x" * 100)
+        # Never pruned, so the size of the cache is unknown
+        self.assertEqual(self.cache.prune_if_full(), 0)
+        entry_size = self.cache.size
+        self.cache.max_bytes = 2 * entry_size
+        self.cache.put(self.cache.key("b"), "T", "x" * 100)
+        self.assertEqual(self.cache.size, 2 * entry_size)
+        # Below the limit, the cache is not walked, even if another process filled it
+        self.cache.size = 0
+        os.utime(self.cache._entry_path(self.cache.key("a")), ns=(0, 0))
+        self.cache.put(self.cache.key("c"), "T", "x" * 100)
+        self.assertEqual(self.cache.prune_if_full(), 0)
+        self.cache.size = None
+        self.assertEqual(self.cache.prune_if_full(), 1)
+        self.assertIsNone(self.cache.get(self.cache.key("a")))
+
+
+class TestCachedBuild(BuildTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ParseCache(os.path.join(self.tmp.name, ".build", "cache"))
+
+    def test_template_change_reuses_parsed_pages(self):
+        self.build(cache=self.cache)
+        self.write(self.template, TEMPLATE.replace("<body>", "<body class=\"new\">"))
+        log = self.build(cache=self.cache)
+        self.assertEqual(log.count("Using cached parse"), 2)
+        with open(os.path.join(self.docs, "index.html")) as f:
+            self.assertEqual(f.read(), '<html><title>Home</title><body class="new"><div><h1>Home</h1><p>Welcome</p></div></body></html>')
+
+    def test_cache_entries_are_kept_per_basepath(self):
+        self.write(os.path.join(self.content, "index.md"), "# Home\n\n[Post](/blog/post)")
+        self.build(cache=self.cache)
+        log = self.build("/site/", cache=self.cache)
+        self.assertNotIn("Using cached parse", log)
+        with open(os.path.join(self.docs, "index.html")) as f:
+            self.assertIn('href="/site/blog/post"', f.read())
+        log = self.build(cache=self.cache)
+        self.assertEqual(log.count("Using cached parse"), 2)
+        with open(os.path.join(self.docs, "index.html")) as f:
+            self.assertIn('href="/blog/post"', f.read())
+
+    def test_pages_are_cached_by_source_hash(self):
+        self.build(cache=self.cache)
+        self.write(os.path.join(self.content, "blog", "copy.md"), "# Home\n\nWelcome")
+        log = self.build(cache=self.cache)
+        self.assertIn("Using cached parse of " + os.path.join(self.content, "blog", "copy.md"), log)
+        self.write(os.path.join(self.content, "index.md"), "# Home\n\nWelcome back")
+        log = self.build(cache=self.cache)
+        self.assertNotIn("Using cached parse", log)
+
+    def test_parallel_workers_share_the_cache(self):
+        self.build(cache=self.cache, jobs=2)
+        self.write(self.template, TEMPLATE + "\n")
+        log = self.build(cache=self.cache, jobs=2)
+        self.assertEqual(log.count("Using cached parse"), 2)
+
+if __name__ == "__main__":
+    unittest.main()
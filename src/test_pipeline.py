@@ -0,0 +1,99 @@
+import unittest
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing.dummy import Pool
+from pipeline import batched, imap_window
+from benchmark import bench_rss
+from main import generate_pages_recursive
+
+# Set to 200000 to check the claim on a site of that size; the default keeps the suite quick
+SMALL_SITE_PAGES = 1000
+LARGE_SITE_PAGES = int(os.environ.get("STATICSITE_RSS_PAGES", "20000"))
+# Allowed growth of the peak RSS between the small and the large site. Holding a
+# hundred bytes per page, as keeping the manifest or a set of the pages in memory
+# would, exceeds it
+RSS_TOLERANCE_KIB = 1536
+
+
+def slow_square(n):
+    # Later items finish first, so completion order differs from input order
+    time.sleep(0.002 * (5 - n % 5))
+    return n * n
+
+
+def fail_on_three(n):
+    if n == 3:
+        raise ValueError("three")
+    return n
+
+class TestImapWindow(unittest.TestCase):
+    def test_batched(self):
+        self.assertEqual(list(batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(batched([], 3)), [])
+
+    def test_results_come_back_in_order(self):
+        finished = []
+        with Pool(4) as pool:
+            results = list(imap_window(pool, slow_square, range(20), 5, finished.append))
+        self.assertEqual(results, [n * n for n in range(20)])
+        self.assertEqual(sorted(finished), results)
+
+    def test_items_are_pulled_only_a_window_ahead(self):
+        pulled = []
+
+        def items():
+            for n in range(50):
+                pulled.append(n)
+                yield n
+
+        with Pool(4) as pool:
+            for n, result in enumerate(imap_window(pool, slow_square, items(), 3)):
+                self.assertEqual(result, n * n)
+                self.assertLessEqual(len(pulled), n + 3)
+
+    def test_errors_are_raised_in_order(self):
+        with Pool(2) as pool:
+            results = imap_window(pool, fail_on_three, range(10), 4)
+            self.assertEqual([next(results) for _ in range(3)], [0, 1, 2])
+            with self.assertRaises(ValueError):
+                next(results)
+
+
+class TestStreamingBuild(unittest.TestCase):
+    def test_parallel_build_streams_every_page(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        content_dir = os.path.join(tmp, "content")
+        template_path = os.path.join(tmp, "template.html")
+        with open(template_path, "w") as f:
+            f.write("<title>{{ Title }}</title>{{ Content }}")
+        for i in range(100):
+            os.makedirs(os.path.join(content_dir, f"s{i % 3}"), exist_ok=True)
+            with open(os.path.join(content_dir, f"s{i % 3}", f"p{i}.md"), "w") as f:
+                f.write(f"# Page {i}\n\nText {i}\n")
+        with contextlib.redirect_stdout(io.StringIO()):
+            failed = generate_pages_recursive(content_dir, template_path, os.path.join(tmp, "docs"), "/", jobs=2)
+        self.assertEqual(failed, [])
+        with open(os.path.join(tmp, "docs", "s1", "p97.html")) as f:
+            self.assertEqual(f.read(), "<title>Page 97</title><div><h1>Page 97</h1><p>Text 97</p></div>")
+
+    def test_page_pipeline_peak_rss_is_flat(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            (_, small), (_, large) = bench_rss([SMALL_SITE_PAGES, LARGE_SITE_PAGES], block_count=1, full=False)
+        self.assertLess(large - small, RSS_TOLERANCE_KIB,
+                        f"Peak RSS grew from {small} KiB to {large} KiB between {SMALL_SITE_PAGES} and "
+                        f"{LARGE_SITE_PAGES} pages")
+
+    def test_build_peak_rss_is_flat(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            (_, small), (_, large) = bench_rss([SMALL_SITE_PAGES, LARGE_SITE_PAGES], block_count=1)
+        self.assertLess(large - small, RSS_TOLERANCE_KIB,
+                        f"Peak RSS of a default build grew from {small} KiB to {large} KiB between "
+                        f"{SMALL_SITE_PAGES} and {LARGE_SITE_PAGES} pages")
+
+if __name__ == "__main__":
+    unittest.main()
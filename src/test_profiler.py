@@ -0,0 +1,55 @@
+import unittest
+import os
+import json
+import tempfile
+import time
+from profiler import Profiler, StageClock, TimedWriter, timed_lines
+
+
+class TestStageClock(unittest.TestCase):
+    def test_inner_stage_is_not_counted_twice(self):
+        clock = StageClock()
+        clock.enter("template")
+        with clock.stage("inline"):
+            time.sleep(0.01)
+        clock.exit()
+        self.assertGreaterEqual(clock.totals["inline"], 10_000_000)
+        self.assertLess(clock.totals["template"], clock.totals["inline"])
+
+    def test_timed_helpers_charge_read_and_write(self):
+        clock = StageClock()
+        clock.enter("template")
+        written = []
+        writer = TimedWriter(type("Sink", (), {"write": lambda self, text: written.append(text)})(), clock)
+        for line in timed_lines(["a", "b"], clock):
+            writer.write(line)
+        clock.exit()
+        self.assertEqual(written, ["a", "b"])
+        self.assertIn("read", clock.totals)
+        self.assertIn("write", clock.totals)
+
+
+class TestProfiler(unittest.TestCase):
+    def test_page_spans_and_trace(self):
+        profiler = Profiler()
+        with profiler.span("generate_pages"):
+            with profiler.page("content/index.md") as clock:
+                with clock.stage("split"):
+                    pass
+        cats = [event["cat"] for event in profiler.events]
+        self.assertEqual(cats.count("page"), 1)
+        self.assertEqual(cats.count("build"), 1)
+        stages = [event["name"] for event in profiler.events if event["cat"] == "stage"]
+        self.assertEqual(stages, ["split", "template"])
+        self.assertIn("content/index.md", profiler.summary())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace", "trace.json")
+            profiler.write_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        self.assertEqual(len(trace["traceEvents"]), len(profiler.events))
+        self.assertTrue(all(event["ph"] == "X" for event in trace["traceEvents"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import os
+import io
+import json
+import shutil
+import tempfile
+import contextlib
+from inline_markdown import MarkdownStream
+from search_index import SearchIndex, TermCollector, PAGES_PER_FILE, text_terms, shard_name, page_url
+from parse_cache import ParseCache
+from test_manifest import BuildTestCase
+
+
+class TestTerms(unittest.TestCase):
+    def test_text_terms(self):
+        self.assertEqual(text_terms("Tom's *house*, in the Old-Forest! a 1 42 “Bombadil”"),
+                         {"tom", "house", "in", "the", "old", "forest", "42", "bombadil"})
+
+    def test_collector_uses_rendered_text(self):
+        markdown = ("# The **Shire**\n\n> quoted elves\n> and dwarves\n\n"
+                    "See [Rivendell](/blog/rivendell) and ![Gandalf the Grey](/images/gandalf.png)\n\n"
+                    "```\ncode_is_skipped\n```")
+        collector = TermCollector()
+        MarkdownStream(io.StringIO(markdown), on_block=collector.add_block).render_to(io.StringIO())
+        self.assertEqual(collector.sorted_terms(),
+                         ["and", "dwarves", "elves", "gandalf", "grey", "quoted", "rivendell", "see", "shire", "the"])
+
+    def test_shard_name(self):
+        self.assertEqual(shard_name("ri"), "ri")
+        self.assertEqual(shard_name("él"), "_c3a96c")
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.index = SearchIndex(os.path.join(self.tmp.name, "search_pages.json"))
+        self.index.record_page("content/b.md", "b/", "Bee", ["honey", "river"])
+        self.index.record_page("content/a.md", "", "Home", ["river"])
+        self.index.record_page("content/c.md", "c/", "Sea", ["river", "rivendell"])
+
+    def write(self, docs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.index.write(docs)
+
+    def test_posting_lists_are_gap_encoded(self):
+        self.assertEqual(self.index.page_files(), {0: {"0": ["b/", "Bee"], "1": ["", "Home"], "2": ["c/", "Sea"]}})
+        shards = self.index.shards()
+        self.assertEqual(shards["ri"], {"rivendell": [2], "river": [0, 1, 1]})
+        self.assertEqual(shards["be"], {"bee": [0]})
+
+    def test_write_only_touches_changed_files(self):
+        docs = os.path.join(self.tmp.name, "docs")
+        touched = dict(self.write(docs))
+        search = os.path.join(docs, "search")
+        self.assertEqual(touched[os.path.join(search, "t", "ri.json")], "added")
+        self.assertEqual(touched[os.path.join(search, "p", "0.json")], "added")
+        with open(os.path.join(search, "index.json")) as f:
+            self.assertEqual(json.load(f)["prefix"], 2)
+        # The first write hands out ids in source order
+        self.assertEqual(self.index.pages["content/a.md"]["id"], 0)
+
+        self.index.record_page("content/b.md", "b/", "Bee", ["river"])
+        shard = os.path.join(search, "t")
+        self.assertEqual(self.write(docs), [(os.path.join(search, "index.json"), "changed"),
+                                            (os.path.join(shard, "ho.json"), "changed")])
+
+        self.index.forget_page("content/c.md")
+        self.assertEqual(sorted(self.write(docs)), [
+            (os.path.join(search, "index.json"), "changed"),
+            (os.path.join(search, "p", "0.json"), "changed"),
+            (os.path.join(shard, "ri.json"), "changed"),
+            (os.path.join(shard, "se.json"), "deleted"),
+        ])
+        self.assertEqual(self.write(docs), [])
+
+    def test_ids_are_kept_and_reused(self):
+        self.index.forget_page("content/a.md")
+        self.index.record_page("content/d.md", "d/", "Dee", ["river"])
+        self.assertEqual({source: page["id"] for source, page in self.index.pages.items()},
+                         {"content/b.md": 0, "content/c.md": 2, "content/d.md": 1})
+        self.index.record_page("content/e.md", "e/", "Eee", [])
+        self.assertEqual(self.index.pages["content/e.md"]["id"], 3)
+
+    def read_files(self, docs):
+        files = {}
+        for directory in ("t", "p"):
+            path = os.path.join(docs, "search", directory)
+            for file in os.listdir(path):
+                with open(os.path.join(path, file)) as f:
+                    files[os.path.join(directory, file)] = f.read()
+        return files
+
+    def test_incremental_writes_match_a_full_write(self):
+        docs = os.path.join(self.tmp.name, "docs")
+        self.write(docs)
+        self.index.save()
+        self.index = SearchIndex.load(self.index.path)
+        self.index.forget_page("content/a.md")
+        self.index.record_page("content/c.md", "c/", "Sea", ["honey", "rivendell"])
+        self.index.record_page("content/d.md", "d/", "Dee", ["river", "élan"])
+        for i in range(PAGES_PER_FILE):
+            self.index.record_page(f"content/x{i}.md", f"x{i}/", f"X {i}", ["river"])
+        self.index.forget_page("content/x7.md")
+        self.assertNotIn("full rewrite", self.output(self.index.write, docs))
+
+        expected = {os.path.join("t", f"{name}.json"): shard for name, shard in self.index.shards().items()}
+        expected.update((os.path.join("p", f"{number}.json"), pages)
+                        for number, pages in self.index.page_files().items())
+        self.assertEqual({path: json.loads(text) for path, text in self.read_files(docs).items()}, expected)
+
+    def test_out_of_date_files_are_written_in_full(self):
+        docs = os.path.join(self.tmp.name, "docs")
+        self.write(docs)
+        self.index.save()
+        shutil.rmtree(docs)
+        index = SearchIndex.load(self.index.path)
+        self.assertIn("full rewrite", self.output(index.write, docs))
+        self.assertEqual(self.read_files(docs)[os.path.join("t", "ri.json")], '{"rivendell":[2],"river":[0,1,1]}')
+
+    def output(self, func, *args):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            func(*args)
+        return out.getvalue()
+
+    def test_save_and_load(self):
+        self.index.save()
+        self.assertEqual(SearchIndex.load(self.index.path).pages, self.index.pages)
+
+    def test_changed_until_saved(self):
+        self.index.save()
+        self.assertFalse(self.index.changed)
+        self.index.record_page("content/a.md", "", "Home", ["river"])
+        self.index.forget_page("content/missing.md")
+        self.assertFalse(self.index.changed)
+        self.index.record_page("content/a.md", "", "Home", ["sea"])
+        self.assertTrue(self.index.changed)
+
+    def test_page_url(self):
+        self.assertEqual(page_url(os.path.join("docs", "index.html"), "docs"), "")
+        self.assertEqual(page_url(os.path.join("docs", "blog", "tom", "index.html"), "docs"), "blog/tom/")
+        self.assertEqual(page_url(os.path.join("docs", "about.html"), "docs"), "about.html")
+
+
+class TestSearchBuild(BuildTestCase):
+    def setUp(self):
+        super().setUp()
+        self.search = SearchIndex(os.path.join(self.tmp.name, "search_pages.json"))
+
+    def test_build_records_terms(self):
+        self.build(search=self.search, jobs=2)
+        page = self.search.pages[os.path.join(self.content, "index.md")]
+        self.assertEqual((page["url"], page["title"], page["terms"]), ("", "Home", ["home", "welcome"]))
+        os.remove(os.path.join(self.content, "blog", "post.md"))
+        self.build(search=self.search)
+        self.assertEqual(list(self.search.pages), [os.path.join(self.content, "index.md")])
+
+    def test_unindexed_pages_are_generated_again(self):
+        self.build()
+        log = self.build(search=self.search)
+        self.assertEqual(log.count("Generating page"), 2)
+        self.assertEqual(len(self.search.pages), 2)
+
+    def test_cached_pages_keep_their_terms(self):
+        cache = ParseCache(os.path.join(self.tmp.name, "cache"))
+        self.build(cache=cache)
+        self.write(self.template, "{{ Content }}")
+        log = self.build(cache=cache, search=self.search)
+        self.assertEqual(log.count("Using cached parse"), 2)
+        self.assertEqual(self.search.pages[os.path.join(self.content, "blog", "post.md")]["terms"], ["hello", "post"])
+
+if __name__ == "__main__":
+    unittest.main()
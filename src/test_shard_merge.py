@@ -0,0 +1,142 @@
+import unittest
+import contextlib
+import filecmp
+import io
+import json
+import os
+import shutil
+import tempfile
+from main import main as build_main, parse_shard, page_shard, shard_dir
+from manifest import BuildManifest
+from shard_merge import merge_shards, find_shards
+from test_image_meta import png
+
+
+class TestShardAssignment(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        self.assertEqual(parse_shard("1/1"), (1, 1))
+        for text in ["0/4", "5/4", "2", "a/4", "-1/4", "2/4/8"]:
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse_shard(text)
+
+    def test_page_shard_is_stable_and_spread(self):
+        self.assertEqual(page_shard(os.path.join("blog", "post.md"), 4), page_shard("blog/post.md", 4))
+        # The assignment must not change between releases, or shards of mixed versions would overlap
+        self.assertEqual([page_shard(f"page{i}.md", 4) for i in range(8)], [2, 4, 1, 3, 1, 1, 4, 1])
+        counts = [0] * 4
+        for i in range(400):
+            counts[page_shard(f"blog/page{i}.md", 4) - 1] += 1
+        self.assertTrue(all(70 < count < 130 for count in counts), counts)
+
+
+class TestShardMerge(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Builds work on content/, static/ and template.html in the current directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp.name)
+        os.makedirs(os.path.join("content", "blog"))
+        os.makedirs("static")
+        self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.write(os.path.join("static", "index.css"), "body {}")
+        for i in range(12):
+            self.write(os.path.join("content", "blog", f"post{i}.md"), f"# Post {i}\n\nHello from post {i}")
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def run_quietly(self, func, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func(*args, **kwargs)
+
+    def build_shards(self, count, *options):
+        for index in range(1, count + 1):
+            self.run_quietly(build_main, ["--shard", f"{index}/{count}", *options])
+        return [shard_dir((index, count)) for index in range(1, count + 1)]
+
+    def test_merged_shards_match_a_full_build(self):
+        shards = self.build_shards(3)
+        pages = [len(BuildManifest.load(os.path.join(shard, ".build", "manifest.json")).pages) for shard in shards]
+        self.assertEqual(sum(pages), 12)
+        self.assertNotIn(0, pages)
+        # Only the first shard copies the static files
+        self.assertTrue(os.path.exists(os.path.join(shards[0], "docs", "index.css")))
+        self.assertFalse(os.path.exists(os.path.join(shards[1], "docs", "index.css")))
+
+        changes = self.run_quietly(merge_shards, find_shards())
+        self.assertIn("index.css", changes.to_dict()["added"])
+        shutil.move("docs", "merged")
+        self.run_quietly(build_main, ["--clean"])
+        comparison = filecmp.dircmp("docs", "merged")
+        self.assertEqual(self.differences(comparison), [])
+        # The merged manifest lets the next full build skip every page
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            build_main([])
+        self.assertNotIn("Generating page", log.getvalue())
+
+    def differences(self, comparison):
+        found = comparison.left_only + comparison.right_only + comparison.diff_files
+        for sub in comparison.subdirs.values():
+            found += self.differences(sub)
+        return found
+
+    def test_merged_image_index_keeps_the_next_build_incremental(self):
+        with open(os.path.join("static", "tom.png"), "wb") as f:
+            f.write(png(40, 20))
+        self.write(os.path.join("content", "blog", "post0.md"), "# Post 0\n\n![Tom](/tom.png)")
+        self.run_quietly(merge_shards, self.build_shards(2))
+        with open(os.path.join(".build", "images.json")) as f:
+            self.assertEqual(json.load(f)["images"][os.path.join("static", "tom.png")]["width"], 40)
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            build_main([])
+        self.assertNotIn("Generating page", log.getvalue())
+
+    def test_merge_removes_pages_no_shard_produced(self):
+        self.run_quietly(merge_shards, self.build_shards(2))
+        os.remove(os.path.join("content", "blog", "post3.md"))
+        changes = self.run_quietly(merge_shards, self.build_shards(2))
+        self.assertEqual(changes.to_dict()["deleted"], [os.path.join("blog", "post3.html")])
+        self.assertFalse(os.path.exists(os.path.join("docs", "blog", "post3.html")))
+
+    def test_overlapping_shards_are_not_merged(self):
+        shards = self.build_shards(2)
+        manifest = BuildManifest.load(os.path.join(shards[1], ".build", "manifest.json"))
+        source = next(page for page in BuildManifest.load(os.path.join(shards[0], ".build", "manifest.json")).pages)
+        manifest.record_page(source, "", "")
+        html = os.path.splitext(source)[0] + ".html"
+        shutil.copy(os.path.join(shards[0], "docs", html), os.path.join(shards[1], "docs", html))
+        manifest.save()
+
+        with self.assertRaises(ValueError) as raised:
+            self.run_quietly(merge_shards, shards)
+        self.assertIn(f"{html} is produced by both shard 1/2", str(raised.exception))
+        self.assertIn(f"built {source}, which belongs to shard 1/2", str(raised.exception))
+        self.assertFalse(os.path.exists("docs"))
+
+    def test_incomplete_or_mismatched_shards_are_not_merged(self):
+        shards = self.build_shards(3)
+        with self.assertRaisesRegex(ValueError, "Missing shards 2/3"):
+            self.run_quietly(merge_shards, [shards[0], shards[2]])
+        with self.assertRaisesRegex(ValueError, "is the same shard as"):
+            self.run_quietly(merge_shards, shards + [shards[0]])
+
+        self.run_quietly(build_main, ["/site/", "--shard", "2/3"])
+        with self.assertRaisesRegex(ValueError, "built with another template, basepath"):
+            self.run_quietly(merge_shards, shards)
+        self.assertFalse(os.path.exists("docs"))
+
+    def test_shard_without_search_needs_no_search(self):
+        shards = self.build_shards(2, "--no-search")
+        with self.assertRaisesRegex(ValueError, "merge with --no-search"):
+            self.run_quietly(merge_shards, shards)
+        self.run_quietly(merge_shards, shards, search=False)
+        self.assertFalse(os.path.exists(os.path.join("docs", "search")))
+
+if __name__ == "__main__":
+    unittest.main()
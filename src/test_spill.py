@@ -0,0 +1,91 @@
+import unittest
+import os
+import random
+import tempfile
+from spill import KeyLog, PageTable, load_table, sorted_spill, walk_key
+
+
+class TestSpill(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "table.json")
+        self.keys = [os.path.join(*parts) for parts in [
+            ("b.md",), ("z.md",), ("a", "x.md"), ("a", "b", "y.md"), ("a.md", "c.md"), ("c", "d.md")]]
+
+    def save_table(self):
+        table = PageTable(directory=self.tmp.name)
+        for key in self.keys:
+            table[key] = {"n": len(key)}
+        table.save(self.path, {"version": 1})
+        header, table = load_table(self.path)
+        self.assertEqual(header, {"version": 1})
+        return table
+
+    def test_walk_key_follows_a_sorted_walk(self):
+        for key in self.keys:
+            os.makedirs(os.path.join(self.tmp.name, "content", os.path.dirname(key)), exist_ok=True)
+            open(os.path.join(self.tmp.name, "content", key), "w").close()
+        walked = []
+        for root, dirs, files in os.walk(os.path.join(self.tmp.name, "content")):
+            dirs.sort()
+            walked += [os.path.relpath(os.path.join(root, file), os.path.join(self.tmp.name, "content"))
+                       for file in sorted(files)]
+        self.assertEqual(sorted(self.keys, key=walk_key), walked)
+
+    def test_build_reads_and_changes_the_table_on_disk(self):
+        table = self.save_table()
+        walked = sorted(self.keys, key=walk_key)
+        expected = {key: {"n": len(key)} for key in walked}
+        self.assertIsNone(table.get(os.path.join("a", "missing.md")))
+        # The walk looks pages up ahead of the results, which change them
+        for number, key in enumerate(walked):
+            self.assertEqual(table.get(key), {"n": len(key)})
+            if number % 2:
+                previous = walked[number - 1]
+                self.assertIn(previous, table)
+                table[previous] = expected[previous] = {"n": 0}
+        table.discard(walked[-1])
+        del expected[walked[-1]]
+        self.assertIsNone(table._dict)
+        self.assertEqual(dict(table.items()), expected)
+        self.assertEqual(list(table), [key for key in walked if key in expected])
+
+        table.save(self.path, {"version": 1})
+        self.assertEqual(dict(load_table(self.path)[1].items()), expected)
+        self.assertEqual(os.listdir(self.tmp.name), ["table.json"])
+
+    def test_lookups_out_of_order_load_the_table(self):
+        table = self.save_table()
+        table[self.keys[-1]] = {"n": 0}
+        self.assertEqual(table.get(self.keys[0]), {"n": len(self.keys[0])})
+        self.assertIsNotNone(table._dict)
+        self.assertEqual(table[self.keys[-1]], {"n": 0})
+
+    def test_prune_keeps_the_listed_keys(self):
+        table = self.save_table()
+        kept = sorted(self.keys[::2], key=walk_key)
+        removed = []
+        table.prune(kept, lambda key, value: removed.append(key))
+        self.assertEqual(sorted(removed), sorted(self.keys[1::2]))
+        self.assertEqual(list(table), kept)
+
+    def test_sorted_spill_sorts_in_runs(self):
+        items = [[random.randrange(1000), str(n)] for n in range(5000)]
+        self.assertEqual(list(sorted_spill(items, directory=self.tmp.name, run_items=64)), sorted(items))
+        self.assertEqual(list(sorted_spill(items, key=lambda item: item[1], run_items=10000)),
+                         sorted(items, key=lambda item: item[1]))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_key_log_reads_back_again(self):
+        log = KeyLog()
+        self.addCleanup(log.close)
+        log.append("a")
+        log.append("b")
+        self.assertEqual(list(log), ["a", "b"])
+        log.append("c")
+        self.assertEqual(list(log), ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+import contextlib
+import io
+from static_sync import sync_static
+
+
+class TestSyncStatic(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.static = os.path.join(self.tmp.name, "static")
+        self.docs = os.path.join(self.tmp.name, "docs")
+        os.makedirs(os.path.join(self.static, "images"))
+        self.write(os.path.join(self.static, "index.css"), "body {}")
+        self.write(os.path.join(self.static, "images", "tom.png"), "png")
+        self.write(os.path.join(self.static, "images", "tom.png:Zone.Identifier"), "zone")
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def sync(self, previous=(), use_hash=False):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync_static(self.static, self.docs, previous, use_hash)
+
+    def test_first_sync_copies_everything_but_zone_identifiers(self):
+        result = self.sync()
+        self.assertEqual(result["copied"], ["images/tom.png", "index.css"])
+        self.assertFalse(os.path.exists(os.path.join(self.docs, "images", "tom.png:Zone.Identifier")))
+
+    def test_unchanged_files_are_not_copied(self):
+        files = self.sync()["files"]
+        dest = os.path.join(self.docs, "index.css")
+        before = os.stat(dest).st_ino
+        self.assertEqual(self.sync(files)["copied"], [])
+        self.assertEqual(os.stat(dest).st_ino, before)
+
+    def test_changed_file_is_copied(self):
+        files = self.sync()["files"]
+        path = os.path.join(self.static, "index.css")
+        self.write(path, "body { color: red }")
+        self.assertEqual(self.sync(files)["copied"], ["index.css"])
+
+    def test_touched_file_is_skipped_with_hash(self):
+        files = self.sync()["files"]
+        path = os.path.join(self.static, "index.css")
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+        self.assertEqual(self.sync(files, use_hash=True)["copied"], [])
+        # The copy takes the source's mtime, so it is current without hashing too
+        self.assertEqual(os.stat(os.path.join(self.docs, "index.css")).st_mtime_ns, 1_000_000_000)
+        self.assertEqual(self.sync(files)["copied"], [])
+
+    def test_touched_file_is_copied_without_hash(self):
+        files = self.sync()["files"]
+        path = os.path.join(self.static, "index.css")
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+        self.assertEqual(self.sync(files)["copied"], ["index.css"])
+
+    def test_deleted_file_is_removed_but_pages_are_kept(self):
+        files = self.sync()["files"]
+        self.write(os.path.join(self.docs, "index.html"), "<html></html>")
+        os.remove(os.path.join(self.static, "images", "tom.png"))
+        result = self.sync(files)
+        self.assertEqual(result["removed"], ["images/tom.png"])
+        self.assertFalse(os.path.exists(os.path.join(self.docs, "images")))
+        self.assertTrue(os.path.exists(os.path.join(self.docs, "index.html")))
+
+if __name__ == "__main__":
+    unittest.main()
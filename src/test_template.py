@@ -0,0 +1,67 @@
+import unittest
+import io
+import os
+import tempfile
+from template import Template, load_template, clear_template_cache
+from htmlnode import LeafNode, ParentNode
+
+class TestTemplate(unittest.TestCase):
+    def test_render_fills_slots(self):
+        template = Template("<title>{{ Title }}</title><body>{{ Content }}</body>")
+        self.assertEqual(
+            template.render(Title="Hi", Content="<p>text</p>"),
+            "<title>Hi</title><body><p>text</p></body>",
+        )
+
+    def test_slot_names(self):
+        template = Template("{{ Title }} and {{Content}} and {{ Title }}")
+        self.assertEqual(template.slot_names, ["Title", "Content", "Title"])
+        self.assertEqual(template.render(Title="a", Content="b"), "a and b and a")
+
+    def test_unfilled_slot_is_left_alone(self):
+        template = Template("<p>{{ Date }}</p>{{ Content }}")
+        self.assertEqual(template.render(Content="x"), "<p>{{ Date }}</p>x")
+
+    def test_values_are_not_rescanned(self):
+        template = Template("{{ Title }}|{{ Content }}")
+        self.assertEqual(template.render(Title="{{ Content }}", Content="c"), "{{ Content }}|c")
+
+    def test_no_placeholders(self):
+        self.assertEqual(Template("<html></html>").render(Title="x"), "<html></html>")
+
+    def test_render_to_streams_nodes(self):
+        template = Template("<title>{{ Title }}</title><body>{{ Content }}</body>{{ Date }}")
+        buffer = io.StringIO()
+        template.render_to(buffer, Title="Hi", Content=ParentNode("p", [LeafNode("b", "x")]))
+        self.assertEqual(buffer.getvalue(), "<title>Hi</title><body><p><b>x</b></p></body>{{ Date }}")
+
+class TestLoadTemplate(unittest.TestCase):
+    def setUp(self):
+        clear_template_cache()
+        fd, self.path = tempfile.mkstemp(suffix=".html")
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def write(self, text, mtime_ns):
+        with open(self.path, "w") as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_template_is_loaded_once(self):
+        self.write("<h1>{{ Title }}</h1>", 1_000_000_000)
+        self.assertIs(load_template(self.path), load_template(self.path))
+
+    def test_changed_template_is_reloaded(self):
+        self.write("<h1>{{ Title }}</h1>", 1_000_000_000)
+        first = load_template(self.path)
+        self.write("<h2>{{ Title }}</h2>", 2_000_000_000)
+        second = load_template(self.path)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.render(Title="x"), "<h2>x</h2>")
+
+    def test_missing_template(self):
+        with self.assertRaises(FileNotFoundError):
+            load_template(self.path + ".missing")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import pickle
 from textnode import TextNode, TextType
 from delimiter import split_nodes_delimiter
 
@@ -87,5 +88,25 @@ class TestSplitNodesDelimiter(unittest.TestCase):
             TextNode("This is a code node", TextType.CODE)
         ])
 
+class TestTextNode(unittest.TestCase):
+    def test_hashable(self):
+        a = TextNode("link", TextType.LINK, "url")
+        b = TextNode("link", TextType.LINK, "url")
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(len({a, b, TextNode("link", TextType.TEXT)}), 2)
+
+    def test_immutable(self):
+        node = TextNode("text", TextType.TEXT)
+        with self.assertRaises(AttributeError):
+            node.text = "other"
+        with self.assertRaises(AttributeError):
+            node.extra = 1
+        with self.assertRaises(AttributeError):
+            del node.url
+
+    def test_pickle_round_trip(self):
+        node = TextNode("image", TextType.IMAGE, "/img.png")
+        self.assertEqual(pickle.loads(pickle.dumps(node)), node)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import unittest
+import os
+from urls import BasepathRewriter, PrefixRewriter, ChainRewriter, site_url_rewriter, rewrite_html_urls
+from inline_markdown import markdown_to_html_node
+from test_manifest import BuildTestCase
+
+
+class TestUrlRewriters(unittest.TestCase):
+    def test_basepath_only_rewrites_root_relative_urls(self):
+        rewriter = BasepathRewriter("/site/")
+        self.assertEqual(rewriter.rewrite("/blog/tom", "a", "href"), "/site/blog/tom")
+        self.assertEqual(rewriter.rewrite("https://example.com/", "a", "href"), "https://example.com/")
+        self.assertEqual(rewriter.rewrite("//cdn.example.com/x.png", "img", "src"), "//cdn.example.com/x.png")
+        self.assertEqual(rewriter.rewrite("tom.png", "img", "src"), "tom.png")
+
+    def test_prefix_runs_before_basepath(self):
+        rewriter = site_url_rewriter("/site/", [PrefixRewriter("https://cdn.example.com/")])
+        self.assertIsInstance(rewriter, ChainRewriter)
+        self.assertEqual(rewriter.rewrite("/images/tom.png", "img", "src"), "https://cdn.example.com/images/tom.png")
+        self.assertEqual(rewriter.rewrite("/blog/tom", "a", "href"), "/site/blog/tom")
+
+    def test_no_rewriter_for_root_basepath(self):
+        self.assertIsNone(site_url_rewriter("/"))
+        self.assertNotEqual(site_url_rewriter("/a/").key, site_url_rewriter("/b/").key)
+
+    def test_rewrite_html_urls_only_touches_attributes(self):
+        html = '<link href="/index.css" rel="stylesheet" />\n<p>href="/x"</p><img alt="" src=\'/a.png\'>'
+        self.assertEqual(
+            rewrite_html_urls(html, BasepathRewriter("/site/")),
+            '<link href="/site/index.css" rel="stylesheet" />\n<p>href="/x"</p><img alt="" src=\'/site/a.png\'>',
+        )
+
+    def test_markdown_links_and_images(self):
+        markdown = '[Tom](/blog/tom) ![Tom](/images/tom.png)\n\n```\nhref="/not/a/link"\n```'
+        html = markdown_to_html_node(markdown, BasepathRewriter("/site/")).to_html()
+        self.assertIn('<a href="/site/blog/tom">Tom</a>', html)
+        self.assertIn('<img src="/site/images/tom.png" alt="Tom" />', html)
+        self.assertIn('href="/not/a/link"', html)
+
+
+class TestRewrittenBuild(BuildTestCase):
+    def test_template_and_content_urls_use_basepath(self):
+        self.write(self.template, '<link href="/index.css" />{{ Content }}')
+        self.write(os.path.join(self.content, "index.md"), "# Home\n\nSee `src=\"/x\"` and [post](/blog/post)")
+        self.build("/site/", rewriters=[PrefixRewriter("https://cdn.example.com")])
+        with open(os.path.join(self.docs, "index.html")) as f:
+            self.assertEqual(
+                f.read(),
+                '<link href="/site/index.css" /><div><h1>Home</h1><p>See <code>src="/x"</code> and '
+                '<a href="/site/blog/post">post</a></p></div>',
+            )
+
+    def test_changing_rewriters_rebuilds_everything(self):
+        self.build()
+        log = self.build(rewriters=[PrefixRewriter("https://cdn.example.com")])
+        self.assertEqual(log.count("Generating page"), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+import contextlib
+import io
+from watch import InotifyWatcher, PollingWatcher, create_watcher
+
+
+class WatcherTests:
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.content = os.path.join(self.tmp.name, "content")
+        self.template = os.path.join(self.tmp.name, "template.html")
+        os.makedirs(self.content)
+        self.write(os.path.join(self.content, "index.md"), "# Home")
+        self.write(self.template, "{{ Content }}")
+        self.write(os.path.join(self.tmp.name, "unrelated.txt"), "x")
+        self.watcher = self.create_watcher([self.content, self.template])
+        self.addCleanup(self.watcher.close)
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def read_all(self):
+        changed = set()
+        while True:
+            more = self.watcher.read(0.3)
+            if not more:
+                return changed
+            changed |= more
+
+    def test_reports_modified_file(self):
+        path = os.path.join(self.content, "index.md")
+        self.write(path, "# Changed")
+        self.assertIn(path, self.read_all())
+
+    def test_reports_template_but_not_its_neighbours(self):
+        self.write(os.path.join(self.tmp.name, "unrelated.txt"), "changed")
+        self.write(self.template, "<main>{{ Content }}</main>")
+        changed = self.read_all()
+        self.assertIn(self.template, changed)
+        self.assertNotIn(os.path.join(self.tmp.name, "unrelated.txt"), changed)
+
+    def test_reports_files_in_new_directories(self):
+        os.makedirs(os.path.join(self.content, "blog"))
+        path = os.path.join(self.content, "blog", "post.md")
+        self.write(path, "# Post")
+        self.assertIn(path, self.read_all())
+
+    def test_reports_files_in_renamed_directories_under_their_new_path(self):
+        os.makedirs(os.path.join(self.content, "a", "sub"))
+        self.write(os.path.join(self.content, "a", "sub", "x.md"), "# X")
+        self.read_all()
+        os.rename(os.path.join(self.content, "a"), os.path.join(self.content, "b"))
+        self.read_all()
+        path = os.path.join(self.content, "b", "sub", "x.md")
+        self.write(path, "# Changed")
+        changed = self.read_all()
+        self.assertIn(path, changed)
+        self.assertFalse(any(os.sep + "a" + os.sep in changed_path for changed_path in changed))
+
+    def test_reports_deleted_file(self):
+        path = os.path.join(self.content, "index.md")
+        os.remove(path)
+        self.assertIn(path, self.read_all())
+
+
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    def create_watcher(self, paths):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            self.skipTest(f"inotify unavailable: {e}")
+
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+    def create_watcher(self, paths):
+        return PollingWatcher(paths, interval=0.01)
+
+    def test_create_watcher_can_force_polling(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsInstance(create_watcher([self.content], polling=True), PollingWatcher)
+
+if __name__ == "__main__":
+    unittest.main()
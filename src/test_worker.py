@@ -0,0 +1,72 @@
+import unittest
+import io
+import json
+from worker import RenderWorker, REWRITER_CACHE_SIZE
+
+
+class ChunkedReader:
+    def __init__(self, data, size):
+        self.chunks = [data[i:i + size] for i in range(0, len(data), size)]
+
+    def read1(self, size=-1):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+class FlushCountingWriter(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestRenderWorker(unittest.TestCase):
+    def serve(self, lines, chunk_size=None):
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        reader = io.BytesIO(data) if chunk_size is None else ChunkedReader(data, chunk_size)
+        writer = FlushCountingWriter()
+        RenderWorker().serve(reader, writer)
+        return [json.loads(line) for line in writer.getvalue().splitlines()], writer.flushes
+
+    def test_renders_html_and_title(self):
+        request = {"id": "a", "markdown": "# Hi\n\n[Tom](/tom) ![Tom](/tom.png)", "basepath": "/site/",
+                   "image_cdn": "https://cdn.example.com"}
+        responses, _ = self.serve([json.dumps(request)])
+        self.assertEqual(responses, [{
+            "id": "a",
+            "html": '<div><h1>Hi</h1><p><a href="/site/tom">Tom</a> '
+                    '<img src="https://cdn.example.com/tom.png" alt="Tom" /></p></div>',
+            "title": "Hi",
+        }])
+
+    def test_errors_are_reported_per_request(self):
+        lines = [json.dumps({"id": 1, "markdown": ""}), "{oops", json.dumps({"id": 3}),
+                 json.dumps({"id": 4, "markdown": "ok"})]
+        responses, _ = self.serve(lines)
+        self.assertEqual([response["id"] for response in responses], [1, None, 3, 4])
+        self.assertEqual([("error" in response) for response in responses], [True, True, True, False])
+        self.assertIsNone(responses[3]["title"])
+
+    def test_requests_split_across_reads(self):
+        lines = [json.dumps({"id": i, "markdown": f"Snippet {i} with ünïcode"}) for i in range(50)]
+        responses, _ = self.serve(lines, chunk_size=7)
+        self.assertEqual([response["id"] for response in responses], list(range(50)))
+        self.assertEqual(responses[10]["html"], "<div><p>Snippet 10 with ünïcode</p></div>")
+
+    def test_buffered_requests_are_answered_in_one_batch(self):
+        lines = [json.dumps({"id": i, "markdown": "text"}) for i in range(100)]
+        responses, flushes = self.serve(lines)
+        self.assertEqual(len(responses), 100)
+        self.assertEqual(flushes, 1)
+
+    def test_rewriters_are_reused_and_bounded(self):
+        worker = RenderWorker()
+        self.assertIs(worker.url_rewriter("/a/", None), worker.url_rewriter("/a/", None))
+        for i in range(REWRITER_CACHE_SIZE * 2):
+            request = {"id": i, "markdown": "[Tom](/tom)", "basepath": f"/site{i}/"}
+            self.assertEqual(worker.render(request)["html"], f'<div><p><a href="/site{i}/tom">Tom</a></p></div>')
+        self.assertEqual(worker.url_rewriter.cache_info().currsize, REWRITER_CACHE_SIZE)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,10 +9,22 @@ class TextType(Enum):
     IMAGE = "image"
 
 class TextNode():
+    """
+    An immutable, hashable span of inline text. Instances can be shared freely,
+    deduplicated and used as cache keys.
+    """
+    __slots__ = ("text", "text_type", "url")
+
     def __init__(self, text, text_type, url=None):
-        self.text = text
-        self.text_type = text_type
-        self.url = url
+        object.__setattr__(self, "text", text)
+        object.__setattr__(self, "text_type", text_type)
+        object.__setattr__(self, "url", url)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"TextNode is immutable, cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"TextNode is immutable, cannot delete {name}")
 
     def __eq__(self, other):
         if not isinstance(other, TextNode):
@@ -21,6 +33,12 @@ class TextNode():
                 self.text_type == other.text_type and
                 self.url == other.url)
 
+    def __hash__(self):
+        return hash((self.text, self.text_type, self.url))
+
+    def __reduce__(self):
+        return (TextNode, (self.text, self.text_type, self.url))
+
     def __repr__(self):
         return f"TextNode({self.text}, {self.text_type.value}, {self.url})"
 
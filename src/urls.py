@@ -0,0 +1,139 @@
+import re
+
+TAG_REGEX = re.compile(r"<([a-zA-Z][\w-]*)(\s[^<>]*)>")
+URL_ATTRIBUTE_REGEX = re.compile(r"(\s(href|src)\s*=\s*)([\"'])(.*?)\3")
+
+
+class UrlRewriter:
+    """
+    Rewrites the URL in a href or src attribute as a page is rendered. Subclasses
+    override rewrite(); key describes the rewriter's settings, so builds and caches
+    can tell when a different rewriter would produce different HTML. Subclasses can
+    also add attributes to the images of markdown pages with image_attributes().
+    """
+
+    key = "identity"
+
+    def rewrite(self, url, tag, attribute):
+        """
+        Returns the URL to write for an attribute.
+
+        Args:
+            url: The URL as written in the markdown or template.
+            tag: The element the attribute belongs to, such as "a" or "img".
+            attribute: "href" or "src".
+        """
+        return url
+
+    def image_attributes(self, url):
+        """
+        Returns a dict of extra attributes for an img element of a markdown page, or
+        None to add none.
+
+        Args:
+            url: The src as written in the markdown, before any rewriting.
+        """
+        return None
+
+
+def is_root_relative(url):
+    """
+    Returns True for URLs such as "/blog/tom" that are relative to the site root,
+    but not for protocol-relative URLs such as "//cdn.example.com/x.png".
+    """
+    return url.startswith("/") and not url.startswith("//")
+
+
+class BasepathRewriter(UrlRewriter):
+    """
+    Serves the site from basepath by prefixing every root-relative URL with it,
+    so "/blog/tom" becomes "/StaticSite/blog/tom" for a basepath of "/StaticSite/".
+    """
+
+    def __init__(self, basepath):
+        self.basepath = basepath
+        self.key = f"basepath={basepath}"
+
+    def rewrite(self, url, tag, attribute):
+        if is_root_relative(url):
+            return self.basepath + url[1:]
+        return url
+
+
+class PrefixRewriter(UrlRewriter):
+    """
+    Points root-relative URLs of the given tags at another origin, such as a CDN:
+    with a prefix of "https://cdn.example.com" and the default tags, the image
+    "/images/tom.png" is loaded from "https://cdn.example.com/images/tom.png".
+    """
+
+    def __init__(self, prefix, tags=("img",)):
+        self.prefix = prefix.rstrip("/")
+        self.tags = tuple(tags)
+        self.key = f"prefix={self.prefix}:{','.join(self.tags)}"
+
+    def rewrite(self, url, tag, attribute):
+        if tag in self.tags and is_root_relative(url):
+            return self.prefix + url
+        return url
+
+
+class ChainRewriter(UrlRewriter):
+    """
+    Applies several rewriters in order, each to the URL the previous one returned.
+    """
+
+    def __init__(self, rewriters):
+        self.rewriters = list(rewriters)
+        self.key = ";".join(rewriter.key for rewriter in self.rewriters)
+
+    def rewrite(self, url, tag, attribute):
+        for rewriter in self.rewriters:
+            url = rewriter.rewrite(url, tag, attribute)
+        return url
+
+    def image_attributes(self, url):
+        attributes = None
+        for rewriter in self.rewriters:
+            extra = rewriter.image_attributes(url)
+            if extra:
+                attributes = dict(extra) if attributes is None else {**attributes, **extra}
+        return attributes
+
+
+def site_url_rewriter(basepath, rewriters=()):
+    """
+    Returns the rewriter for a build: the given rewriters followed by the basepath.
+    Rewriters such as a CDN prefix run first, so URLs they send to another origin
+    are not also given the basepath. Returns None when no URL needs rewriting.
+
+    Args:
+        basepath: The base path for the site (e.g., "/", "/blog/").
+        rewriters: Additional UrlRewriters to apply before the basepath.
+    """
+    rewriters = list(rewriters)
+    if basepath != "/":
+        rewriters.append(BasepathRewriter(basepath))
+    if not rewriters:
+        return None
+    if len(rewriters) == 1:
+        return rewriters[0]
+    return ChainRewriter(rewriters)
+
+
+def rewrite_html_urls(html, rewriter):
+    """
+    Rewrites the href and src attributes of every tag in an HTML string, such as a
+    template. Text outside tags is left alone.
+    """
+    def rewrite_tag(tag_match):
+        tag = tag_match.group(1).lower()
+
+        def rewrite_attribute(match):
+            url = rewriter.rewrite(match.group(4), tag, match.group(2).lower())
+            return f"{match.group(1)}{match.group(3)}{url}{match.group(3)}"
+
+        attributes = URL_ATTRIBUTE_REGEX.sub(rewrite_attribute, tag_match.group(2))
+        return f"<{tag_match.group(1)}{attributes}>"
+
+    return TAG_REGEX.sub(rewrite_tag, html)
@@ -0,0 +1,223 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    Watches directory trees and single files with Linux inotify, through libc via
+    ctypes. Files are watched through their parent directory, so editors that save
+    by renaming a new file over the old one are still noticed.
+    """
+
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        # Directories watched only for some of their files: wd -> set of names
+        self._file_filters = {}
+        for path in paths:
+            if os.path.isdir(path):
+                self._add_tree(path)
+        for path in paths:
+            if not os.path.isdir(path):
+                wd = self._add_dir(os.path.dirname(path) or ".")
+                if wd in self._file_filters:
+                    self._file_filters.setdefault(wd, set()).add(os.path.basename(path))
+
+    def _add_dir(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        if wd in self._dirs:
+            return wd
+        self._dirs[wd] = os.path.normpath(directory)
+        self._file_filters[wd] = set()
+        return wd
+
+    def _remove_tree(self, directory):
+        """
+        Stops watching directory and every watched directory below it, such as
+        after it was moved. Watches follow the directory, not its path, so they
+        would otherwise report its files under the old path.
+        """
+        prefix = directory + os.sep
+        for wd, path in list(self._dirs.items()):
+            if path == directory or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._dirs[wd]
+                self._file_filters.pop(wd, None)
+
+    def _add_tree(self, directory):
+        found = []
+        for root, _, files in os.walk(directory):
+            wd = self._add_dir(root)
+            self._file_filters.pop(wd, None)
+            found.extend(os.path.join(root, name) for name in files)
+        return found
+
+    def read(self, timeout):
+        """
+        Waits up to timeout seconds and returns the set of paths that changed.
+        """
+        changed = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so report every watched directory as changed
+                changed.update(self._dirs.values())
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._dirs[wd]
+                self._file_filters.pop(wd, None)
+                continue
+            names = self._file_filters.get(wd)
+            if names is not None and name not in names:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+                # Watched again under its new path by the IN_MOVED_TO that follows,
+                # if it was moved within the watched trees
+                self._remove_tree(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may have been written before the new directory was watched
+                changed.update(self._add_tree(path))
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Fallback watcher that compares the size and mtime of every watched file on
+    each poll. Used where inotify is not available.
+    """
+
+    def __init__(self, paths, interval=0.25):
+        self._paths = paths
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for path in self._paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    for name in files:
+                        self._stat_into(snapshot, os.path.join(root, name))
+            else:
+                self._stat_into(snapshot, os.path.normpath(path))
+        return snapshot
+
+    def _stat_into(self, snapshot, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def read(self, timeout):
+        """
+        Polls until something changes or timeout seconds pass, and returns the set
+        of paths that changed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self._interval, remaining))
+
+    def close(self):
+        pass
+
+
+def create_watcher(paths, polling=False):
+    """
+    Returns an InotifyWatcher for paths, or a PollingWatcher if polling is requested
+    or inotify is unavailable on this platform.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(paths)
+
+
+def watch(paths, on_change, debounce=0.05, polling=False):
+    """
+    Watches paths and calls on_change with the set of changed paths after each burst
+    of changes. A burst ends once no new change has arrived for debounce seconds.
+    Runs until interrupted with Ctrl-C.
+
+    Args:
+        paths: Directories (watched recursively) and files to watch.
+        on_change: Called with a set of changed paths.
+        debounce: Quiet period in seconds that ends a burst of changes.
+        polling: Poll instead of using inotify.
+    """
+    watcher = create_watcher(paths, polling)
+    print(f"Watching {', '.join(paths)} for changes (Ctrl-C to stop)")
+    try:
+        while True:
+            changed = watcher.read(3600)
+            if not changed:
+                continue
+            while True:
+                more = watcher.read(debounce)
+                if not more:
+                    break
+                changed |= more
+            on_change(changed)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
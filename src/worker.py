@@ -0,0 +1,127 @@
+import argparse
+import functools
+import json
+import sys
+from inline_markdown import markdown_to_html_node, extract_title, enable_inline_cache, inline_cache_info
+from urls import PrefixRewriter, site_url_rewriter
+
+CHUNK_SIZE = 1024 * 1024
+# Sets of URL options whose rewriters are kept; requests with others build their own
+REWRITER_CACHE_SIZE = 32
+
+
+class RenderWorker:
+    """
+    Renders markdown snippets for another service over a newline-delimited JSON
+    protocol, so one long-running process can serve many requests without paying
+    for interpreter start-up each time.
+
+    Each request is a JSON object on its own line:
+
+        {"id": 1, "markdown": "# Hi\\n\\nSome **text**", "basepath": "/", "image_cdn": null}
+
+    Only "markdown" is required. Each response echoes the id and holds either the
+    rendered HTML and the title (null if the snippet has no h1) or an error:
+
+        {"id": 1, "html": "<div>...</div>", "title": "Hi"}
+        {"id": 2, "error": "A ParentNode must have children."}
+
+    Responses are written in request order. Every request that has arrived when the
+    worker reads its input is handled as one batch and answered with a single write
+    and flush. URL rewriters are built once per set of options and reused, up to
+    REWRITER_CACHE_SIZE of them, least recently used first out.
+    """
+
+    def __init__(self):
+        self.url_rewriter = functools.lru_cache(maxsize=REWRITER_CACHE_SIZE)(self._build_url_rewriter)
+        self.rendered = 0
+        self.failed = 0
+
+    def _build_url_rewriter(self, basepath, image_cdn):
+        extra = [PrefixRewriter(image_cdn)] if image_cdn else []
+        return site_url_rewriter(basepath, extra)
+
+    def render(self, request):
+        """
+        Returns the response dict for a decoded request.
+        """
+        if not isinstance(request, dict) or not isinstance(request.get("markdown"), str):
+            raise ValueError('A request must be an object with a "markdown" string')
+        markdown = request["markdown"]
+        rewriter = self.url_rewriter(request.get("basepath", "/"), request.get("image_cdn"))
+        html = markdown_to_html_node(markdown, rewriter).to_html()
+        try:
+            title = extract_title(markdown)
+        except ValueError:
+            title = None
+        return {"id": request.get("id"), "html": html, "title": title}
+
+    def handle_line(self, line):
+        """
+        Returns the encoded response line for one encoded request line.
+        """
+        request_id = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                request_id = request.get("id")
+            response = self.render(request)
+            self.rendered += 1
+        except Exception as e:
+            response = {"id": request_id, "error": str(e)}
+            self.failed += 1
+        return json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    def handle_batch(self, lines):
+        """
+        Returns the encoded responses for a list of encoded request lines, skipping
+        blank lines.
+        """
+        return b"".join(self.handle_line(line) for line in lines if line.strip())
+
+    def serve(self, reader, writer):
+        """
+        Answers requests from a binary reader until it reaches end of file.
+
+        Args:
+            reader: Binary stream with a read1() method, such as sys.stdin.buffer.
+            writer: Binary stream the responses are written and flushed to.
+        """
+        pending = b""
+        while True:
+            chunk = reader.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b"\n")
+            # The last piece is an incomplete line, or empty if the chunk ended with a newline
+            pending = lines.pop()
+            if lines:
+                writer.write(self.handle_batch(lines))
+                writer.flush()
+        if pending.strip():
+            writer.write(self.handle_batch([pending]))
+            writer.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render markdown snippets read as NDJSON from stdin, writing NDJSON responses to stdout.")
+    parser.add_argument("--inline-cache", type=int, default=0, metavar="N",
+                        help="cache the parsed inline markdown of up to N repeated fragments (0 disables)")
+    args = parser.parse_args(argv)
+    if args.inline_cache:
+        enable_inline_cache(args.inline_cache)
+
+    worker = RenderWorker()
+    try:
+        worker.serve(sys.stdin.buffer, sys.stdout.buffer)
+    except BrokenPipeError:
+        pass
+    print(f"Rendered {worker.rendered} snippets, {worker.failed} failed", file=sys.stderr)
+    inline_cache = inline_cache_info()
+    if inline_cache is not None:
+        print(f"Inline cache: {inline_cache.hits} hits, {inline_cache.misses} misses", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()